@@ -0,0 +1,64 @@
+"""
+Compares the compressors for rendered planes.
+
+Each frame has three 16-bit planes, like a YUV444P16 frame. The upper byte
+of each sample follows a smooth gradient and the lower byte is noise, which
+is closer to real footage than either pure gradients or pure noise.
+Reports the ratio, and the time per frame to compress and to decompress
+into a preallocated buffer.
+
+Usage: python benchmarks/bench_compression.py [width height [iterations]]
+"""
+import os
+import sys
+import time
+
+from yuuno2.networking.compression import COMPRESSORS, compress_blob
+
+# Keep 6 bits of noise in the lower byte.
+NOISE_MASK = bytes(b & 0x3f for b in range(256))
+
+
+def make_plane(width: int, height: int, seed: int) -> bytes:
+    plane = bytearray(width * height * 2)
+    row = bytes((x * 256 // width + seed) & 0xff for x in range(width))
+    plane[1::2] = row * height
+    plane[0::2] = os.urandom(width * height).translate(NOISE_MASK)
+    return bytes(plane)
+
+
+def measure(compressor, planes, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        compressed = [compress_blob(compressor, plane, 0) or plane for plane in planes]
+    compress = (time.perf_counter() - start) / iterations
+
+    out = [memoryview(bytearray(len(plane))) for plane in planes]
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for data, buffer in zip(compressed, out):
+            compressor.decompress_into(data, buffer)
+    decompress = (time.perf_counter() - start) / iterations
+
+    return compress, decompress, sum(len(c) for c in compressed)
+
+
+def main(width: int, height: int, iterations: int):
+    planes = [make_plane(width, height, seed) for seed in range(3)]
+    raw = sum(len(plane) for plane in planes)
+    print(f"{width}x{height} 16-bit, 3 planes, {raw / 1024 / 1024:.1f} MiB per frame")
+
+    for name, compressor in COMPRESSORS.items():
+        compress, decompress, size = measure(compressor, planes, iterations)
+        print(
+            f"{name:<5} ratio {raw / size:5.2f}  "
+            f"compress {compress * 1000:8.1f} ms  "
+            f"decompress {decompress * 1000:7.1f} ms  "
+            f"({raw / compress / 1024 / 1024:7.1f} / {raw / decompress / 1024 / 1024:7.1f} MiB/s)"
+        )
+
+
+if __name__ == "__main__":
+    width, height = (int(sys.argv[1]), int(sys.argv[2])) if len(sys.argv) > 2 else (3840, 2160)
+    iterations = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    main(width, height, iterations)
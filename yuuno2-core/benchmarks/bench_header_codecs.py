@@ -0,0 +1,82 @@
+"""
+Compares the header codecs for small, frequent RPC messages.
+
+Measures the codec on its own and the whole message as it is written to
+and parsed from the wire, including the multiplexer envelope.
+
+Usage: python benchmarks/bench_header_codecs.py [iterations]
+"""
+import sys
+import time
+
+from yuuno2.format import RGB24
+from yuuno2.networking.base import Message
+from yuuno2.networking.codecs import JSON_CODEC, BinaryCodec, _msgpack
+from yuuno2.networking.serializer import ByteOutputStream, bytes_protocol
+
+
+MESSAGES = {
+    "length":   {"id": 17, "type": "request", "method": "length", "params": {}},
+    "size":     {"id": 18, "type": "response", "result": [1920, 1080]},
+    "format":   {"id": 19, "type": "response", "result": RGB24.to_json()},
+    "render":   {"id": 20, "type": "request", "method": "render",
+                 "params": {"frame": 1234, "format": RGB24.to_json(), "planes": [0, 1, 2]}},
+}
+
+
+def envelope(values):
+    return Message({"target": "clip", "type": "message", "payload": values}, [])
+
+
+def measure_codec(codec, values, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        data = codec.encode(values)
+    encode = (time.perf_counter() - start) / iterations
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        codec.decode(data)
+    decode = (time.perf_counter() - start) / iterations
+
+    return encode, decode
+
+
+def measure(codec, message, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        data = ByteOutputStream.write_message(message, codec)
+    encode = (time.perf_counter() - start) / iterations
+
+    parser = bytes_protocol()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for _ in parser.feed(data):
+            pass
+    decode = (time.perf_counter() - start) / iterations
+
+    return encode, decode, len(data)
+
+
+def main(iterations: int):
+    print("Times are encode/decode.")
+    codecs = [("json", JSON_CODEC), ("binary", BinaryCodec(accelerated=False))]
+    if _msgpack is not None:
+        codecs.append(("msgpack", BinaryCodec()))
+
+    for name, values in MESSAGES.items():
+        message = envelope(values)
+        for codec_name, codec in codecs:
+            c_encode, c_decode = measure_codec(codec, message.values, iterations)
+            encode, decode, size = measure(codec, message, iterations)
+            print(
+                f"{name:<8} {codec_name:<8} "
+                f"codec {c_encode*1e6:6.2f}/{c_decode*1e6:6.2f} us  "
+                f"message {encode*1e6:6.2f}/{decode*1e6:6.2f} us  "
+                f"{size:4} bytes"
+            )
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    main(iterations)
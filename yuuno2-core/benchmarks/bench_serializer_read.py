@@ -0,0 +1,55 @@
+"""
+Compares the default and the direct blob receive path of bytes_protocol.
+
+The default path joins the received chunks of every blob into a new bytes
+object. The direct path preallocates one buffer per blob and copies each
+chunk into it once.
+
+Usage: python benchmarks/bench_serializer_read.py [frame-size] [chunk-size] [iterations]
+"""
+import sys
+import time
+import tracemalloc
+
+from yuuno2.networking.base import Message
+from yuuno2.networking.serializer import ByteOutputStream, bytes_protocol
+
+
+def receive(data, chunk_size, direct_blobs):
+    parser = bytes_protocol(direct_blobs=direct_blobs)
+    messages = []
+    # Slice inside the loop so that the chunks count towards the peak
+    # memory, as they would when they come from a transport.
+    for i in range(0, len(data), chunk_size):
+        messages.extend(parser.feed(data[i:i+chunk_size]))
+    return messages
+
+
+def measure(name, data, chunk_size, frame_size, direct_blobs, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        receive(data, chunk_size, direct_blobs)
+    elapsed = (time.perf_counter() - start) / iterations
+
+    tracemalloc.start()
+    messages = receive(data, chunk_size, direct_blobs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(messages) == 1
+
+    print(f"{name:<8} {elapsed*1000:8.3f} ms/frame  {peak:>10} bytes peak  {peak/frame_size:5.2f}x frame size")
+
+
+def main(frame_size: int, chunk_size: int, iterations: int):
+    planes = [bytes(frame_size // 3) for _ in range(3)]
+    data = ByteOutputStream.write_message(Message({"id": 1, "type": "response"}, planes))
+
+    measure("default", data, chunk_size, frame_size, False, iterations)
+    measure("direct", data, chunk_size, frame_size, True, iterations)
+
+
+if __name__ == "__main__":
+    frame_size = int(sys.argv[1]) if len(sys.argv) > 1 else 1920 * 1080 * 3
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 64 * 1024
+    iterations = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    main(frame_size, chunk_size, iterations)
@@ -0,0 +1,44 @@
+"""
+Compares the joined and the vectored write path of ByteOutputStream.
+
+The joined path copies every byte of the message into a new bytes object
+before it reaches the transport. The vectored path hands the original
+buffers over and copies nothing in Python.
+
+Usage: python benchmarks/bench_serializer_write.py [frame-size] [iterations]
+"""
+import sys
+import time
+import tracemalloc
+
+from yuuno2.networking.base import Message
+from yuuno2.networking.serializer import ByteOutputStream
+
+
+def measure(name, func, message, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(message)
+    elapsed = (time.perf_counter() - start) / iterations
+
+    tracemalloc.start()
+    parts = func(message)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    copied = len(parts) if isinstance(parts, bytes) else 0
+    print(f"{name:<10} {elapsed*1000:8.3f} ms/frame  {copied:>10} bytes copied/frame  {peak:>10} bytes peak")
+
+
+def main(frame_size: int, iterations: int):
+    planes = [bytearray(frame_size // 3) for _ in range(3)]
+    message = Message({"id": 1, "type": "response", "result": {"size": [1920, 1080]}}, [memoryview(p) for p in planes])
+
+    measure("joined", ByteOutputStream.write_message, message, iterations)
+    measure("vectored", ByteOutputStream.encode_message, message, iterations)
+
+
+if __name__ == "__main__":
+    frame_size = int(sys.argv[1]) if len(sys.argv) > 1 else 1920 * 1080 * 3
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    main(frame_size, iterations)
@@ -0,0 +1,67 @@
+"""
+Measures sequential playback through VapourSynthFrame.
+
+"sliced" converts a one-frame slice of the clip for every frame, the way
+frames used to be rendered. "clip" renders through VapourSynthClip, which
+converts the whole clip once and requests frame N from the converted node.
+
+Requires VapourSynth.
+
+Usage: python benchmarks/bench_vapoursynth_sequential.py [frames] [width] [height]
+"""
+import sys
+import time
+import asyncio
+
+import vapoursynth as vs
+from vapoursynth import core
+
+from yuuno2.format import RGB24, Size
+from yuuno2.vapoursynth.clip import VapourSynthClip, get_frame_async, extract_plane
+from yuuno2.vapoursynth.script import VapourSynthScript
+
+
+def make_clip(frames: int, width: int, height: int) -> vs.VideoNode:
+    clip = core.std.BlankClip(format=vs.YUV420P8, width=width, height=height, length=frames)
+    # Give every frame some work so the filter graph matters.
+    return core.std.Expr(clip, ["N 255 %", "128", "128"])
+
+
+async def sliced(script, node: vs.VideoNode, buffers) -> None:
+    for frameno in range(len(node)):
+        with script.inside():
+            converted = core.resize.Spline36(node[frameno], format=vs.RGB24, matrix_in_s="709")
+            fut = get_frame_async(converted, 0)
+        frame = await fut
+        for plane, buffer in enumerate(buffers):
+            extract_plane(buffer, 0, frame, plane)
+
+
+async def clip_level(script, node: vs.VideoNode, buffers) -> None:
+    clip = VapourSynthClip(node, script)
+    async with clip:
+        for frameno in range(len(clip)):
+            async with clip[frameno] as frame:
+                await frame.render_planes(RGB24, range(len(buffers)), buffers)
+
+
+async def main(frames: int, width: int, height: int):
+    script = VapourSynthScript(vs.vpy_current_environment())
+    async with script:
+        await script.set_config("yuuno2.vs.default_yuv_matrix", "709")
+        with script.inside():
+            node = make_clip(frames, width, height)
+
+        for name, func in (("sliced", sliced), ("clip", clip_level)):
+            buffers = [bytearray(RGB24.get_plane_size(p, Size(width, height))) for p in range(3)]
+            start = time.perf_counter()
+            await func(script, node, buffers)
+            elapsed = time.perf_counter() - start
+            print(f"{name:<8} {frames/elapsed:8.1f} frames/s")
+
+
+if __name__ == "__main__":
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    width = int(sys.argv[2]) if len(sys.argv) > 2 else 1920
+    height = int(sys.argv[3]) if len(sys.argv) > 3 else 1080
+    asyncio.run(main(frames, width, height))
@@ -31,7 +31,10 @@ test_requirements = [
     "aiounittest", "async_timeout"
 ]
 extras_requires = {
-    "vapoursynth": ["vapoursynth"]
+    "vapoursynth": ["vapoursynth"],
+    "msgpack": ["msgpack"],
+    "lz4": ["lz4"],
+    "zstd": ["zstandard"]
 }
 setup_requires = [
 
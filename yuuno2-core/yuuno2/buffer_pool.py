@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Yuuno - IPython + VapourSynth
+# Copyright (C) 2019 StuxCrystal (Roland Netzsch <stuxcrystal@encode.moe>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Reusable buffers for rendering planes.
+"""
+from typing import MutableMapping, List
+
+
+class BufferPool(object):
+    """
+    Hands out bytearrays and takes them back once they are not used anymore.
+
+    Buffers are grouped into buckets by their size rounded up to the given
+    granularity, so planes of the same clip always hit the same bucket.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, max_per_bucket: int = 8, granularity: int = 4096):
+        """
+        :param max_bytes:       How many bytes of idle buffers the pool keeps at most.
+        :param max_per_bucket:  How many idle buffers of the same bucket the pool keeps at most.
+        :param granularity:     Buffer sizes are rounded up to a multiple of this value.
+        """
+        self.max_bytes = max_bytes
+        self.max_per_bucket = max_per_bucket
+        self.granularity = granularity
+
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+
+        self._idle_bytes = 0
+        self._buckets: MutableMapping[int, List[bytearray]] = {}
+
+    @property
+    def idle_bytes(self) -> int:
+        """
+        :return: The amount of bytes currently held by idle buffers.
+        """
+        return self._idle_bytes
+
+    def _bucket(self, size: int) -> int:
+        g = self.granularity
+        return ((size + g - 1) // g) * g
+
+    def acquire(self, size: int) -> bytearray:
+        """
+        Returns a buffer that is at least size bytes long.
+
+        :param size: The minimal size of the buffer.
+        :return: A buffer that should be returned using :meth:`release`.
+        """
+        bucket = self._bucket(size)
+        idle = self._buckets.get(bucket)
+        if idle:
+            self.hits += 1
+            buffer = idle.pop()
+            self._idle_bytes -= len(buffer)
+            return buffer
+
+        self.misses += 1
+        return bytearray(bucket)
+
+    def release(self, buffer: bytearray) -> None:
+        """
+        Gives the buffer back to the pool.
+
+        Do not use the buffer after releasing it.
+
+        :param buffer: A buffer returned by :meth:`acquire`.
+        """
+        bucket = len(buffer)
+        if bucket != self._bucket(bucket):
+            # Not one of ours.
+            self.discarded += 1
+            return
+
+        idle = self._buckets.setdefault(bucket, [])
+        if len(idle) >= self.max_per_bucket or self._idle_bytes + bucket > self.max_bytes:
+            self.discarded += 1
+            return
+
+        idle.append(buffer)
+        self._idle_bytes += bucket
+
+    def clear(self) -> None:
+        """
+        Drops all idle buffers.
+        """
+        self._buckets.clear()
+        self._idle_bytes = 0
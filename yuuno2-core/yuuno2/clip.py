@@ -17,11 +17,14 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 from abc import abstractmethod, ABC
-from typing import Mapping, Union
+from asyncio import gather, Semaphore
+from typing import Mapping, Union, Sequence, List
 
 from yuuno2.typings import Buffer
-from yuuno2.format import Size, RawFormat, RGB24
+from yuuno2.format import Size, Rect, RawFormat, RGB24
+from yuuno2.cropping import crop_into, cropped_rect
 from yuuno2.resource_manager import Resource
+from yuuno2.scaling import box_scale_into, scaled_size
 
 
 class MetadataContainer(ABC):
@@ -94,6 +97,158 @@ class Frame(MetadataContainer, Resource, ABC):
         """
         return 0
 
+    async def render_planes(self, format: RawFormat, planes: Sequence[int], buffers: Sequence[Buffer]) -> List[int]:
+        """
+        Renders multiple planes of the frame at once.
+
+        The default implementation renders each plane with :func:`render_into`.
+        Frames that can render several planes at a lower cost than one at a time
+        should override this method.
+
+        :param format:  The format to render the frame in.
+        :param planes:  The planes to render.
+        :param buffers: The buffer for each plane. The planes are written at the start of the buffers.
+
+        :exception ValueError:   Thrown if the image cannot be converted to the given format.
+        :exception IndexError:   Thrown if a requested plane is outside the plane range.
+        :exception BufferError:  Thrown if a buffer is too small.
+
+        :return: The amount of bytes written into each buffer.
+        """
+        if len(planes) != len(buffers):
+            raise ValueError("Each plane needs exactly one buffer.")
+
+        return list(await gather(*(
+            self.render_into(buffer, plane, format, 0)
+            for plane, buffer in zip(planes, buffers)
+        )))
+
+    async def render_scaled_into(self, buffer: Buffer, plane: int, format: RawFormat, size: Size, offset: int = 0) -> int:
+        """
+        Renders the plane of the frame scaled down to the given size.
+
+        :param buffer: The buffer to render the image into.
+        :param plane:  The plane to render.
+        :param format: The format to render the frame in.
+        :param size:   The size of the scaled frame (on plane 0).
+        :param offset: Where in the buffer should you start.
+
+        :exception ValueError:   Thrown if the image cannot be converted to the given format or size.
+        :exception IndexError:   Thrown if the requested plane is outside the plane range.
+        :exception BufferError:  Thrown if the buffer is too small at the given offset.
+
+        :return: The amount of bytes written to the binary buffer.
+        """
+        if size == self.size:
+            return await self.render_into(buffer, plane, format, offset)
+
+        size = scaled_size(format, self.size, size)
+        source = bytearray(format.get_plane_size(plane, self.size))
+        await self.render_into(source, plane, format, 0)
+        return box_scale_into(source, buffer, offset, format, plane, self.size, size)
+
+    async def render_scaled_planes(
+            self,
+            format: RawFormat,
+            planes: Sequence[int],
+            size: Size,
+            buffers: Sequence[Buffer]
+    ) -> List[int]:
+        """
+        Renders multiple planes of the frame scaled down to the given size.
+
+        The default implementation renders the planes at full size with
+        :func:`render_planes` and scales them with a box filter. Frames that
+        can resize the image themselves should override this method.
+
+        :param format:  The format to render the frame in.
+        :param planes:  The planes to render.
+        :param size:    The size of the scaled frame (on plane 0).
+        :param buffers: The buffer for each plane. The planes are written at the start of the buffers.
+
+        :exception ValueError:   Thrown if the image cannot be converted to the given format or size.
+        :exception IndexError:   Thrown if a requested plane is outside the plane range.
+        :exception BufferError:  Thrown if a buffer is too small.
+
+        :return: The amount of bytes written into each buffer.
+        """
+        if size == self.size:
+            return await self.render_planes(format, planes, buffers)
+
+        if len(planes) != len(buffers):
+            raise ValueError("Each plane needs exactly one buffer.")
+
+        size = scaled_size(format, self.size, size)
+        sources = [bytearray(format.get_plane_size(plane, self.size)) for plane in planes]
+        await self.render_planes(format, planes, sources)
+        return [
+            box_scale_into(source, buffer, 0, format, plane, self.size, size)
+            for plane, source, buffer in zip(planes, sources, buffers)
+        ]
+
+    async def render_cropped_into(self, buffer: Buffer, plane: int, format: RawFormat, rect: Rect, offset: int = 0) -> int:
+        """
+        Renders a rectangle of the plane of the frame.
+
+        :param buffer: The buffer to render the image into.
+        :param plane:  The plane to render.
+        :param format: The format to render the frame in.
+        :param rect:   The rectangle to render (on plane 0).
+        :param offset: Where in the buffer should you start.
+
+        :exception ValueError:   Thrown if the image cannot be converted to the given format or the rectangle is invalid.
+        :exception IndexError:   Thrown if the requested plane is outside the plane range.
+        :exception BufferError:  Thrown if the buffer is too small at the given offset.
+
+        :return: The amount of bytes written to the binary buffer.
+        """
+        if rect == (0, 0, *self.size):
+            return await self.render_into(buffer, plane, format, offset)
+
+        rect = cropped_rect(format, self.size, rect)
+        source = bytearray(format.get_plane_size(plane, self.size))
+        await self.render_into(source, plane, format, 0)
+        return crop_into(source, buffer, offset, format, plane, self.size, rect)
+
+    async def render_cropped_planes(
+            self,
+            format: RawFormat,
+            planes: Sequence[int],
+            rect: Rect,
+            buffers: Sequence[Buffer]
+    ) -> List[int]:
+        """
+        Renders a rectangle of multiple planes of the frame.
+
+        The default implementation renders the planes at full size with
+        :func:`render_planes` and copies the rectangle out of them. Frames that
+        can crop the image themselves should override this method.
+
+        :param format:  The format to render the frame in.
+        :param planes:  The planes to render.
+        :param rect:    The rectangle to render (on plane 0).
+        :param buffers: The buffer for each plane. The planes are written at the start of the buffers.
+
+        :exception ValueError:   Thrown if the image cannot be converted to the given format or the rectangle is invalid.
+        :exception IndexError:   Thrown if a requested plane is outside the plane range.
+        :exception BufferError:  Thrown if a buffer is too small.
+
+        :return: The amount of bytes written into each buffer.
+        """
+        if rect == (0, 0, *self.size):
+            return await self.render_planes(format, planes, buffers)
+
+        if len(planes) != len(buffers):
+            raise ValueError("Each plane needs exactly one buffer.")
+
+        rect = cropped_rect(format, self.size, rect)
+        sources = [bytearray(format.get_plane_size(plane, self.size)) for plane in planes]
+        await self.render_planes(format, planes, sources)
+        return [
+            crop_into(source, buffer, 0, format, plane, self.size, rect)
+            for plane, source, buffer in zip(planes, sources, buffers)
+        ]
+
 
 class Clip(Resource, MetadataContainer, ABC):
     """
@@ -104,4 +259,38 @@ class Clip(Resource, MetadataContainer, ABC):
         return 0
 
     def __getitem__(self, item) -> Frame:
-        raise NotImplementedError
\ No newline at end of file
+        raise NotImplementedError
+
+    #: How many frames :func:`render_thumbnails` renders at once.
+    THUMBNAIL_CONCURRENCY: int = 8
+
+    async def render_thumbnails(self, indices: Sequence[int], size: Size, format: RawFormat) -> List[List[Buffer]]:
+        """
+        Renders several frames of the clip scaled down to the same size.
+
+        The default implementation renders the frames concurrently with
+        :func:`Frame.render_scaled_planes`. Clips that can render all
+        thumbnails in a single step should override this method.
+
+        :param indices: The frames to render.
+        :param size:    The size of each thumbnail.
+        :param format:  The format to render the thumbnails in.
+
+        :exception ValueError:   Thrown if a frame cannot be rendered in the given format or size.
+        :exception IndexError:   Thrown if a frame is outside the clip.
+
+        :return: The planes of each thumbnail, in the order of the indices.
+        """
+        size = Size(*size)
+        planes = list(range(format.num_planes))
+        semaphore = Semaphore(self.THUMBNAIL_CONCURRENCY)
+
+        async def _render(index: int) -> List[Buffer]:
+            async with semaphore:
+                frame = self[index]
+                async with frame:
+                    buffers = [bytearray(format.get_plane_size(p, size)) for p in planes]
+                    used = await frame.render_scaled_planes(format, planes, size, buffers)
+                    return [memoryview(buf)[:sz] for buf, sz in zip(buffers, used)]
+
+        return list(await gather(*(_render(index) for index in indices)))
\ No newline at end of file
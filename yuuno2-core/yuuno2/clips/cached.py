@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Yuuno - IPython + VapourSynth
+# Copyright (C) 2019 StuxCrystal (Roland Netzsch <stuxcrystal@encode.moe>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from collections import OrderedDict, Counter
+from typing import Mapping, Union, NoReturn, Optional, Tuple, Sequence, List, MutableMapping
+
+from yuuno2.clip import Clip, Frame
+from yuuno2.format import RawFormat, Size
+from yuuno2.resource_manager import register
+from yuuno2.typings import Buffer
+
+
+CacheKey = Tuple[int, RawFormat, int]
+
+
+class CachedFrame(Frame):
+    """
+    A frame of a :class:`CachedClip`.
+
+    The wrapped frame is only acquired when something has to be fetched from it.
+    Frames whose planes are in the cache can be rendered without touching the
+    wrapped clip at all.
+    """
+
+    def __init__(self, clip: 'CachedClip', index: int):
+        self.clip = clip
+        self.index = index
+        self.frame: Optional[Frame] = None
+
+        self._size: Optional[Size] = None
+        self._native_format: Optional[RawFormat] = None
+
+    @property
+    def size(self) -> Size:
+        return self._size
+
+    @property
+    def native_format(self) -> RawFormat:
+        return self._native_format
+
+    async def _inner(self) -> Frame:
+        await self.ensure_acquired()
+        if self.frame is None:
+            frame = self.clip.clip[self.index]
+            await frame.acquire()
+            register(self, frame)
+            self.frame = frame
+        return self.frame
+
+    async def can_render(self, format: RawFormat) -> bool:
+        await self.ensure_acquired()
+        if self.clip._has(self.index, format, 0):
+            return True
+        return await (await self._inner()).can_render(format)
+
+    async def render_into(self, buffer: Buffer, plane: int, format: RawFormat, offset: int = 0) -> int:
+        return (await self.render_planes(format, [plane], [memoryview(buffer)[offset:]]))[0]
+
+    async def render_planes(self, format: RawFormat, planes: Sequence[int], buffers: Sequence[Buffer]) -> List[int]:
+        await self.ensure_acquired()
+
+        if len(planes) != len(buffers):
+            raise ValueError("Each plane needs exactly one buffer.")
+
+        sizes = [self.clip._copy_into(self.index, format, plane, buffer) for plane, buffer in zip(planes, buffers)]
+        missing = [i for i, sz in enumerate(sizes) if sz is None]
+        if missing:
+            frame = await self._inner()
+            rendered = await frame.render_planes(format, [planes[i] for i in missing], [buffers[i] for i in missing])
+            for i, sz in zip(missing, rendered):
+                sizes[i] = sz
+                self.clip._store(
+                    self.index, format, planes[i], bytes(buffers[i][:sz]),
+                    (self._size, self._native_format)
+                )
+
+        return sizes
+
+    async def get_metadata(self) -> Mapping[str, Union[int, str, bytes]]:
+        return await (await self._inner()).get_metadata()
+
+    async def _acquire(self) -> NoReturn:
+        register(self.clip, self)
+
+        info = self.clip._frame_info.get(self.index, None)
+        if info is None:
+            frame = await self._inner()
+            info = (frame.size, frame.native_format)
+        self._size, self._native_format = info
+
+    async def _release(self) -> NoReturn:
+        if self.frame is not None:
+            await self.frame.release(force=False)
+        self.frame = None
+
+
+class CachedClip(Clip):
+    """
+    Keeps rendered planes in memory.
+
+    Planes are stored per frame, format and plane. When the cache exceeds
+    ``max_bytes``, the least recently used planes are evicted first.
+    The cache is cleared when the clip is released.
+    """
+
+    def __init__(self, clip: Clip, max_bytes: int = 256 * 1024 * 1024):
+        """
+        :param clip:      The clip whose frames should be cached.
+        :param max_bytes: How many bytes of plane data the cache keeps at most.
+        """
+        self.clip = clip
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._cached_bytes = 0
+        self._entries: MutableMapping[CacheKey, bytes] = OrderedDict()
+        self._planes_per_frame = Counter()
+        self._frame_info: MutableMapping[int, Tuple[Size, RawFormat]] = {}
+
+    @property
+    def cached_bytes(self) -> int:
+        """
+        :return: The amount of bytes of plane data currently in the cache.
+        """
+        return self._cached_bytes
+
+    def __len__(self) -> int:
+        return len(self.clip)
+
+    def __getitem__(self, item) -> Frame:
+        if 0 > item or item >= len(self):
+            raise IndexError("Clip index out of range.")
+
+        return CachedFrame(self, item)
+
+    async def get_metadata(self) -> Mapping[str, Union[int, str, bytes]]:
+        return await self.clip.get_metadata()
+
+    def _has(self, index: int, format: RawFormat, plane: int) -> bool:
+        return (index, format, plane) in self._entries
+
+    def _copy_into(self, index: int, format: RawFormat, plane: int, buffer: Buffer) -> Optional[int]:
+        key = (index, format, plane)
+        data = self._entries.get(key, None)
+        if data is None:
+            self.misses += 1
+            return None
+
+        if len(buffer) < len(data):
+            raise BufferError("Buffer too small.")
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        buffer[:len(data)] = data
+        return len(data)
+
+    def _store(self, index: int, format: RawFormat, plane: int, data: bytes, info: Tuple[Size, RawFormat]) -> NoReturn:
+        key = (index, format, plane)
+        if len(data) > self.max_bytes or key in self._entries:
+            return
+
+        self._frame_info.setdefault(index, info)
+        self._entries[key] = data
+        self._cached_bytes += len(data)
+        self._planes_per_frame[index] += 1
+
+        while self._cached_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self) -> NoReturn:
+        (index, _, _), data = self._entries.popitem(last=False)
+        self._cached_bytes -= len(data)
+        self.evictions += 1
+
+        self._planes_per_frame[index] -= 1
+        if self._planes_per_frame[index] <= 0:
+            del self._planes_per_frame[index]
+            self._frame_info.pop(index, None)
+
+    def clear(self) -> NoReturn:
+        """
+        Drops every cached plane.
+        """
+        self._entries.clear()
+        self._planes_per_frame.clear()
+        self._frame_info.clear()
+        self._cached_bytes = 0
+
+    async def _acquire(self) -> NoReturn:
+        await self.clip.acquire()
+        register(self.clip, self)
+
+    async def _release(self) -> NoReturn:
+        self.clear()
+        await self.clip.release(force=False)
@@ -17,10 +17,10 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 from asyncio import gather
-from typing import Mapping, Union, NoReturn
+from typing import Mapping, Union, NoReturn, Sequence, List
 
 from yuuno2.clip import Clip, Frame
-from yuuno2.format import RawFormat, Size, ColorFamily
+from yuuno2.format import RawFormat, Size, Rect, ColorFamily
 from yuuno2.resource_manager import register
 from yuuno2.typings import Buffer
 
@@ -75,6 +75,38 @@ class AlphaFrame(Frame):
         else:
             return (await self.main.render_into(buffer, plane, main_f, offset))
 
+    async def render_cropped_into(self, buffer: Buffer, plane: int, format: RawFormat, rect: Rect, offset: int = 0) -> int:
+        await self.ensure_acquired()
+
+        if not (await self.can_render(format)):
+            raise ValueError("Unsupported format.")
+
+        if format.num_planes not in (2, 4):
+            return (await self.main.render_cropped_into(buffer, plane, format, rect, offset))
+
+        main_f = format._replace(num_fields=format.num_fields-1)
+        alpha_f = format._replace(num_fields=1, family=ColorFamily.GREY)
+        if format.num_planes-1 == plane:
+            return (await self.alpha.render_cropped_into(buffer, 0, alpha_f, rect, offset))
+        else:
+            return (await self.main.render_cropped_into(buffer, plane, main_f, rect, offset))
+
+    async def render_cropped_planes(
+            self,
+            format: RawFormat,
+            planes: Sequence[int],
+            rect: Rect,
+            buffers: Sequence[Buffer]
+    ) -> List[int]:
+        if len(planes) != len(buffers):
+            raise ValueError("Each plane needs exactly one buffer.")
+
+        # Let the main and the alpha frame crop their planes themselves.
+        return list(await gather(*(
+            self.render_cropped_into(buffer, plane, format, rect, 0)
+            for plane, buffer in zip(planes, buffers)
+        )))
+
     async def get_metadata(self) -> Mapping[str, Union[int, str, bytes]]:
         await self.ensure_acquired()
 
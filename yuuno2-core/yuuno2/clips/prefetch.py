@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Yuuno - IPython + VapourSynth
+# Copyright (C) 2019 StuxCrystal (Roland Netzsch <stuxcrystal@encode.moe>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from asyncio import Task, CancelledError, gather, get_running_loop
+from typing import Mapping, Union, NoReturn, Optional, Dict, List, Sequence, Tuple
+
+from yuuno2.clip import Clip, Frame
+from yuuno2.format import RawFormat, Size
+from yuuno2.resource_manager import register
+from yuuno2.typings import Buffer
+
+
+class _RenderedPlanes(object):
+    def __init__(self, format: RawFormat, planes: List[bytearray]):
+        self.format = format
+        self.planes = planes
+
+    def copy_into(self, buffer: Buffer, plane: int, offset: int) -> int:
+        data = self.planes[plane]
+        if len(buffer) - offset < len(data):
+            raise BufferError("Buffer too small.")
+        buffer[offset:offset+len(data)] = data
+        return len(data)
+
+
+class PrefetchedFrame(Frame):
+    """
+    A frame of a :class:`PrefetchingClip`.
+
+    If the frame has been prefetched, acquiring it takes over the frame
+    that has been acquired in the background. Planes that have already been
+    rendered are copied from memory.
+    """
+
+    def __init__(self, clip: 'PrefetchingClip', index: int):
+        self.clip = clip
+        self.index = index
+        self.frame: Optional[Frame] = None
+        self._rendered: Optional[_RenderedPlanes] = None
+
+    @property
+    def size(self) -> Size:
+        return self.frame.size
+
+    @property
+    def native_format(self) -> RawFormat:
+        return self.frame.native_format
+
+    async def can_render(self, format: RawFormat) -> bool:
+        await self.ensure_acquired()
+        if self._rendered is not None and self._rendered.format == format:
+            return True
+        return await self.frame.can_render(format)
+
+    async def render_into(self, buffer: Buffer, plane: int, format: RawFormat, offset: int = 0) -> int:
+        await self.ensure_acquired()
+        if self._rendered is not None and self._rendered.format == format:
+            if not 0 <= plane < len(self._rendered.planes):
+                raise IndexError("Plane out of range.")
+            return self._rendered.copy_into(buffer, plane, offset)
+        return await self.frame.render_into(buffer, plane, format, offset)
+
+    async def render_planes(self, format: RawFormat, planes: Sequence[int], buffers: Sequence[Buffer]) -> List[int]:
+        await self.ensure_acquired()
+        if self._rendered is None or self._rendered.format != format:
+            return await self.frame.render_planes(format, planes, buffers)
+        return await super().render_planes(format, planes, buffers)
+
+    async def get_metadata(self) -> Mapping[str, Union[int, str, bytes]]:
+        await self.ensure_acquired()
+        return await self.frame.get_metadata()
+
+    async def _acquire(self) -> NoReturn:
+        self.frame, self._rendered = await self.clip._take(self.index)
+        register(self.frame, self)
+
+    async def _release(self) -> NoReturn:
+        await self.frame.release(force=False)
+        self.frame = None
+        self._rendered = None
+
+
+class PrefetchingClip(Clip):
+    """
+    Acquires and renders upcoming frames in the background.
+
+    The clip watches which frames are acquired. Once two consecutive
+    accesses used the same step, the next ``window`` frames along that step
+    are prefetched. When the access pattern changes, prefetches that are no
+    longer needed are cancelled.
+
+    Works over any clip.
+    """
+
+    def __init__(self, clip: Clip, window: int = 4, format: Optional[RawFormat] = None, render: bool = True):
+        """
+        :param clip:    The clip to prefetch from.
+        :param window:  How many frames are kept ready ahead of the last access.
+        :param format:  The format to render prefetched frames in. Uses the native format of the frame if not given.
+        :param render:  Render the prefetched frames. If false, the frames are only acquired.
+        """
+        self.clip = clip
+        self.window = window
+        self.format = format
+        self.render = render
+
+        self.hits = 0
+        self.misses = 0
+        self.cancelled = 0
+
+        self._last: Optional[int] = None
+        self._stride: Optional[int] = None
+        self._pending: Dict[int, Task] = {}
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        :return: The share of acquired frames that had been prefetched.
+        """
+        total = self.hits + self.misses
+        if total == 0:
+            return 0.0
+        return self.hits / total
+
+    def __len__(self) -> int:
+        return len(self.clip)
+
+    def __getitem__(self, item) -> Frame:
+        if 0 > item or item >= len(self):
+            raise IndexError("Clip index out of range.")
+        return PrefetchedFrame(self, item)
+
+    async def get_metadata(self) -> Mapping[str, Union[int, str, bytes]]:
+        return await self.clip.get_metadata()
+
+    async def _render(self, frame: Frame) -> Optional[_RenderedPlanes]:
+        format = self.format if self.format is not None else frame.native_format
+        if not (await frame.can_render(format)):
+            return None
+
+        planes = list(range(format.num_planes))
+        buffers = [bytearray(format.get_plane_size(p, frame.size)) for p in planes]
+        sizes = await frame.render_planes(format, planes, buffers)
+        return _RenderedPlanes(format, [buf[:sz] if sz != len(buf) else buf for buf, sz in zip(buffers, sizes)])
+
+    async def _prefetch(self, index: int) -> Tuple[Frame, Optional[_RenderedPlanes]]:
+        frame = self.clip[index]
+        try:
+            await frame.acquire()
+            register(self, frame)
+
+            rendered = None
+            if self.render:
+                try:
+                    rendered = await self._render(frame)
+                except CancelledError:
+                    raise
+                except Exception:
+                    # The consumer will run into the error when it renders the frame itself.
+                    rendered = None
+        except BaseException:
+            await frame.release(force=False)
+            raise
+
+        return frame, rendered
+
+    async def _discard(self, index: int) -> NoReturn:
+        task = self._pending.pop(index)
+        self.cancelled += 1
+
+        if not task.done():
+            task.cancel()
+            await gather(task, return_exceptions=True)
+            return
+
+        if not task.cancelled() and task.exception() is None:
+            frame, _ = task.result()
+            await frame.release(force=False)
+
+    async def _observe(self, index: int) -> NoReturn:
+        stride = None if self._last is None else index - self._last
+        self._last = index
+
+        if stride == 0:
+            return
+
+        confirmed = stride is not None and stride == self._stride
+        self._stride = stride
+
+        wanted = set()
+        if confirmed:
+            wanted = {
+                index + stride * step
+                for step in range(1, self.window + 1)
+                if 0 <= index + stride * step < len(self)
+            }
+
+        for old in [i for i in self._pending if i not in wanted]:
+            await self._discard(old)
+
+        loop = get_running_loop()
+        for new in sorted(wanted - self._pending.keys(), key=lambda i: abs(i - index)):
+            self._pending[new] = loop.create_task(self._prefetch(new))
+
+    async def _take(self, index: int) -> Tuple[Frame, Optional[_RenderedPlanes]]:
+        task = self._pending.pop(index, None)
+        await self._observe(index)
+
+        if task is not None:
+            try:
+                result = await task
+            except CancelledError:
+                raise
+            except Exception:
+                pass
+            else:
+                self.hits += 1
+                return result
+
+        self.misses += 1
+        frame = self.clip[index]
+        await frame.acquire()
+        register(self, frame)
+        return frame, None
+
+    async def _acquire(self) -> NoReturn:
+        await self.clip.acquire()
+        register(self.clip, self)
+
+    async def _release(self) -> NoReturn:
+        for index in list(self._pending):
+            await self._discard(index)
+        await self.clip.release(force=False)
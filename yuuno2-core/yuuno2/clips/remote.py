@@ -16,22 +16,64 @@
 #
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
-from asyncio import gather
-from typing import Optional, Union, List, NoReturn, Mapping
+from asyncio import gather, shield, get_running_loop, Task
+from typing import Optional, Union, List, NoReturn, Mapping, MutableMapping, Sequence, Tuple, Dict, FrozenSet
+from typing import Callable
+from typing import NamedTuple
 
+from yuuno2.buffer_pool import BufferPool
+from yuuno2.cropping import cropped_rect
 from yuuno2.clip import Clip, MetadataContainer, Frame
-from yuuno2.format import RawFormat, Size
+from yuuno2.format import RawFormat, Size, Rect
 from yuuno2.networking.base import Connection, Message
+from yuuno2.networking.capabilities import DELTA, SCALED, CROP, THUMBNAILS
+from yuuno2.networking.compression import COMPRESSORS, COMPRESSION_THRESHOLD, Compressor, compress_blob
+from yuuno2.networking.delta import DeltaEncoder, DeltaDecoder, KEYFRAME_INTERVAL
 from yuuno2.networking.reqresp import ReqRespServer, ReqRespClient, function
 from yuuno2.resource_manager import register
+from yuuno2.scaling import scaled_size
+from yuuno2.shared_memory import SharedMemoryArena, SharedMemorySlot, release_views
 from yuuno2.typings import Buffer
 
 
 class ClipServer(ReqRespServer):
+    # Let the clip render several frames at once.
+    MAX_CONCURRENCY = 8
 
-    def __init__(self, clip: Clip, parent: Connection):
+    #: Size of the shared memory arena used when the peer negotiated shared memory.
+    SHARED_MEMORY_SIZE = 128 * 1024 * 1024
+
+    #: Planes smaller than this are sent uncompressed, even if the client asked for compression.
+    COMPRESSION_THRESHOLD = COMPRESSION_THRESHOLD
+
+    #: Every this many frames a full keyframe is sent to clients that requested deltas.
+    KEYFRAME_INTERVAL = KEYFRAME_INTERVAL
+
+    def __init__(
+            self,
+            clip: Clip,
+            parent: Connection,
+            *,
+            buffer_pool: Optional[BufferPool] = None,
+            max_concurrency: Optional[int] = None,
+            max_pending: Optional[int] = None,
+            method_concurrency: Optional[Mapping[str, int]] = None,
+            shared_memory_size: Optional[int] = None,
+            keyframe_interval: Optional[int] = None
+    ):
         self.clip = clip
-        super().__init__(parent)
+        self.buffer_pool = BufferPool() if buffer_pool is None else buffer_pool
+        self.shared_memory_size = shared_memory_size if shared_memory_size is not None else self.SHARED_MEMORY_SIZE
+        self._leased: MutableMapping[int, bytearray] = {}
+        self._arena: Optional[SharedMemoryArena] = None
+        # The planes last sent to the client, per format.
+        self._deltas = DeltaEncoder(keyframe_interval if keyframe_interval is not None else self.KEYFRAME_INTERVAL)
+        super().__init__(
+            parent,
+            max_concurrency=max_concurrency,
+            max_pending=max_pending,
+            method_concurrency=method_concurrency
+        )
 
     async def _acquire(self):
         await super()._acquire()
@@ -40,8 +82,46 @@ class ClipServer(ReqRespServer):
         register(self.clip, self)
 
     async def _release(self):
+        await self.cancel_requests()
+        # Only release the arena once no request renders into it anymore.
+        if self._arena is not None:
+            await self._arena.release(force=True)
+            self._arena = None
         await self.clip.release(force=False)
         await super()._release()
+        self._leased.clear()
+        self._deltas.clear()
+        self.buffer_pool.clear()
+
+    async def _get_arena(self) -> Optional[SharedMemoryArena]:
+        if self._arena is None:
+            capabilities = self.parent.capabilities
+            if capabilities is None or not capabilities.shared_memory:
+                return None
+
+            self._arena = SharedMemoryArena(self.shared_memory_size)
+            await self._arena.acquire()
+        return self._arena
+
+    def response_sent(self, message: Message) -> None:
+        for blob in message.blobs:
+            if not isinstance(blob, memoryview):
+                continue
+
+            buffer = self._leased.pop(id(blob.obj), None)
+            if buffer is not None:
+                self.buffer_pool.release(buffer)
+
+    def response_dropped(self, message: Message) -> None:
+        # The transport might still read from these buffers. Forget them instead of reusing them.
+        for blob in message.blobs:
+            if isinstance(blob, memoryview):
+                self._leased.pop(id(blob.obj), None)
+
+        # The client will never release a slot it has not heard of.
+        shm = message.values.get('shm', None) if isinstance(message.values, dict) else None
+        if shm is not None and self._arena is not None:
+            self._arena.free(shm['slot'])
 
     async def on_metadata(self, frame: Optional[int] = None) -> Message:
         mc: MetadataContainer = self.clip if frame is None else self.clip[frame]
@@ -72,8 +152,20 @@ class ClipServer(ReqRespServer):
             self,
             frame: int,
             format: Optional[list] = None,
-            planes: Optional[Union[List[int], int]] = None
+            planes: Optional[Union[List[int], int]] = None,
+            shm: bool = False,
+            release: Sequence[int] = (),
+            compression: Optional[str] = None,
+            delta: bool = False,
+            base: Optional[int] = None,
+            scaled: Optional[List[int]] = None,
+            crop: Optional[List[int]] = None
     ) -> Message:
+        # Slots of the shared memory arena the client does not use anymore.
+        if self._arena is not None:
+            for offset in release:
+                self._arena.free(offset)
+
         frame_inst = self.clip[frame]
         async with frame_inst:
             if planes is None:
@@ -86,30 +178,201 @@ class ClipServer(ReqRespServer):
             if not isinstance(planes, (list, tuple)):
                 planes: List[int] = [planes]
 
+            size = frame_inst.size
+            rect = None
+            if scaled is not None and crop is not None:
+                raise ValueError("Frames cannot be scaled and cropped at once.")
+            elif scaled is not None:
+                size = scaled_size(format, size, Size(*scaled))
+            elif crop is not None:
+                rect = cropped_rect(format, size, Rect(*crop))
+                size = rect.size
+
+            if shm:
+                response = await self._render_shared(frame_inst, format, planes, size, rect)
+                if response is not None:
+                    return response
+
             buffers = [
-                bytearray(format.get_plane_size(p, frame_inst.size))
+                self.buffer_pool.acquire(format.get_plane_size(p, size))
                 for p in planes
             ]
-            used_buffers = await gather(*(
-                frame_inst.render_into(buf, p, format, 0)
-                for p, buf in enumerate(buffers)
-            ))
-            return Message(
-                {'size': list(frame_inst.size)},
-                [buf[:sz] for buf, sz in zip(buffers, used_buffers)]
-            )
+            for buf in buffers:
+                self._leased[id(buf)] = buf
+
+            try:
+                used_buffers = await self._render_planes(frame_inst, format, planes, size, rect, buffers)
+
+                values = {'size': list(size)}
+                blobs = [memoryview(buf)[:sz] for buf, sz in zip(buffers, used_buffers)]
+
+                if delta:
+                    base, ref, blobs = await get_running_loop().run_in_executor(
+                        None, self._deltas.encode, (format, size, rect, tuple(planes)), base, blobs
+                    )
+                    values['delta'] = {'base': base, 'ref': ref}
+
+                if compression in COMPRESSORS:
+                    values['sizes'] = [len(blob) for blob in blobs]
+                    blobs, values['compression'] = await self._compress(blobs, COMPRESSORS[compression])
+
+            except BaseException:
+                self._return_buffers(buffers, ())
+                raise
+
+            # The buffers still used by the response go back to the pool in response_sent.
+            self._return_buffers(buffers, blobs)
+            return Message(values, blobs)
+
+    async def on_thumbnails(
+            self,
+            frames: List[int],
+            size: List[int],
+            format: list,
+            compression: Optional[str] = None
+    ) -> Message:
+        format: RawFormat = RawFormat.from_json(format)
+        thumbnails = await self.clip.render_thumbnails(frames, Size(*size), format)
+
+        # The planes of all thumbnails are sent one after another.
+        blobs = [plane for planes in thumbnails for plane in planes]
+        values = {'size': list(size), 'planes': format.num_planes}
+        if compression in COMPRESSORS:
+            values['sizes'] = [len(blob) for blob in blobs]
+            blobs, values['compression'] = await self._compress(blobs, COMPRESSORS[compression])
+        return Message(values, blobs)
+
+    def _return_buffers(self, buffers: List[bytearray], blobs: Sequence[Buffer]) -> None:
+        used = {id(blob.obj) for blob in blobs if isinstance(blob, memoryview)}
+        for buf in buffers:
+            if id(buf) not in used and id(buf) in self._leased:
+                self.buffer_pool.release(self._leased.pop(id(buf)))
+
+    async def _compress(self, blobs: List[Buffer], compressor: Compressor) -> Tuple[List[Buffer], List[Optional[str]]]:
+        loop = get_running_loop()
+        compressed = await gather(*(
+            loop.run_in_executor(None, compress_blob, compressor, blob, self.COMPRESSION_THRESHOLD)
+            for blob in blobs
+        ))
+
+        result = []
+        names = []
+        for blob, data in zip(blobs, compressed):
+            if data is None:
+                result.append(blob)
+                names.append(None)
+            else:
+                result.append(data)
+                names.append(compressor.name)
+        return result, names
+
+    @staticmethod
+    async def _render_planes(
+            frame: Frame,
+            format: RawFormat,
+            planes: List[int],
+            size: Size,
+            rect: Optional[Rect],
+            buffers: Sequence[Buffer]
+    ) -> List[int]:
+        if rect is not None:
+            return await frame.render_cropped_planes(format, planes, rect, buffers)
+        return await frame.render_scaled_planes(format, planes, size, buffers)
+
+    async def _render_shared(
+            self,
+            frame: Frame,
+            format: RawFormat,
+            planes: List[int],
+            size: Size,
+            rect: Optional[Rect]
+    ) -> Optional[Message]:
+        arena = await self._get_arena()
+        if arena is None:
+            return None
+
+        sizes = [format.get_plane_size(p, size) for p in planes]
+        slot = arena.allocate(sum(sizes))
+        if slot is None:
+            # The arena is full. Send the planes with the message instead.
+            return None
+
+        offsets = [slot + sum(sizes[:i]) for i in range(len(sizes))]
+        views = [arena.view(o, sz) for o, sz in zip(offsets, sizes)]
+        try:
+            used = await self._render_planes(frame, format, planes, size, rect, views)
+        except BaseException:
+            arena.free(slot)
+            raise
+        finally:
+            release_views(views)
+
+        return Message({
+            'size': list(size),
+            'shm': {'name': arena.name, 'slot': slot, 'planes': [list(p) for p in zip(offsets, used)]}
+        }, [])
+
+
+class CompressedPlane(NamedTuple):
+    compressor: Compressor
+    data: Buffer
+    size: int
+
+    def decompress_into(self, buffer: Buffer, offset: int) -> int:
+        if len(buffer) - offset < self.size:
+            raise BufferError("Buffer too small.")
+        return self.compressor.decompress_into(self.data, memoryview(buffer)[offset:offset + self.size])
 
 
 class ClipClient(ReqRespClient):
     render = function()
+    thumbnails = function()
     metadata = function()
 
     size = function()
     format = function()
     length = function()
 
+    def __init__(
+            self,
+            parent: Connection,
+            *,
+            timeout: Optional[float] = None,
+            release_slot: Optional[Callable[[int], None]] = None
+    ):
+        """
+        :param parent:       The connection to the server.
+        :param timeout:      The default timeout of calls in seconds.
+        :param release_slot: Called with the shared memory slots of renders that are discarded.
+        """
+        super().__init__(parent, timeout=timeout)
+        self.release_slot = release_slot
+
+    def response_discarded(self, message: Message) -> None:
+        # The server handed the slot over to us, so we have to give it back.
+        values = message.values
+        if self.release_slot is None or not isinstance(values, dict):
+            return
+
+        shm = values.get('shm', None)
+        if shm is not None:
+            self.release_slot(shm['slot'])
+
 
 class RemoteFrame(Frame):
+    """
+    A frame that is rendered by a ClipServer.
+
+    Rendered planes are kept for PLANE_CACHE_TTL seconds. A call to
+    :func:`render_into` fetches all planes of the format in a single request
+    so the calls for the other planes are served locally.
+
+    Scaled and cropped renders are done by the server if it supports them,
+    so only the scaled or visible part of the planes is sent over the connection.
+    """
+
+    #: Seconds rendered planes are kept around.
+    PLANE_CACHE_TTL: float = 1.0
 
     def __init__(self, frame: int, clip: 'RemoteClip', client: ClipClient):
         self.frame = frame
@@ -119,6 +382,9 @@ class RemoteFrame(Frame):
         self._native_format = None
         self._size = None
 
+        self._renderable: Dict[RawFormat, bool] = {}
+        self._plane_cache: Dict[Tuple[RawFormat, Optional[Size], Optional[Rect]], Tuple[float, FrozenSet[int], Task]] = {}
+
     async def _acquire(self) -> NoReturn:
         await self.remote_clip.acquire()
         await self.client.acquire()
@@ -134,6 +400,11 @@ class RemoteFrame(Frame):
         self._native_format = RawFormat.from_json(msg_format.values)
 
     async def _release(self) -> NoReturn:
+        cache, self._plane_cache = self._plane_cache, {}
+        for _, _, task in cache.values():
+            task.cancel()
+        self._renderable.clear()
+
         await self.remote_clip.release(force=False)
         await self.client.release(force=False)
         self.remote_clip = None
@@ -150,30 +421,213 @@ class RemoteFrame(Frame):
     async def can_render(self, format: RawFormat) -> bool:
         await self.ensure_acquired()
 
-        f_json = format.to_json()
-        response: Message = await self.client.render(
-            frame=self.frame,
-            format=f_json,
-            planes=[]
-        )
-        return response.values['size'] is not None
+        if format not in self._renderable:
+            response: Message = await self.client.render(
+                frame=self.frame,
+                format=format.to_json(),
+                planes=[]
+            )
+            self._renderable[format] = response.values['size'] is not None
+        return self._renderable[format]
 
-    async def render_into(self, buffer: Buffer, plane: int, format: RawFormat, offset: int = 0) -> int:
-        await self.ensure_acquired()
+    async def _request_planes(
+            self,
+            format: RawFormat,
+            planes: Sequence[int],
+            size: Optional[Size] = None,
+            rect: Optional[Rect] = None
+    ) -> Mapping[int, Buffer]:
+        params = {}
+        key = (format, size, rect, tuple(planes))
+        if size is not None:
+            params['scaled'] = list(size)
+        if rect is not None:
+            params['crop'] = list(rect)
+        if self.remote_clip.shared_memory:
+            params.update(shm=True, release=self.remote_clip.take_released_slots())
+        else:
+            if self.remote_clip.compression is not None:
+                params['compression'] = self.remote_clip.compression
+            if self.remote_clip.delta:
+                params['delta'] = True
+                params['base'] = self.remote_clip.deltas.reference(key)
 
-        f_json = format.to_json()
         response: Message = await self.client.render(
             frame=self.frame,
-            format=f_json,
-            planes=[plane]
+            format=format.to_json(),
+            planes=list(planes),
+            **params
         )
+        self._renderable[format] = response.values['size'] is not None
         if response.values['size'] is None:
             raise ValueError("Unsupported format.")
 
-        buf_sz = len(response.blobs[0])
-        buffer[:buf_sz] = response.blobs[0]
+        blobs = response.blobs
+        compression = response.values.get('compression', None)
+        if compression is not None:
+            # Compressed planes are decompressed straight into the buffers passed to render_into.
+            blobs = [
+                blob if name is None else CompressedPlane(COMPRESSORS[name], blob, size)
+                for name, blob, size in zip(compression, blobs, response.values['sizes'])
+            ]
+
+        delta = response.values.get('delta', None)
+        if delta is not None:
+            blobs = await self._decode_delta(key, delta, blobs)
+            if blobs is None:
+                # We do not hold the frame the delta is based on anymore. Ask for a keyframe.
+                self.remote_clip.deltas.forget(key)
+                return await self._request_planes(format, planes, size, rect)
+
+        if compression is not None or delta is not None:
+            return dict(zip(planes, blobs))
+
+        shm = response.values.get('shm', None)
+        if shm is None:
+            return dict(zip(planes, response.blobs))
+
+        # The slot stays reserved until this frame is released.
+        slot = await self.remote_clip.attach_slot(shm['name'], shm['slot'])
+        register(self, slot)
+        return {p: slot.view(offset, length) for p, (offset, length) in zip(planes, shm['planes'])}
+
+    async def _decode_delta(self, key, delta: dict, blobs: List[Union[Buffer, CompressedPlane]]) -> Optional[List[Buffer]]:
+        decoded = []
+        for blob in blobs:
+            if isinstance(blob, CompressedPlane):
+                buffer = bytearray(blob.size)
+                await self._write_plane(blob, buffer, 0)
+                blob = buffer
+            decoded.append(blob)
+        return self.remote_clip.deltas.decode(key, delta['base'], delta['ref'], decoded)
+
+    def _planes_task(
+            self,
+            format: RawFormat,
+            planes: Sequence[int],
+            size: Optional[Size] = None,
+            rect: Optional[Rect] = None
+    ) -> Task:
+        loop = get_running_loop()
+        now = loop.time()
+        for key, (expires, _, task) in list(self._plane_cache.items()):
+            if task.done() and expires <= now:
+                del self._plane_cache[key]
+
+        key = (format, size, rect)
+        if key in self._plane_cache:
+            _, cached, task = self._plane_cache[key]
+            if cached.issuperset(planes):
+                return task
+
+        task = loop.create_task(self._request_planes(format, planes, size, rect))
+        self._plane_cache[key] = (now + self.PLANE_CACHE_TTL, frozenset(planes), task)
+
+        def _drop_failed(t: Task):
+            if not (t.cancelled() or t.exception() is not None):
+                return
+            if key in self._plane_cache and self._plane_cache[key][2] is t:
+                del self._plane_cache[key]
+        task.add_done_callback(_drop_failed)
+
+        return task
+
+    @staticmethod
+    def _copy_plane(blob: Buffer, buffer: Buffer, offset: int) -> int:
+        buf_sz = len(blob)
+        if len(buffer) - offset < buf_sz:
+            raise BufferError("Buffer too small.")
+        buffer[offset:offset+buf_sz] = blob
         return buf_sz
 
+    @classmethod
+    async def _write_plane(cls, blob: Union[Buffer, CompressedPlane], buffer: Buffer, offset: int) -> int:
+        if isinstance(blob, CompressedPlane):
+            return await get_running_loop().run_in_executor(None, blob.decompress_into, buffer, offset)
+        return cls._copy_plane(blob, buffer, offset)
+
+    async def render_into(self, buffer: Buffer, plane: int, format: RawFormat, offset: int = 0) -> int:
+        await self.ensure_acquired()
+
+        if not 0 <= plane < format.num_planes:
+            raise IndexError("Plane out of range.")
+
+        planes = await shield(self._planes_task(format, range(format.num_planes)))
+        return await self._write_plane(planes[plane], buffer, offset)
+
+    async def render_planes(self, format: RawFormat, planes: Sequence[int], buffers: Sequence[Buffer]) -> List[int]:
+        await self.ensure_acquired()
+
+        if len(planes) != len(buffers):
+            raise ValueError("Each plane needs exactly one buffer.")
+
+        rendered = await shield(self._planes_task(format, planes))
+        return list(await gather(*(self._write_plane(rendered[p], buf, 0) for p, buf in zip(planes, buffers))))
+
+    async def render_scaled_into(self, buffer: Buffer, plane: int, format: RawFormat, size: Size, offset: int = 0) -> int:
+        await self.ensure_acquired()
+
+        if size == self.size or not self.remote_clip.scaled:
+            return await super().render_scaled_into(buffer, plane, format, size, offset)
+
+        if not 0 <= plane < format.num_planes:
+            raise IndexError("Plane out of range.")
+
+        size = scaled_size(format, self.size, size)
+        planes = await shield(self._planes_task(format, range(format.num_planes), size))
+        return await self._write_plane(planes[plane], buffer, offset)
+
+    async def render_scaled_planes(
+            self,
+            format: RawFormat,
+            planes: Sequence[int],
+            size: Size,
+            buffers: Sequence[Buffer]
+    ) -> List[int]:
+        await self.ensure_acquired()
+
+        if size == self.size or not self.remote_clip.scaled:
+            return await super().render_scaled_planes(format, planes, size, buffers)
+
+        if len(planes) != len(buffers):
+            raise ValueError("Each plane needs exactly one buffer.")
+
+        size = scaled_size(format, self.size, size)
+        rendered = await shield(self._planes_task(format, planes, size))
+        return list(await gather(*(self._write_plane(rendered[p], buf, 0) for p, buf in zip(planes, buffers))))
+
+    async def render_cropped_into(self, buffer: Buffer, plane: int, format: RawFormat, rect: Rect, offset: int = 0) -> int:
+        await self.ensure_acquired()
+
+        if rect == (0, 0, *self.size) or not self.remote_clip.cropped:
+            return await super().render_cropped_into(buffer, plane, format, rect, offset)
+
+        if not 0 <= plane < format.num_planes:
+            raise IndexError("Plane out of range.")
+
+        rect = cropped_rect(format, self.size, rect)
+        planes = await shield(self._planes_task(format, range(format.num_planes), rect=rect))
+        return await self._write_plane(planes[plane], buffer, offset)
+
+    async def render_cropped_planes(
+            self,
+            format: RawFormat,
+            planes: Sequence[int],
+            rect: Rect,
+            buffers: Sequence[Buffer]
+    ) -> List[int]:
+        await self.ensure_acquired()
+
+        if rect == (0, 0, *self.size) or not self.remote_clip.cropped:
+            return await super().render_cropped_planes(format, planes, rect, buffers)
+
+        if len(planes) != len(buffers):
+            raise ValueError("Each plane needs exactly one buffer.")
+
+        rect = cropped_rect(format, self.size, rect)
+        rendered = await shield(self._planes_task(format, planes, rect=rect))
+        return list(await gather(*(self._write_plane(rendered[p], buf, 0) for p, buf in zip(planes, buffers))))
+
     async def get_metadata(self) -> Mapping[str, Union[int, str, bytes]]:
         await self.ensure_acquired()
 
@@ -184,11 +638,132 @@ class RemoteFrame(Frame):
 
 
 class RemoteClip(Clip):
-    def __init__(self, connection: Connection):
+    """
+    A clip served by a ClipServer.
+
+    If both sides negotiated shared memory, rendered planes are read
+    directly from the shared memory arena of the server.
+
+    Thumbnails of several frames are fetched with a single request
+    if the server supports it.
+    """
+
+    def __init__(
+            self,
+            connection: Connection,
+            *,
+            timeout: Optional[float] = None,
+            compression: Optional[str] = None,
+            delta: bool = False
+    ):
+        """
+        :param connection:  The connection to the ClipServer.
+        :param timeout:     How many seconds to wait for the server per request. None waits forever.
+        :param compression: The compression to request for rendered planes. Use "auto" to
+                            pick the preferred one both sides support. Planes are only compressed
+                            if the server supports the compression and they are not exchanged
+                            using shared memory.
+        :param delta:       Ask the server to send the difference to the last rendered frame of the
+                            same format instead of full planes. Useful when stepping through frames.
+        """
         self.connection = connection
+        self.timeout = timeout
+        self.requested_compression = compression
+        self.requested_delta = delta
+        # The planes last received, per format.
+        self.deltas = DeltaDecoder()
         self._client = None
         self._sz = None
 
+        self._arenas: Dict[str, SharedMemoryArena] = {}
+        self._released_slots: List[int] = []
+
+    @property
+    def shared_memory(self) -> bool:
+        capabilities = self.connection.capabilities
+        return capabilities is not None and capabilities.shared_memory
+
+    @property
+    def compression(self) -> Optional[str]:
+        """
+        :return: The compression requested for rendered planes, if the server supports it.
+        """
+        capabilities = self.connection.capabilities
+        if self.requested_compression is None or capabilities is None:
+            return None
+
+        if self.requested_compression == "auto":
+            return capabilities.compression[0] if capabilities.compression else None
+        if self.requested_compression in capabilities.compression:
+            return self.requested_compression
+        return None
+
+    @property
+    def delta(self) -> bool:
+        """
+        :return: True if planes are requested as deltas.
+        """
+        capabilities = self.connection.capabilities
+        return self.requested_delta and capabilities is not None and capabilities.supports(DELTA)
+
+    @property
+    def scaled(self) -> bool:
+        """
+        :return: True if the server renders scaled frames itself.
+        """
+        capabilities = self.connection.capabilities
+        return capabilities is not None and capabilities.supports(SCALED)
+
+    @property
+    def cropped(self) -> bool:
+        """
+        :return: True if the server crops frames itself.
+        """
+        capabilities = self.connection.capabilities
+        return capabilities is not None and capabilities.supports(CROP)
+
+    @property
+    def thumbnails(self) -> bool:
+        """
+        :return: True if the server renders thumbnails of several frames in a single request.
+        """
+        capabilities = self.connection.capabilities
+        return capabilities is not None and capabilities.supports(THUMBNAILS)
+
+    def take_released_slots(self) -> List[int]:
+        """
+        :return: The slots that can be reused by the server. They are sent with the next request.
+        """
+        released, self._released_slots = self._released_slots, []
+        return released
+
+    def release_slot(self, offset: int) -> None:
+        """
+        Returns a slot to the server with the next request.
+
+        :param offset: The offset of the slot.
+        """
+        self._released_slots.append(offset)
+
+    async def attach_slot(self, name: str, offset: int) -> SharedMemorySlot:
+        """
+        Takes ownership of a slot in an arena of the server.
+
+        :param name:   The name of the arena.
+        :param offset: The offset of the slot.
+        :return: The acquired slot.
+        """
+        arena = self._arenas.get(name, None)
+        if arena is None:
+            arena = SharedMemoryArena(name=name)
+            await arena.acquire()
+            register(self, arena)
+            self._arenas[name] = arena
+
+        slot = SharedMemorySlot(arena, offset, self.release_slot)
+        await slot.acquire()
+        return slot
+
     def __getitem__(self, item) -> Frame:
         if 0 > item or item >= len(self):
             raise IndexError("Clip index out of range.")
@@ -204,7 +779,7 @@ class RemoteClip(Clip):
         await self.connection.acquire()
         register(self.connection, self)
 
-        self._client = ClipClient(self.connection)
+        self._client = ClipClient(self.connection, timeout=self.timeout, release_slot=self.release_slot)
         await self._client.acquire()
         register(self, self._client)
 
@@ -212,9 +787,52 @@ class RemoteClip(Clip):
         self._sz = msg.values['length']
 
     async def _release(self) -> NoReturn:
+        self._arenas.clear()
+        self._released_slots.clear()
+        self.deltas.clear()
         await self.connection.release(force=False)
 
     async def get_metadata(self) -> Mapping[str, Union[int, str, bytes]]:
         await self.ensure_acquired()
         msg: Message = await self._client.metadata()
         return msg.values
+
+    @staticmethod
+    async def _decompress(blob: Union[Buffer, CompressedPlane]) -> Buffer:
+        if not isinstance(blob, CompressedPlane):
+            return blob
+        buffer = bytearray(blob.size)
+        await RemoteFrame._write_plane(blob, buffer, 0)
+        return buffer
+
+    async def render_thumbnails(self, indices: Sequence[int], size: Size, format: RawFormat) -> List[List[Buffer]]:
+        await self.ensure_acquired()
+
+        if not self.thumbnails:
+            return await super().render_thumbnails(indices, size, format)
+
+        for index in indices:
+            if 0 > index or index >= len(self):
+                raise IndexError("Clip index out of range.")
+
+        params = {}
+        if self.compression is not None:
+            params['compression'] = self.compression
+
+        response: Message = await self._client.thumbnails(
+            frames=list(indices),
+            size=list(size),
+            format=format.to_json(),
+            **params
+        )
+
+        blobs = response.blobs
+        compression = response.values.get('compression', None)
+        if compression is not None:
+            blobs = await gather(*(
+                self._decompress(blob if name is None else CompressedPlane(COMPRESSORS[name], blob, length))
+                for name, blob, length in zip(compression, blobs, response.values['sizes'])
+            ))
+
+        count = response.values['planes']
+        return [list(blobs[i:i + count]) for i in range(0, len(blobs), count)]
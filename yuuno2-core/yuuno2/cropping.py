@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Yuuno - IPython + VapourSynth
+# Copyright (C) 2019 StuxCrystal (Roland Netzsch <stuxcrystal@encode.moe>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Cropping rendered planes to a region of interest.
+
+Backends that cannot crop the frame themselves render it at full size
+and copy the visible rows with :func:`crop_into`.
+"""
+from yuuno2.format import RawFormat, Size, Rect
+from yuuno2.typings import Buffer
+
+
+def cropped_rect(format: RawFormat, size: Size, rect: Rect) -> Rect:
+    """
+    Checks if a rectangle can be cropped out of a frame.
+
+    :param format: The format the frame is rendered in.
+    :param size:   The size of the frame.
+    :param rect:   The rectangle to crop.
+    :exception ValueError: Thrown if the rectangle is empty, outside the frame or does not fit the subsampling.
+    :return: The rectangle.
+    """
+    rect = Rect(*rect)
+    x, y, w, h = rect
+    if w <= 0 or h <= 0 or x < 0 or y < 0 or x + w > size.width or y + h > size.height:
+        raise ValueError("The rectangle is not inside the frame.")
+
+    if format.planar:
+        mw = (1 << format.subsampling_w) - 1
+        mh = (1 << format.subsampling_h) - 1
+        if (x | w) & mw or (y | h) & mh:
+            raise ValueError("The rectangle does not fit the subsampling of the format.")
+    return rect
+
+
+def crop_into(
+        source: Buffer, buffer: Buffer, offset: int,
+        format: RawFormat, plane: int, size: Size, rect: Rect
+) -> int:
+    """
+    Copies a rectangle out of a rendered plane.
+
+    :param source: The plane rendered at full size.
+    :param buffer: The buffer to write the cropped plane into.
+    :param offset: Where in the buffer should the plane start.
+    :param format: The format the plane was rendered in.
+    :param plane:  The index of the plane.
+    :param size:   The size of the frame.
+    :param rect:   The rectangle to crop (on plane 0).
+
+    :exception BufferError: Thrown if the buffer is too small at the given offset.
+
+    :return: The amount of bytes written to the buffer.
+    """
+    pixel = format.bytes_per_sample * (1 if format.planar else format.num_fields)
+    x, y, w, h = format.get_plane_rect(plane, rect)
+
+    source_stride = format.get_plane_size(plane, size) // format.get_plane_dimensions(plane, size).height
+    target_stride = format.get_plane_size(plane, rect) // h
+    row = w * pixel
+
+    length = target_stride * h
+    if len(buffer) - offset < length:
+        raise BufferError("The buffer is too small.")
+
+    source = memoryview(source).cast('B')
+    out = memoryview(buffer).cast('B')
+    start = y * source_stride + x * pixel
+    for i in range(h):
+        pos = offset + i * target_stride
+        out[pos:pos + row] = source[start:start + row]
+        if target_stride > row:
+            out[pos + row:pos + target_stride] = bytes(target_stride - row)
+        start += source_stride
+
+    return length
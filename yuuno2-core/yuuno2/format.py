@@ -17,7 +17,7 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 from enum import IntEnum
-from typing import NamedTuple
+from typing import NamedTuple, Union
 
 
 class Size(NamedTuple):
@@ -25,6 +25,17 @@ class Size(NamedTuple):
     height: int
 
 
+class Rect(NamedTuple):
+    x: int
+    y: int
+    width: int
+    height: int
+
+    @property
+    def size(self) -> Size:
+        return Size(self.width, self.height)
+
+
 class SampleType(IntEnum):
     INTEGER = 0
     FLOAT = 1
@@ -77,20 +88,23 @@ class RawFormat(NamedTuple):
         else:
             return 1
 
-    def get_stride(self, plane: int, size: Size) -> int:
+    def get_stride(self, plane: int, size: Union[Size, Rect]) -> int:
         stride = self.get_plane_dimensions(plane, size).width
         if not self.packed:
             stride += stride % 4
         return stride
 
-    def get_plane_dimensions(self, plane: int, size: Size) -> Size:
+    def get_plane_dimensions(self, plane: int, size: Union[Size, Rect]) -> Size:
         """
         Returns the size of the plane's picture dimensions.
 
         :param plane: The plane number.
-        :param size:  The size of the plane.
+        :param size:  The size of the plane or the rectangle cropped out of it.
         :return: A new size object with the desired size.
         """
+        if isinstance(size, Rect):
+            size = size.size
+
         if not self.planar:
             return size
 
@@ -100,13 +114,35 @@ class RawFormat(NamedTuple):
             h >>= self.subsampling_h
         return Size(w, h)
 
-    def get_plane_size(self, plane: int, size: Size) -> int:
+    def get_plane_rect(self, plane: int, rect: Rect) -> Rect:
+        """
+        Returns the part of the plane covered by a rectangle of the frame.
+
+        :param plane: The plane number.
+        :param rect:  The rectangle on plane 0.
+        :return: The rectangle on the given plane.
+        """
+        if not self.planar or not 0 < plane < 4:
+            return rect
+
+        x, y, w, h = rect
+        return Rect(
+            x >> self.subsampling_w,
+            y >> self.subsampling_h,
+            w >> self.subsampling_w,
+            h >> self.subsampling_h
+        )
+
+    def get_plane_size(self, plane: int, size: Union[Size, Rect]) -> int:
         """
         Calcute the size of the plane in bytes.
 
         :param plane:  The index of the plane.
-        :param size:   The size of the frame (on plane 0)
+        :param size:   The size of the frame (on plane 0) or the rectangle cropped out of it.
         """
+        if isinstance(size, Rect):
+            size = size.size
+
         if not self.planar:
             return self.bytes_per_sample * self.num_fields * size.width * size.height
 
@@ -18,13 +18,15 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 from asyncio import Protocol, BaseTransport, get_running_loop, sleep, BaseProtocol
 from asyncio import Queue, Event, Transport, ensure_future, TimeoutError
-from typing import Optional, NoReturn
+from typing import Optional, NoReturn, Sequence
 from weakref import WeakKeyDictionary
 
 from yuuno2.asyncutils import dynamic_timeout
-from yuuno2.networking.base import Message, MessageInputStream, MessageOutputStream
+from yuuno2.networking.base import Message, MessageInputStream, MessageOutputStream, Connection
+from yuuno2.networking.codecs import HeaderCodec, JSON_CODEC
 from yuuno2.networking.serializer import ByteOutputStream, bytes_protocol
 from yuuno2.resource_manager import ResourceProxy, remove_callback, on_release
+from yuuno2.typings import Buffer
 
 
 class ResourceDescriptor(object):
@@ -64,12 +66,17 @@ class ResourceDescriptor(object):
 class YuunoBaseProtocol(BaseProtocol):
     QUEUE_MAXSIZE = 30
 
+    # Receive blobs as memoryviews of preallocated buffers.
+    DIRECT_BLOBS = False
+
+    header_codec: HeaderCodec = JSON_CODEC
+
     _ingress: Optional[MessageInputStream] = ResourceDescriptor()
     _egress: Optional[MessageOutputStream] = ResourceDescriptor()
 
     def __init__(self):
         self.transport: Optional[BaseTransport] = None
-        self.protocol = bytes_protocol()
+        self.protocol = bytes_protocol(direct_blobs=self.DIRECT_BLOBS)
         self.rqueue = Queue()
 
         self._transport_gate = Event()
@@ -107,7 +114,14 @@ class YuunoBaseProtocol(BaseProtocol):
         except TimeoutError:
             return
 
-        self.write_message_data(ByteOutputStream.write_message(message))
+        self.write_message_parts(ByteOutputStream.encode_message(message, self.header_codec))
+
+        # The transport might still reference the parts. Wait until it
+        # drained its buffer so the caller can reuse its memory.
+        try:
+            await dynamic_timeout(self._transport_gate.wait(), self._closed.wait())
+        except TimeoutError:
+            return
 
     def _parse_until(self, maxsize: Optional[int] = QUEUE_MAXSIZE):
         if maxsize is not None and self.rqueue.qsize()>=maxsize:
@@ -123,6 +137,9 @@ class YuunoBaseProtocol(BaseProtocol):
     def write_message_data(self, data: bytes):
         raise NotImplementedError
 
+    def write_message_parts(self, parts: Sequence[Buffer]):
+        self.write_message_data(b''.join(parts))
+
     def feed(self, data: Optional[bytes]) -> bool:
         self.protocol.feed(data)
         return self._parse_until(self.QUEUE_MAXSIZE)
@@ -152,9 +169,17 @@ class YuunoProtocol(Protocol, YuunoBaseProtocol):
     def write_message_data(self, message):
         self.transport.write(message)
 
+    def write_message_parts(self, parts: Sequence[Buffer]):
+        self.transport.writelines(parts)
+
     def connection_made(self, transport: BaseTransport) -> None:
         # noinspection PyTypeChecker
         self.transport = transport
+
+        # Pause as soon as the transport has to buffer anything so that
+        # write_message only returns once all parts have been handed
+        # over to the operating system.
+        transport.set_write_buffer_limits(0)
         self.continue_writing()
 
     def after_message_read(self):
@@ -201,6 +226,9 @@ class ConnectionOutputStream(MessageOutputStream):
         await self.protocol.write_message(message)
         await sleep(0)
 
+    def set_header_codec(self, codec: HeaderCodec) -> None:
+        self.protocol.header_codec = codec
+
     async def close(self) -> NoReturn:
         await self.protocol.close()
 
@@ -212,3 +240,33 @@ class ConnectionOutputStream(MessageOutputStream):
             await self.close()
 
         self.protocol._egress = None
+
+
+def protocol_connection(protocol: YuunoBaseProtocol) -> Connection:
+    """
+    Wraps a connected protocol into a connection.
+    """
+    return Connection(ConnectionInputStream(protocol), ConnectionOutputStream(protocol))
+
+
+async def connect_tcp(host: str, port: int) -> Connection:
+    """
+    Connects to a yuuno2 server listening on a TCP socket.
+
+    :param host: The host of the server.
+    :param port: The port of the server.
+    :return: A connection that closes the socket once it is released.
+    """
+    _, protocol = await get_running_loop().create_connection(YuunoProtocol, host, port)
+    return protocol_connection(protocol)
+
+
+async def connect_unix(path: str) -> Connection:
+    """
+    Connects to a yuuno2 server listening on a unix domain socket.
+
+    :param path: The path of the socket.
+    :return: A connection that closes the socket once it is released.
+    """
+    _, protocol = await get_running_loop().create_unix_connection(YuunoProtocol, path)
+    return protocol_connection(protocol)
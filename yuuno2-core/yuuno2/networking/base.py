@@ -18,10 +18,14 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 from abc import ABC, abstractmethod
 from asyncio import gather
-from typing import NamedTuple, List, Mapping, Union, Optional, NoReturn
+from typing import NamedTuple, List, Mapping, Union, Optional, NoReturn, TYPE_CHECKING
 
 from yuuno2.resource_manager import Resource, register
 
+if TYPE_CHECKING:
+    from yuuno2.networking.capabilities import Capabilities
+    from yuuno2.networking.codecs import HeaderCodec
+
 AnyJSON = Union[str, int, float, bool, None, Mapping[str, 'AnyJSON'], List['AnyJSON']]
 JSON = Mapping[str, AnyJSON]
 
@@ -31,6 +35,16 @@ class Message(NamedTuple):
     blobs: List[bytes] = []
 
 
+def blobs_size(message: Message) -> int:
+    """
+    :return: The number of bytes in the blobs of the message.
+    """
+    return sum(
+        blob.nbytes if isinstance(blob, memoryview) else len(blob)
+        for blob in message.blobs
+    )
+
+
 class MessageInputStream(Resource, ABC):
 
     @abstractmethod
@@ -42,17 +56,39 @@ class MessageOutputStream(Resource, ABC):
 
     @abstractmethod
     async def write(self, message: Message) -> NoReturn:
+        """
+        Writes a message.
+
+        Once this method returns, the stream must not reference the blobs of the
+        message anymore, so callers may reuse their memory. Streams that hand over
+        the message object or buffer it have to copy the blobs.
+
+        :param message: The message to write.
+        """
         pass
 
     @abstractmethod
     async def close(self) -> NoReturn:
         pass
 
+    def set_header_codec(self, codec: 'HeaderCodec') -> None:
+        """
+        Selects the codec used to encode the values of outgoing messages.
+
+        Streams that do not serialize messages ignore this.
+
+        :param codec: The codec to use.
+        """
+        pass
+
 
 class Connection(Resource):
     input: MessageInputStream
     output: MessageOutputStream
 
+    # Set once a multiplexer negotiated the capabilities of this connection.
+    capabilities: Optional['Capabilities'] = None
+
     def __init__(self, input: MessageInputStream, output: MessageOutputStream):
         self.input = input
         self.output = output
@@ -83,6 +119,9 @@ class Connection(Resource):
         await self.ensure_acquired()
         return (await self.input.read())
 
+    def set_header_codec(self, codec: 'HeaderCodec') -> None:
+        self.output.set_header_codec(codec)
+
 
 class ConnectionOutputStream(MessageOutputStream):
 
@@ -92,6 +131,9 @@ class ConnectionOutputStream(MessageOutputStream):
     async def write(self, message: Message) -> NoReturn:
         return await self.connection.write(message)
 
+    def set_header_codec(self, codec: 'HeaderCodec') -> None:
+        self.connection.set_header_codec(codec)
+
     async def close(self) -> NoReturn:
         return await self.connection.close()
 
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Yuuno - IPython + VapourSynth
+# Copyright (C) 2019 StuxCrystal (Roland Netzsch <stuxcrystal@encode.moe>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Capabilities exchanged when a multiplexed connection is established.
+
+Both peers send their capabilities once. The negotiated set only contains what
+both sides understand, so a feature is only used when it is safe to do so.
+Peers that predate the handshake are treated as :data:`LEGACY`.
+"""
+from typing import NamedTuple, Tuple, Optional, FrozenSet, Sequence
+
+from yuuno2.networking.base import JSON
+from yuuno2.networking.codecs import BINARY_CODEC
+from yuuno2.shared_memory import SHARED_MEMORY_AVAILABLE
+
+
+PROTOCOL_VERSION = 1
+
+#: Channels only send as much data as the peer granted credit for.
+FLOW_CONTROL = "flow-control"
+
+#: Large messages are split into fragments so other channels can write in between.
+FRAGMENTS = "fragments"
+
+#: Several requests and their responses can be sent in a single message.
+BATCH = "batch"
+
+#: Clip servers can send rendered planes as the difference to the last frame.
+DELTA = "delta"
+
+#: Clip servers can render frames scaled down to a smaller size.
+SCALED = "scaled"
+
+#: Clip servers can render a rectangle cropped out of a frame.
+CROP = "crop"
+
+#: Clip servers can render thumbnails of several frames in a single request.
+THUMBNAILS = "thumbnails"
+
+#: The features this version implements.
+FEATURES = (FLOW_CONTROL, FRAGMENTS, BATCH, DELTA, SCALED, CROP, THUMBNAILS)
+
+
+class Capabilities(NamedTuple):
+    version: int = 0
+
+    # Codecs this side can decode, in the order it prefers to send them.
+    header_codecs: Tuple[str, ...] = ("json",)
+    # The codec this side encodes its headers with.
+    header_codec: str = "json"
+
+    max_message_size: Optional[int] = None
+    compression: Tuple[str, ...] = ()
+    shared_memory: bool = False
+    features: FrozenSet[str] = frozenset()
+
+    @property
+    def legacy(self) -> bool:
+        return self.version == 0
+
+    def supports(self, feature: str) -> bool:
+        return feature in self.features
+
+    def to_json(self) -> JSON:
+        return {
+            "version": self.version,
+            "header_codecs": list(self.header_codecs),
+            "max_message_size": self.max_message_size,
+            "compression": list(self.compression),
+            "shared_memory": self.shared_memory,
+            "features": sorted(self.features),
+        }
+
+    @classmethod
+    def from_json(cls, data: JSON) -> 'Capabilities':
+        # Unknown keys are ignored so newer peers can add fields.
+        return cls(
+            version=int(data.get("version", 0)),
+            header_codecs=tuple(data.get("header_codecs", ("json",))),
+            max_message_size=data.get("max_message_size", None),
+            compression=tuple(data.get("compression", ())),
+            shared_memory=bool(data.get("shared_memory", False)),
+            features=frozenset(data.get("features", ())),
+        )
+
+    def negotiate(self, remote: 'Capabilities') -> 'Capabilities':
+        """
+        Calculates the capabilities both sides can use.
+
+        Headers are decoded by detecting their codec, so each side picks the
+        codec it sends with on its own from the codecs its peer can decode.
+
+        :param remote: The capabilities the peer sent.
+        :return: The negotiated capabilities from the perspective of this side.
+        """
+        codec = next((c for c in self.header_codecs if c in remote.header_codecs), "json")
+
+        sizes = [s for s in (self.max_message_size, remote.max_message_size) if s is not None]
+
+        return Capabilities(
+            version=min(self.version, remote.version),
+            header_codecs=tuple(c for c in self.header_codecs if c in remote.header_codecs),
+            header_codec=codec,
+            max_message_size=min(sizes) if sizes else None,
+            compression=tuple(c for c in self.compression if c in remote.compression),
+            shared_memory=self.shared_memory and remote.shared_memory,
+            features=self.features & remote.features
+        )
+
+
+LEGACY = Capabilities()
+
+
+def local_capabilities(
+        *,
+        max_message_size: Optional[int] = None,
+        compression: Sequence[str] = (),
+        shared_memory: bool = False,
+        features: Sequence[str] = FEATURES
+) -> Capabilities:
+    """
+    Builds the capabilities this process offers.
+
+    The binary header codec is only preferred if it is accelerated.
+    The pure-Python implementation is slower than the json-module.
+    Shared memory is only offered if the interpreter supports it.
+    """
+    if BINARY_CODEC.accelerated:
+        codecs = ("binary", "json")
+    else:
+        codecs = ("json", "binary")
+
+    return Capabilities(
+        version=PROTOCOL_VERSION,
+        header_codecs=codecs,
+        header_codec=codecs[0],
+        max_message_size=max_message_size,
+        compression=tuple(compression),
+        shared_memory=shared_memory and SHARED_MEMORY_AVAILABLE,
+        features=frozenset(features)
+    )
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Yuuno - IPython + VapourSynth
+# Copyright (C) 2019 StuxCrystal (Roland Netzsch <stuxcrystal@encode.moe>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Codecs for the header of a message.
+
+The JSON codec produces the v1 framing. The binary codec encodes the same
+values with a subset of MessagePack and prefixes them with a marker byte
+that can never start a JSON text, so a reader can always tell both apart.
+"""
+import json
+import struct
+from abc import ABC, abstractmethod
+from typing import Mapping, Callable, Any, Tuple, Dict
+
+from yuuno2.networking.base import JSON
+
+try:
+    import msgpack as _msgpack
+except ImportError:
+    _msgpack = None
+
+
+class HeaderCodec(ABC):
+    name: str
+
+    @abstractmethod
+    def encode(self, values: JSON) -> bytes:
+        pass
+
+    @abstractmethod
+    def decode(self, data: bytes) -> JSON:
+        pass
+
+
+class JSONCodec(HeaderCodec):
+    name = "json"
+
+    def encode(self, values: JSON) -> bytes:
+        return json.dumps(values, ensure_ascii=True, separators=(',', ':')).encode("utf-8")
+
+    def decode(self, data: bytes) -> JSON:
+        return json.loads(bytes(data).decode("utf-8"))
+
+
+# 0xC1 is never used by MessagePack and is not valid at the start of a JSON text.
+BINARY_MARKER = b"\xc1"
+
+_u8 = struct.Struct(">B").pack
+_u16 = struct.Struct(">H").pack
+_u32 = struct.Struct(">I").pack
+_u64 = struct.Struct(">Q").pack
+_i8 = struct.Struct(">b").pack
+_i16 = struct.Struct(">h").pack
+_i32 = struct.Struct(">i").pack
+_i64 = struct.Struct(">q").pack
+_f64 = struct.Struct(">d").pack
+
+_POSITIVE_FIXINT = [bytes([i]) for i in range(0x80)]
+_FIXSTR = [bytes([0xa0 | i]) for i in range(32)]
+_FIXARRAY = [bytes([0x90 | i]) for i in range(16)]
+_FIXMAP = [bytes([0x80 | i]) for i in range(16)]
+
+# Keys and method names repeat in every message.
+_STRING_CACHE_SIZE = 1024
+_string_cache: Dict[str, bytes] = {}
+
+
+def _encode_int(value: int) -> bytes:
+    if 0 <= value < 0x80:
+        return _POSITIVE_FIXINT[value]
+    elif -32 <= value < 0:
+        return _u8(value & 0xff)
+    elif value >= 0:
+        if value <= 0xff:
+            return b"\xcc" + _u8(value)
+        elif value <= 0xffff:
+            return b"\xcd" + _u16(value)
+        elif value <= 0xffffffff:
+            return b"\xce" + _u32(value)
+        elif value <= 0xffffffffffffffff:
+            return b"\xcf" + _u64(value)
+        raise ValueError("Integer too large for the binary header.")
+    else:
+        if value >= -0x80:
+            return b"\xd0" + _i8(value)
+        elif value >= -0x8000:
+            return b"\xd1" + _i16(value)
+        elif value >= -0x80000000:
+            return b"\xd2" + _i32(value)
+        elif value >= -0x8000000000000000:
+            return b"\xd3" + _i64(value)
+        raise ValueError("Integer too small for the binary header.")
+
+
+def _encode_str(value: str) -> bytes:
+    encoded = _string_cache.get(value, None)
+    if encoded is not None:
+        return encoded
+
+    data = value.encode("utf-8")
+    length = len(data)
+    if length < 32:
+        encoded = _FIXSTR[length] + data
+        if len(_string_cache) < _STRING_CACHE_SIZE:
+            _string_cache[value] = encoded
+    elif length <= 0xff:
+        encoded = b"\xd9" + _u8(length) + data
+    elif length <= 0xffff:
+        encoded = b"\xda" + _u16(length) + data
+    else:
+        encoded = b"\xdb" + _u32(length) + data
+    return encoded
+
+
+def _encode(value: Any, out: Callable[[bytes], None]):
+    # Check the exact types first, they are by far the most common ones.
+    t = type(value)
+    if t is str:
+        out(_encode_str(value))
+    elif t is int:
+        out(_encode_int(value))
+    elif t is dict:
+        length = len(value)
+        out(_FIXMAP[length] if length < 16 else (b"\xde" + _u16(length) if length <= 0xffff else b"\xdf" + _u32(length)))
+        for k, v in value.items():
+            if type(k) is not str:
+                raise TypeError("Keys must be strings.")
+            out(_encode_str(k))
+            _encode(v, out)
+    elif t is list or t is tuple:
+        length = len(value)
+        out(_FIXARRAY[length] if length < 16 else (b"\xdc" + _u16(length) if length <= 0xffff else b"\xdd" + _u32(length)))
+        for v in value:
+            _encode(v, out)
+    elif value is None:
+        out(b"\xc0")
+    elif value is True:
+        out(b"\xc3")
+    elif value is False:
+        out(b"\xc2")
+    elif t is float:
+        out(b"\xcb" + _f64(value))
+    elif isinstance(value, int):
+        # IntEnums and the like.
+        out(_encode_int(int(value)))
+    elif isinstance(value, float):
+        out(b"\xcb" + _f64(value))
+    elif isinstance(value, str):
+        _encode(str(value), out)
+    elif isinstance(value, Mapping):
+        _encode(dict(value), out)
+    elif isinstance(value, (list, tuple)):
+        _encode(list(value), out)
+    else:
+        raise TypeError(f"Cannot encode {type(value).__name__} in a header.")
+
+
+_CONSTANTS = {0xc0: None, 0xc2: False, 0xc3: True}
+_FIXED: Mapping[int, Tuple[Callable, int]] = {
+    0xca: (struct.Struct(">f").unpack_from, 4),
+    0xcb: (struct.Struct(">d").unpack_from, 8),
+    0xcc: (struct.Struct(">B").unpack_from, 1),
+    0xcd: (struct.Struct(">H").unpack_from, 2),
+    0xce: (struct.Struct(">I").unpack_from, 4),
+    0xcf: (struct.Struct(">Q").unpack_from, 8),
+    0xd0: (struct.Struct(">b").unpack_from, 1),
+    0xd1: (struct.Struct(">h").unpack_from, 2),
+    0xd2: (struct.Struct(">i").unpack_from, 4),
+    0xd3: (struct.Struct(">q").unpack_from, 8),
+}
+_STR, _ARRAY, _MAP = 0xa0, 0x90, 0x80
+_SIZED: Mapping[int, Tuple[Callable, int, int]] = {
+    0xd9: (struct.Struct(">B").unpack_from, 1, _STR),
+    0xda: (struct.Struct(">H").unpack_from, 2, _STR),
+    0xdb: (struct.Struct(">I").unpack_from, 4, _STR),
+    0xdc: (struct.Struct(">H").unpack_from, 2, _ARRAY),
+    0xdd: (struct.Struct(">I").unpack_from, 4, _ARRAY),
+    0xde: (struct.Struct(">H").unpack_from, 2, _MAP),
+    0xdf: (struct.Struct(">I").unpack_from, 4, _MAP),
+}
+
+
+def _decode(data: bytes, pos: int) -> Tuple[Any, int]:
+    op = data[pos]
+    pos += 1
+
+    if op < 0x80:
+        return op, pos
+    elif op < 0xc0:
+        if op >= 0xa0:
+            end = pos + (op & 0x1f)
+            return str(data[pos:end], "utf-8"), end
+        length = op & 0x0f
+        kind = op & 0xf0
+    elif op >= 0xe0:
+        return op - 0x100, pos
+    elif op in _CONSTANTS:
+        return _CONSTANTS[op], pos
+    elif op in _FIXED:
+        unpack, size = _FIXED[op]
+        return unpack(data, pos)[0], pos + size
+    elif op in _SIZED:
+        unpack, size, kind = _SIZED[op]
+        length = unpack(data, pos)[0]
+        pos += size
+        if kind == _STR:
+            end = pos + length
+            return str(data[pos:end], "utf-8"), end
+    else:
+        raise ValueError(f"Unsupported type 0x{op:02x} in binary header.")
+
+    if kind == _ARRAY:
+        result = [None] * length
+        for i in range(length):
+            result[i], pos = _decode(data, pos)
+        return result, pos
+
+    result = {}
+    for _ in range(length):
+        key, pos = _decode(data, pos)
+        result[key], pos = _decode(data, pos)
+    return result, pos
+
+
+class BinaryCodec(HeaderCodec):
+    """
+    Encodes headers with a subset of MessagePack.
+
+    Uses the msgpack-package if it is installed.
+    """
+    name = "binary"
+
+    def __init__(self, accelerated: bool = True):
+        """
+        :param accelerated: Use the msgpack-package if it is available.
+        """
+        self.accelerated = accelerated and _msgpack is not None
+
+    def encode(self, values: JSON) -> bytes:
+        if self.accelerated:
+            return BINARY_MARKER + _msgpack.packb(values, use_bin_type=True)
+
+        out = [BINARY_MARKER]
+        _encode(values, out.append)
+        return b"".join(out)
+
+    def decode(self, data: bytes) -> JSON:
+        if data[:1] != BINARY_MARKER:
+            raise ValueError("Not a binary header.")
+
+        if self.accelerated:
+            return _msgpack.unpackb(memoryview(data)[1:], raw=False)
+
+        value, pos = _decode(data, 1)
+        if pos != len(data):
+            raise ValueError("Trailing data after binary header.")
+        return value
+
+
+JSON_CODEC = JSONCodec()
+BINARY_CODEC = BinaryCodec()
+
+CODECS: Mapping[str, HeaderCodec] = {
+    JSON_CODEC.name: JSON_CODEC,
+    BINARY_CODEC.name: BINARY_CODEC,
+}
+
+
+def decode_header(data: bytes) -> JSON:
+    """
+    Decodes a header regardless of the codec that was used to encode it.
+    """
+    if data[:1] == BINARY_MARKER:
+        return BINARY_CODEC.decode(data)
+    return JSON_CODEC.decode(data)
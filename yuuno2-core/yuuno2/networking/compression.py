@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Yuuno - IPython + VapourSynth
+# Copyright (C) 2019 StuxCrystal (Roland Netzsch <stuxcrystal@encode.moe>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Compression for the blobs of a message.
+
+zlib and lzma are always available. lz4 and zstd are used if the
+lz4 or zstandard packages are installed.
+"""
+import lzma
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from typing import Mapping, Optional, Tuple
+
+from yuuno2.typings import Buffer
+
+try:
+    import lz4.frame as _lz4
+except ImportError:
+    _lz4 = None
+
+try:
+    import zstandard as _zstd
+except ImportError:
+    _zstd = None
+
+
+#: Blobs smaller than this are not worth compressing.
+COMPRESSION_THRESHOLD = 64 * 1024
+
+# Streaming decompressors produce at most this many bytes at once.
+_CHUNK_SIZE = 1024 * 1024
+
+
+def _copy(chunk: bytes, out: memoryview, pos: int) -> int:
+    end = pos + len(chunk)
+    if end > len(out):
+        raise BufferError("Buffer too small.")
+    out[pos:end] = chunk
+    return end
+
+
+class Compressor(ABC):
+    name: str
+
+    @abstractmethod
+    def compress(self, data: Buffer) -> bytes:
+        pass
+
+    @abstractmethod
+    def decompress_into(self, data: Buffer, out: memoryview) -> int:
+        """
+        Decompresses the data directly into the buffer.
+
+        :param data: The compressed data.
+        :param out:  The buffer to write into.
+        :return: The number of bytes written.
+        """
+        pass
+
+
+class ZlibCompressor(Compressor):
+    name = "zlib"
+
+    def __init__(self, level: int = 1):
+        self.level = level
+
+    def compress(self, data: Buffer) -> bytes:
+        return zlib.compress(data, self.level)
+
+    def decompress_into(self, data: Buffer, out: memoryview) -> int:
+        decompressor = zlib.decompressobj()
+        pos = _copy(decompressor.decompress(data, _CHUNK_SIZE), out, 0)
+        while decompressor.unconsumed_tail:
+            pos = _copy(decompressor.decompress(decompressor.unconsumed_tail, _CHUNK_SIZE), out, pos)
+        return _copy(decompressor.flush(), out, pos)
+
+
+class _StreamingCompressor(Compressor, ABC):
+    """
+    Decompresses with decompressor objects that take a max_length like the one of lzma.
+    """
+
+    @abstractmethod
+    def decompressor(self):
+        pass
+
+    def decompress_into(self, data: Buffer, out: memoryview) -> int:
+        decompressor = self.decompressor()
+        pos = _copy(decompressor.decompress(data, _CHUNK_SIZE), out, 0)
+        while not decompressor.eof and not decompressor.needs_input:
+            pos = _copy(decompressor.decompress(b"", _CHUNK_SIZE), out, pos)
+        return pos
+
+
+class LzmaCompressor(_StreamingCompressor):
+    name = "lzma"
+
+    def __init__(self, preset: int = 0):
+        self.preset = preset
+
+    def compress(self, data: Buffer) -> bytes:
+        return lzma.compress(data, preset=self.preset)
+
+    def decompressor(self):
+        return lzma.LZMADecompressor()
+
+
+class Lz4Compressor(_StreamingCompressor):
+    name = "lz4"
+
+    def compress(self, data: Buffer) -> bytes:
+        return _lz4.compress(data)
+
+    def decompressor(self):
+        return _lz4.LZ4FrameDecompressor()
+
+
+class ZstdCompressor(Compressor):
+    name = "zstd"
+
+    def __init__(self, level: int = 1):
+        self.level = level
+        # zstandard objects must not be used by several threads at once
+        # and blobs are compressed in the executor.
+        self._local = threading.local()
+
+    def _context(self) -> threading.local:
+        local = self._local
+        if not hasattr(local, "compressor"):
+            local.compressor = _zstd.ZstdCompressor(level=self.level)
+            local.decompressor = _zstd.ZstdDecompressor()
+        return local
+
+    def compress(self, data: Buffer) -> bytes:
+        return self._context().compressor.compress(data)
+
+    def decompress_into(self, data: Buffer, out: memoryview) -> int:
+        return _copy(self._context().decompressor.decompress(data), out, 0)
+
+
+def _available():
+    # Ordered by preference. The fast codecs come first.
+    if _lz4 is not None:
+        yield Lz4Compressor()
+    if _zstd is not None:
+        yield ZstdCompressor()
+    yield ZlibCompressor()
+    yield LzmaCompressor()
+
+
+COMPRESSORS: Mapping[str, Compressor] = {c.name: c for c in _available()}
+
+#: The names of all available compressors, in the order they are preferred.
+AVAILABLE_COMPRESSION: Tuple[str, ...] = tuple(COMPRESSORS)
+
+
+def compress_blob(compressor: Compressor, data: Buffer, threshold: int = COMPRESSION_THRESHOLD) -> Optional[bytes]:
+    """
+    Compresses a blob if that is worth it.
+
+    :param compressor: The compressor to use.
+    :param data:       The blob.
+    :param threshold:  Smaller blobs are not compressed.
+    :return: The compressed data or None if the blob should be sent as it is.
+    """
+    size = data.nbytes if isinstance(data, memoryview) else len(data)
+    if size < threshold:
+        return None
+
+    compressed = compressor.compress(data)
+    if len(compressed) >= size:
+        return None
+    return compressed
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Yuuno - IPython + VapourSynth
+# Copyright (C) 2019 StuxCrystal (Roland Netzsch <stuxcrystal@encode.moe>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Delta encoding of consecutive frames.
+
+Both sides keep the planes they exchanged last. Instead of the full planes
+the encoder sends the XOR of the new and the last planes, which is mostly
+zero when little changed between two frames and compresses well.
+
+References are identified by an id. A delta is only sent if the decoder
+still holds the reference the delta is based on. Otherwise a keyframe is sent.
+"""
+from itertools import count
+from threading import Lock
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+from yuuno2.typings import Buffer
+
+
+#: Every this many frames a full keyframe is sent.
+KEYFRAME_INTERVAL = 30
+
+
+def _size(data: Buffer) -> int:
+    return data.nbytes if isinstance(data, memoryview) else len(data)
+
+
+def xor_bytes(a: Buffer, b: Buffer) -> bytes:
+    """
+    :return: The XOR of two buffers of the same size.
+    """
+    size = _size(a)
+    if size != _size(b):
+        raise ValueError("Buffers differ in size.")
+    return (int.from_bytes(a, "little") ^ int.from_bytes(b, "little")).to_bytes(size, "little")
+
+
+class DeltaEncoder:
+    """
+    Encodes planes against the planes encoded last for the same key.
+
+    Encoding may happen on executor threads. A lock keeps the references consistent.
+    """
+
+    def __init__(self, keyframe_interval: int = KEYFRAME_INTERVAL):
+        """
+        :param keyframe_interval: Every this many frames a keyframe is sent. 1 only sends keyframes.
+        """
+        self.keyframe_interval = keyframe_interval
+        self.keyframes = 0
+        self.deltas = 0
+
+        self._ids = count(1)
+        # Maps the key to the id of the reference, its planes and the number of deltas since the last keyframe.
+        self._references: Dict[Hashable, Tuple[int, List[bytes], int]] = {}
+        self._lock = Lock()
+
+    def encode(
+            self,
+            key: Hashable,
+            base: Optional[int],
+            planes: Sequence[Buffer]
+    ) -> Tuple[Optional[int], int, List[bytes]]:
+        """
+        Encodes the planes and keeps them as the next reference.
+
+        :param key:    Identifies the stream of frames, e.g. the format.
+        :param base:   The reference the decoder holds or None to request a keyframe.
+        :param planes: The planes to encode.
+        :return: The reference the blobs are based on (None for keyframes), the id
+                 of the new reference and the blobs to send.
+        """
+        current = [bytes(plane) for plane in planes]
+
+        with self._lock:
+            reference = self._references.get(key, None)
+            ref = next(self._ids)
+
+            if (
+                reference is not None
+                and base is not None
+                and reference[0] == base
+                and reference[2] + 1 < self.keyframe_interval
+                and [len(p) for p in reference[1]] == [len(p) for p in current]
+            ):
+                self.deltas += 1
+                self._references[key] = (ref, current, reference[2] + 1)
+            else:
+                self.keyframes += 1
+                self._references[key] = (ref, current, 0)
+                return None, ref, current
+
+        # The reference is never modified, so the XOR does not need the lock.
+        return base, ref, [xor_bytes(c, r) for c, r in zip(current, reference[1])]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._references.clear()
+
+
+class DeltaDecoder:
+
+    def __init__(self):
+        self._references: Dict[Hashable, Tuple[int, List[Buffer]]] = {}
+
+    def reference(self, key: Hashable) -> Optional[int]:
+        """
+        :return: The id of the reference held for the key, if any.
+        """
+        reference = self._references.get(key, None)
+        return reference[0] if reference is not None else None
+
+    def decode(self, key: Hashable, base: Optional[int], ref: int, blobs: Sequence[Buffer]) -> Optional[List[Buffer]]:
+        """
+        Rebuilds the planes and keeps them as the next reference.
+
+        :return: The planes or None if the reference the blobs are based on is not held anymore.
+        """
+        if base is None:
+            planes = list(blobs)
+        else:
+            reference = self._references.get(key, None)
+            if reference is None or reference[0] != base:
+                return None
+            planes = [xor_bytes(b, r) for b, r in zip(blobs, reference[1])]
+
+        self._references[key] = (ref, planes)
+        return planes
+
+    def forget(self, key: Hashable) -> None:
+        self._references.pop(key, None)
+
+    def clear(self) -> None:
+        self._references.clear()
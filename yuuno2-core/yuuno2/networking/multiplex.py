@@ -16,16 +16,118 @@
 #
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
-from asyncio import Lock, Event
-from typing import Optional, MutableMapping, NoReturn
+from asyncio import Event, Future, TimeoutError, CancelledError, get_running_loop, wait_for, shield, sleep
+from collections import deque
+from itertools import count
+from typing import Optional, MutableMapping, NoReturn, Dict, Deque, List, Tuple, Any
 
 from yuuno2.resource_manager import register, Resource
 
-from yuuno2.networking.base import Connection, Message, MessageOutputStream, MessageInputStream
+from yuuno2.networking.base import Connection, Message, MessageOutputStream, MessageInputStream, blobs_size
+from yuuno2.networking.capabilities import Capabilities, LEGACY, FLOW_CONTROL, FRAGMENTS
+from yuuno2.networking.codecs import CODECS, JSON_CODEC
 from yuuno2.networking.reader import ReaderTask
 from yuuno2.networking.pipe import pipe
 
 
+# Older peers answer messages to this target with "close",
+# as they do for any other unknown channel.
+HANDSHAKE_TARGET = "$handshake"
+
+#: How many bytes a channel may send before the peer has to grant new credit.
+CHANNEL_WINDOW = 32 * 1024 * 1024
+
+# Counted for every message so a channel cannot queue unlimited empty messages.
+MESSAGE_COST = 1024
+
+#: Messages with more blob data than this are split into fragments.
+FRAGMENT_SIZE = 1024 * 1024
+
+#: Write priorities. Lower values are written first.
+PRIORITY_CONTROL = 0
+PRIORITY_NORMAL = 1
+
+
+def message_cost(message: Message) -> int:
+    """
+    :return: How much credit sending the message uses up.
+    """
+    return MESSAGE_COST + blobs_size(message)
+
+
+class WriteScheduler:
+    """
+    Hands out turns to write to the parent connection, one at a time.
+
+    Waiting writers with a higher priority go first. Writers with the same
+    priority are served in the order they arrived. As a writer of a fragmented
+    message queues up again after each fragment, channels take turns.
+    """
+
+    def __init__(self):
+        self._busy = False
+        self._waiters: Dict[int, Deque[Future]] = {}
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    async def acquire(self, priority: int = PRIORITY_NORMAL) -> None:
+        if not self._busy and not self.waiting:
+            self._busy = True
+            return
+
+        waiter = get_running_loop().create_future()
+        self._waiters.setdefault(priority, deque()).append(waiter)
+        try:
+            await waiter
+        except CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # We already got the turn. Pass it on.
+                self.release()
+            else:
+                self._waiters[priority].remove(waiter)
+            raise
+
+    def release(self) -> None:
+        for priority in sorted(self._waiters):
+            waiters = self._waiters[priority]
+            while waiters:
+                waiter = waiters.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+                    return
+        self._busy = False
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+class ChannelInputStream(MessageInputStream):
+
+    def __init__(self, channel: 'Channel'):
+        self.channel = channel
+
+    async def read(self) -> Optional[Message]:
+        if self.channel.ingress is None:
+            return None
+
+        message = await self.channel.ingress.input.read()
+        if message is not None:
+            await self.channel.consumed(message)
+        return message
+
+    async def _acquire(self) -> NoReturn:
+        pass
+
+    async def _release(self) -> NoReturn:
+        pass
+
+
 class ChannelOutputStream(MessageOutputStream):
 
     def __init__(self, channel: 'Channel'):
@@ -33,8 +135,12 @@ class ChannelOutputStream(MessageOutputStream):
         register(self.channel, self)
 
     async def write(self, message: Message) -> NoReturn:
+        if not (await self.channel.reserve(message_cost(message))):
+            return
+
         await self.channel.multiplexer.write(
-            Message({'target': self.channel.name, 'type': 'message', 'payload': message.values}, message.blobs)
+            Message({'target': self.channel.name, 'type': 'message', 'payload': message.values}, message.blobs),
+            priority=self.channel.priority
         )
 
     async def close(self) -> NoReturn:
@@ -43,7 +149,10 @@ class ChannelOutputStream(MessageOutputStream):
             await self.channel.ingress.close()
 
         if self.channel.multiplexer.acquired:
-            await self.channel.multiplexer.write(Message({'target': self.channel.name, 'type': 'close'}))
+            await self.channel.multiplexer.write(
+                Message({'target': self.channel.name, 'type': 'close'}),
+                priority=self.channel.priority
+            )
 
     async def _acquire(self) -> NoReturn:
         pass
@@ -54,20 +163,99 @@ class ChannelOutputStream(MessageOutputStream):
 
 class Channel(Connection):
 
-    def __init__(self, multiplexer: 'Multiplexer', name: str):
+    def __init__(self, multiplexer: 'Multiplexer', name: str, priority: int = PRIORITY_NORMAL):
         self._closed = False
 
         self.name = name
         self.multiplexer = multiplexer
+        self.priority = priority
 
         self.ingress: Optional[Connection] = None
         self.egress: Optional[ChannelOutputStream] = None
+        self._input_stream = ChannelInputStream(self)
         self._connection_cache = None
+        self._capabilities: Optional[Capabilities] = None
+
+        # Credit based flow control.
+        self._credit = multiplexer.window
+        self._credit_granted = Event()
+        self._consumed = 0
         super().__init__(None, None)
 
+    @property
+    def flow_control(self) -> bool:
+        return self.multiplexer is not None and self.multiplexer.capabilities.supports(FLOW_CONTROL)
+
+    @property
+    def credit(self) -> int:
+        """
+        :return: How many bytes can be sent before the peer has to grant new credit.
+        """
+        return self._credit
+
+    async def reserve(self, cost: int) -> bool:
+        """
+        Waits until the peer has room for another message.
+
+        A single message may exceed the remaining credit, so
+        messages larger than the window can still be sent.
+
+        :param cost: The cost of the message.
+        :return: False if the channel was closed while waiting.
+        """
+        if not self.flow_control:
+            return True
+
+        while self._credit <= 0:
+            if self._closed:
+                return False
+            self._credit_granted.clear()
+            await self._credit_granted.wait()
+
+        self._credit -= cost
+        return True
+
+    def grant(self, credit: int) -> None:
+        """
+        Called when the peer consumed messages of this channel.
+        """
+        self._credit += credit
+        self._credit_granted.set()
+
+    async def consumed(self, message: Message) -> None:
+        """
+        Grants the peer new credit once enough messages have been read.
+        """
+        if not self.flow_control:
+            return
+
+        self._consumed += message_cost(message)
+        if self._consumed < self.multiplexer.window // 4:
+            return
+
+        credit, self._consumed = self._consumed, 0
+        if not self._closed and self.multiplexer.acquired:
+            await self.multiplexer.write(Message({
+                "target": self.name, "type": "window", "payload": {"credit": credit}
+            }), priority=PRIORITY_CONTROL)
+
+    @property
+    def capabilities(self) -> Optional[Capabilities]:
+        # A multiplexer running on top of this channel negotiates its own set.
+        if self._capabilities is not None:
+            return self._capabilities
+        if self.multiplexer is None:
+            return None
+        return self.multiplexer.capabilities
+
+    @capabilities.setter
+    def capabilities(self, value: Optional[Capabilities]):
+        self._capabilities = value
+
     async def deliver(self, message: Optional[Message]) -> NoReturn:
         if message is None:
             self._closed = True
+            self._credit_granted.set()
             if not self.acquired:
                 return
 
@@ -76,7 +264,7 @@ class Channel(Connection):
 
     @property
     def input(self) -> MessageInputStream:
-        return self.ingress.input
+        return self._input_stream
 
     @input.setter
     def input(self, value): pass
@@ -94,10 +282,14 @@ class Channel(Connection):
 
         self.multiplexer.streams[self.name] = self
 
-        self.ingress: Connection = Connection(*pipe())
+        # Received messages are not reused by the multiplexer, so their blobs are handed over without a copy.
+        self.ingress: Connection = Connection(*pipe(detach=False))
         await self.ingress.acquire()
         register(self, self.ingress)
 
+        await self._input_stream.acquire()
+        register(self, self._input_stream)
+
         self.egress: ChannelOutputStream = ChannelOutputStream(self)
         await self.egress.acquire()
         register(self, self.egress)
@@ -107,8 +299,9 @@ class Channel(Connection):
         if not self._closed and self.multiplexer.acquired:
             await self.multiplexer.write(Message({
                 "target": self.name, "type": "close"
-            }))
+            }), priority=self.priority)
         self._closed = True
+        self._credit_granted.set()
 
         self.multiplexer.streams.pop(self.name, None)
 
@@ -125,7 +318,7 @@ class Channel(Connection):
 
     async def read(self) -> Optional[Message]:
         self._ensure_open()
-        return (await self.ingress.input.read())
+        return (await self.input.read())
 
     async def write(self, message: Message):
         self._ensure_open()
@@ -143,13 +336,38 @@ class Channel(Connection):
 
 class Multiplexer(Resource):
 
-    def __init__(self, parent: Connection):
+    def __init__(
+            self,
+            parent: Connection,
+            capabilities: Optional[Capabilities] = None,
+            *,
+            window: int = CHANNEL_WINDOW,
+            fragment_size: int = FRAGMENT_SIZE
+    ):
+        """
+        :param parent:        The connection to multiplex.
+        :param capabilities:  The capabilities to offer the peer. If omitted, handshakes of the peer
+                              are rejected like an older version would.
+        :param window:        How many bytes each channel may send before the peer grants new credit.
+                              Only used if both sides negotiated flow control.
+        :param fragment_size: How many bytes of blob data a fragment carries at most.
+                              Only used if both sides negotiated fragments.
+        """
+        self.window = window
+        self.fragment_size = fragment_size
         self.streams: MutableMapping[str, Channel] = {}
-        self._w_lock = Lock()
+        self._scheduler = WriteScheduler()
+        self._fragment_ids = count()
+        self._fragments: Dict[Tuple[str, int], List[Any]] = {}
         self._closed = Event()
         self._shutdown = Event()
         self.parent = parent
 
+        self.local_capabilities = capabilities
+        self.capabilities: Capabilities = LEGACY
+        self._negotiated: Optional[Future] = None
+        self._hello_sent = False
+
     async def _delivered(self, raw: Optional[Message]) -> None:
         if not self.acquired:
             return
@@ -163,7 +381,27 @@ class Multiplexer(Resource):
         connection = msg.get("target", "")
         type = msg.get("type", "message")
 
+        if connection == HANDSHAKE_TARGET:
+            await self._handshake_received(type, msg.get("payload", None))
+            return
+
+        if type == "fragment":
+            raw = self._reassemble(connection, msg, buffers)
+            if raw is None:
+                return
+            msg, buffers = raw
+            type = msg.get("type", "message")
+
+        if type == "window":
+            channel = self.streams.get(connection, None)
+            payload = msg.get("payload", None)
+            if channel is not None and isinstance(payload, dict):
+                channel.grant(int(payload.get("credit", 0)))
+            return
+
         if type in ("close", "illegal"):
+            for key in [key for key in self._fragments if key[0] == connection]:
+                del self._fragments[key]
             reader = self.streams.pop(connection, None)
             if reader is None:
                 return
@@ -171,34 +409,215 @@ class Multiplexer(Resource):
             return
 
         if connection not in self.streams:
-            await self.write(Message({"target": connection, "type": "close", "payload": {}}))
+            await self.write(Message({"target": connection, "type": "close", "payload": {}}), priority=PRIORITY_CONTROL)
             return
 
         if "payload" not in msg:
-            await self.write(Message({"target": connection, "type": "illegal", "payload": {}}))
+            await self.write(Message({"target": connection, "type": "illegal", "payload": {}}), priority=PRIORITY_CONTROL)
             return
 
         await self.streams[connection].deliver(Message(msg["payload"], buffers))
         return
 
-    def connect(self, name: str) -> Channel:
-        c = Channel(self, name)
+    def _reassemble(self, connection: str, msg: dict, buffers: List[bytes]) -> Optional[Message]:
+        key = (connection, msg.get("id", None))
+
+        # The first fragment carries the header of the original message.
+        if "message" in msg:
+            sizes = msg.get("sizes", [])
+            self._fragments[key] = [msg["message"], sizes, bytearray(sum(sizes)), 0]
+
+        state = self._fragments.get(key, None)
+        if state is None:
+            return None
+
+        # The writer was cancelled before it sent all fragments.
+        if msg.get("abort", False):
+            del self._fragments[key]
+            return None
+
+        values, sizes, data, offset = state
+        for buffer in buffers:
+            buffer = memoryview(buffer).cast("B")
+            data[offset:offset + buffer.nbytes] = buffer
+            offset += buffer.nbytes
+        state[3] = offset
+
+        if not msg.get("last", False):
+            return None
+        del self._fragments[key]
+
+        view = memoryview(data)
+        blobs = []
+        offset = 0
+        for size in sizes:
+            blobs.append(view[offset:offset + size])
+            offset += size
+        return Message(values, blobs)
+
+    def _fragment(self, message: Message) -> List[Message]:
+        if not self.capabilities.supports(FRAGMENTS) or blobs_size(message) <= self.fragment_size:
+            return [message]
+
+        views = [memoryview(blob).cast("B") for blob in message.blobs]
+        chunks: List[List[memoryview]] = [[]]
+        free = self.fragment_size
+        for view in views:
+            while view.nbytes > 0:
+                if free == 0:
+                    chunks.append([])
+                    free = self.fragment_size
+                part, view = view[:free], view[free:]
+                chunks[-1].append(part)
+                free -= part.nbytes
+
+        target = message.values.get("target", "")
+        fragment_id = next(self._fragment_ids)
+        fragments = []
+        for index, chunk in enumerate(chunks):
+            header = {"target": target, "type": "fragment", "id": fragment_id, "last": index == len(chunks) - 1}
+            if index == 0:
+                header["message"] = message.values
+                header["sizes"] = [view.nbytes for view in views]
+            fragments.append(Message(header, chunk))
+        return fragments
+
+    async def _handshake_received(self, type: str, payload) -> None:
+        if self.local_capabilities is None:
+            if type == "hello":
+                await self.write(
+                    Message({"target": HANDSHAKE_TARGET, "type": "close", "payload": {}}),
+                    priority=PRIORITY_CONTROL
+                )
+            return
+
+        if self._negotiated.done():
+            return
+
+        if type != "hello" or not isinstance(payload, dict):
+            self._negotiate(LEGACY)
+            return
+
+        try:
+            remote = Capabilities.from_json(payload)
+        except (TypeError, ValueError):
+            self._negotiate(LEGACY)
+            return
+
+        # Answer with our own capabilities if the peer started the handshake.
+        if not self._hello_sent:
+            await self._send_hello()
+
+        self._negotiate(self.local_capabilities.negotiate(remote))
+
+    async def _send_hello(self) -> None:
+        self._hello_sent = True
+        # The hello is always sent as JSON so every peer can read it.
+        await self.write(Message({
+            "target": HANDSHAKE_TARGET, "type": "hello", "payload": self.local_capabilities.to_json()
+        }), priority=PRIORITY_CONTROL)
+
+    def _negotiate(self, capabilities: Capabilities) -> None:
+        self.capabilities = capabilities
+        self.parent.capabilities = capabilities
+        self.parent.set_header_codec(CODECS.get(capabilities.header_codec, JSON_CODEC))
+        if not self._negotiated.done():
+            self._negotiated.set_result(capabilities)
+
+    async def handshake(self, timeout: float = 5) -> Capabilities:
+        """
+        Offers our capabilities to the peer and waits for its answer.
+
+        Only one side of a connection starts the handshake. The other side
+        answers automatically when it was constructed with capabilities.
+        Peers that do not know the handshake, or do not answer within the timeout,
+        are treated as legacy peers.
+
+        :param timeout: How long to wait for the peer at most.
+        :return: The negotiated capabilities.
+        """
+        await self.ensure_acquired()
+        if self.local_capabilities is None:
+            return self.capabilities
+
+        if not self._hello_sent:
+            await self._send_hello()
+
+        try:
+            return await wait_for(shield(self._negotiated), timeout)
+        except TimeoutError:
+            self._negotiate(LEGACY)
+            return self.capabilities
+
+    def connect(self, name: str, priority: int = PRIORITY_NORMAL) -> Channel:
+        """
+        :param name:     The name of the channel. Both sides have to use the same name.
+        :param priority: The priority of messages written to this channel.
+        """
+        c = Channel(self, name, priority)
         register(self, c)
         return c
 
-    async def write(self, message: Message):
+    async def write(self, message: Message, *, priority: int = PRIORITY_NORMAL):
+        """
+        Writes a message to the parent connection.
+
+        If both sides support fragments, large messages are written in fragments.
+        Other writers get their turn between two fragments. When the writer is
+        cancelled in between, the peer drops the fragments it already received.
+
+        :param message:  The message to write.
+        :param priority: Writers with a lower value are served first.
+        """
         await self.ensure_acquired()
-        async with self._w_lock:
+        fragments = self._fragment(message)
+        started = 0
+        written = 0
+        try:
+            for fragment in fragments:
+                if written > 0:
+                    # Let the other writers queue up.
+                    await sleep(0)
+
+                await self._scheduler.acquire(priority)
+                try:
+                    # Once the write started the fragment may reach the peer, even if it is cancelled.
+                    started += 1
+                    await self.parent.write(fragment)
+                finally:
+                    self._scheduler.release()
+                written += 1
+
+        except CancelledError:
+            # Tell the peer to drop the fragments it might have received.
+            # Aborts for messages the peer already completed are ignored.
+            if len(fragments) > 1 and started > 0 and written < len(fragments) and self.acquired:
+                first = fragments[0].values
+                await self._write_control(Message({
+                    "target": first["target"], "type": "fragment", "id": first["id"], "last": True, "abort": True
+                }))
+            raise
+
+    async def _write_control(self, message: Message) -> None:
+        await self._scheduler.acquire(PRIORITY_CONTROL)
+        try:
             await self.parent.write(message)
+        finally:
+            self._scheduler.release()
 
     async def close(self):
         await self.ensure_acquired()
-        async with self._w_lock:
+        await self._scheduler.acquire(PRIORITY_CONTROL)
+        try:
             await self.parent.close()
             self._closed.set()
+        finally:
+            self._scheduler.release()
 
     async def _acquire(self):
         await self.parent.acquire()
+        self._negotiated = get_running_loop().create_future()
+
         _task = ReaderTask(self.parent.input, self._delivered)
 
         register(self, _task)
@@ -20,19 +20,106 @@ from asyncio import Queue, Event, ALL_COMPLETED, wait, ensure_future
 from typing import NoReturn, Optional, Tuple, Awaitable
 
 from yuuno2.asyncutils import dynamic_timeout
-from yuuno2.networking.base import MessageInputStream, Message, MessageOutputStream, Connection
+from yuuno2.networking.base import MessageInputStream, Message, MessageOutputStream, Connection, blobs_size
 from yuuno2.resource_manager import Resource, register
 
 
 class PipeData(Resource):
-
-    def __init__(self):
+    """
+    The queue behind a pipe.
+
+    By default the queue is unbounded. With limits, writers wait once the queue holds
+    ``max_messages`` messages or ``max_bytes`` bytes of blobs (the high watermark) until
+    the readers drained it below ``low_water`` bytes again.
+    """
+
+    def __init__(
+            self,
+            max_messages: Optional[int] = None,
+            max_bytes: Optional[int] = None,
+            low_water: Optional[int] = None
+    ):
+        """
+        :param max_messages: How many messages may be queued at most.
+        :param max_bytes:    How many bytes of blobs may be queued before writers have to wait.
+                             A single message may exceed this limit if the queue is empty.
+        :param low_water:    Writers continue once fewer bytes are queued. Defaults to half of max_bytes.
+        """
         self._tasks = set()
         self.queue = Queue()
         self.closed = Event()
 
+        self.max_messages = max_messages
+        self.high_water = max_bytes
+        self.low_water = low_water if low_water is not None or max_bytes is None else max_bytes // 2
+
+        self.queued_bytes = 0
+        self.peak_bytes = 0
+        self.peak_messages = 0
+        self.pauses = 0
+
+        self._writable = Event()
+        self._writable.set()
+
+    @property
+    def queued_messages(self) -> int:
+        return self.queue.qsize()
+
+    def _is_full(self, size: int) -> bool:
+        if self.max_messages is not None and self.queue.qsize() >= self.max_messages:
+            return True
+        if self.high_water is not None and self.queued_bytes > 0 and self.queued_bytes + size > self.high_water:
+            return True
+        return False
+
+    def _can_resume(self) -> bool:
+        if self.max_messages is not None and self.queue.qsize() >= self.max_messages:
+            return False
+        if self.low_water is not None and self.queued_bytes > self.low_water:
+            return False
+        return True
+
+    async def put(self, message: Optional[Message]) -> None:
+        """
+        Queues the message and waits while the queue is full.
+        """
+        size = 0 if message is None else blobs_size(message)
+
+        while self._is_full(size):
+            if self.closed.is_set():
+                return
+
+            if self._writable.is_set():
+                self.pauses += 1
+            self._writable.clear()
+            await self._writable.wait()
+
+        self.queue.put_nowait(message)
+        self.queued_bytes += size
+        self.peak_bytes = max(self.peak_bytes, self.queued_bytes)
+        self.peak_messages = max(self.peak_messages, self.queue.qsize())
+
+    def _taken(self, message: Optional[Message]) -> Optional[Message]:
+        if message is not None:
+            self.queued_bytes -= blobs_size(message)
+
+        if not self._writable.is_set() and self._can_resume():
+            self._writable.set()
+        return message
+
+    def close(self) -> None:
+        self.closed.set()
+        # Let waiting writers notice.
+        self._writable.set()
+
+    def get_nowait(self) -> Optional[Message]:
+        return self._taken(self.queue.get_nowait())
+
+    async def _get(self) -> Optional[Message]:
+        return self._taken(await self.queue.get())
+
     def next_message(self) -> Awaitable[Optional[Message]]:
-        task = ensure_future(self.queue.get())
+        task = ensure_future(self._get())
         self._tasks.add(task)
         task.add_done_callback(lambda f: self._tasks.remove(task))
         return task
@@ -41,7 +128,7 @@ class PipeData(Resource):
         pass
 
     async def _release(self) -> NoReturn:
-        self.closed.set()
+        self.close()
         if len(self._tasks) > 0:
             for t in self._tasks:
                 t.cancel()
@@ -55,7 +142,7 @@ class PipeInputStream(MessageInputStream):
 
     async def read(self) -> Optional[Message]:
         if not self.pipe.queue.empty():
-            return self.pipe.queue.get_nowait()
+            return self.pipe.get_nowait()
 
         if self.pipe.closed.is_set():
             return None
@@ -72,19 +159,37 @@ class PipeInputStream(MessageInputStream):
         self.pipe = None
 
 
+def _detach(message: Optional[Message]) -> Optional[Message]:
+    # Writers may reuse the memory behind a memoryview as soon as write()
+    # returns. As a pipe hands over the message itself, take a snapshot.
+    if message is None or not any(isinstance(blob, memoryview) for blob in message.blobs):
+        return message
+
+    return Message(
+        message.values,
+        [bytes(blob) if isinstance(blob, memoryview) else blob for blob in message.blobs]
+    )
+
+
 class PipeOutputStream(MessageOutputStream):
 
-    def __init__(self, pipe: PipeData):
+    def __init__(self, pipe: PipeData, *, detach: bool = True):
+        """
+        :param pipe:   The queue to write into.
+        :param detach: Copy memoryview blobs on write. Only disable this if the
+                       writer never reuses the memory behind its messages.
+        """
         self.pipe = pipe
+        self.detach = detach
 
     async def write(self, message: Message) -> NoReturn:
         if self.pipe.closed.is_set():
             return
 
-        await self.pipe.queue.put(message)
+        await self.pipe.put(_detach(message) if self.detach else message)
 
     async def close(self) -> NoReturn:
-        self.pipe.closed.set()
+        self.pipe.close()
 
     async def _acquire(self) -> NoReturn:
         await self.pipe.acquire()
@@ -99,17 +204,25 @@ class PipeOutputStream(MessageOutputStream):
         self.pipe = None
 
 
-def pipe() -> Tuple[PipeInputStream, PipeOutputStream]:
-    data = PipeData()
+def pipe(*, detach: bool = True, **limits: Optional[int]) -> Tuple[PipeInputStream, PipeOutputStream]:
+    """
+    Creates a pipe. The limits are passed to :class:`PipeData`.
+
+    :param detach: Copy memoryview blobs on write. See :class:`PipeOutputStream`.
+    """
+    data = PipeData(**limits)
     return (
         PipeInputStream(data),
-        PipeOutputStream(data)
+        PipeOutputStream(data, detach=detach)
     )
 
 
-def pipe_bidi() -> Tuple[Connection, Connection]:
-    p1 = PipeData()
-    p2 = PipeData()
+def pipe_bidi(**limits: Optional[int]) -> Tuple[Connection, Connection]:
+    """
+    Creates two connections talking to each other. The limits are passed to :class:`PipeData`.
+    """
+    p1 = PipeData(**limits)
+    p2 = PipeData(**limits)
 
     c1 = Connection(
         PipeInputStream(p1),
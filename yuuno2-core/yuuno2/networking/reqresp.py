@@ -17,11 +17,13 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import inspect
-from asyncio import Future, get_running_loop
+from asyncio import Future, Semaphore, Task, CancelledError, TimeoutError, get_running_loop, gather, wait_for, shield, sleep
+from dataclasses import dataclass
 from traceback import format_exception
-from typing import List, Mapping, Awaitable, Callable, Optional, MutableMapping, Union, cast
+from typing import List, Mapping, Awaitable, Callable, Optional, MutableMapping, Union, Set, Dict, Tuple, cast
 
-from yuuno2.networking.base import Connection, Message, JSON
+from yuuno2.networking.base import Connection, Message, JSON, blobs_size
+from yuuno2.networking.capabilities import BATCH
 from yuuno2.networking.reader import ReaderTask
 from yuuno2.resource_manager import register
 
@@ -30,6 +32,70 @@ class ReqRespServerException(Exception): pass
 class CallFailed(RuntimeError): pass
 
 
+@dataclass
+class RequestStats:
+    """
+    Counters of a request-response endpoint.
+    """
+
+    #: Number of requests sent (client) or received (server).
+    requests: int = 0
+
+    #: Number of requests that were cancelled before a response was sent.
+    cancelled: int = 0
+
+    #: Bytes of responses the server had ready but dropped because their request was cancelled.
+    avoided_bytes: int = 0
+
+    #: Bytes of responses the client received for requests it had already cancelled.
+    wasted_bytes: int = 0
+
+    #: Number of calls that timed out (client) or requests dropped because their deadline passed (server).
+    expired: int = 0
+
+
+# Marks that the call uses the default timeout of the client.
+DEFAULT = object()
+
+Responder = Callable[[Message], Awaitable[None]]
+
+
+def pack_batch(key: str, messages: List[Message]) -> Message:
+    """
+    Packs several messages into one.
+
+    :param key:      The key of the list of messages, "requests" or "responses".
+    :param messages: The messages to pack.
+    :return: A single batch message.
+    """
+    entries = []
+    blobs = []
+    for message in messages:
+        entries.append(dict(message.values, blobs=len(message.blobs)))
+        blobs.extend(message.blobs)
+    return Message({"type": "batch", key: entries}, blobs)
+
+
+def unpack_batch(entries: List[JSON], buffers: List[bytes]) -> List[Message]:
+    """
+    Reverses :func:`pack_batch`.
+
+    :param entries: The list of messages in the batch.
+    :param buffers: The blobs of the batch message.
+    :return: The original messages.
+    """
+    messages = []
+    offset = 0
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        entry = dict(entry)
+        count = entry.pop("blobs", 0)
+        messages.append(Message(entry, buffers[offset:offset + count]))
+        offset += count
+    return messages
+
+
 class function(object):
 
     def __init__(self):
@@ -41,29 +107,165 @@ class function(object):
     def __get__(self, instance, owner) -> Callable[..., Awaitable[Message]]:
         def _wrapper(**kwargs):
             buffers = kwargs.pop("_buffers", [])
-            return instance._call(self.name, buffers, kwargs)
+            timeout = kwargs.pop("_timeout", DEFAULT)
+            return instance._call(self.name, buffers, kwargs, timeout=timeout)
         _wrapper.__name__ = self.name
         return _wrapper
 
 
 class ReqRespClient(Connection):
+    """
+    Calls the methods of a ReqRespServer.
 
-    def __init__(self, parent: Connection):
+    Calls can be given a timeout with the ``_timeout`` keyword. Calls without one use
+    the default timeout of the client. The timeout is sent with the request, so the server
+    can drop requests the client does not wait for anymore.
+
+    If the server supports batches, calls made during the same iteration of the
+    event loop are sent in a single message.
+    """
+
+    #: The default number of seconds to wait for a response. None waits forever.
+    TIMEOUT: Optional[float] = None
+
+    def __init__(self, parent: Connection, *, timeout: Optional[float] = None):
+        """
+        :param parent:  The connection to the server.
+        :param timeout: The default timeout of calls in seconds.
+        """
         self.parent = parent
+        self.timeout = timeout if timeout is not None else self.TIMEOUT
+        self.stats = RequestStats()
         self._waiters: MutableMapping[int, Future[Message]] = {}
+        self._cancelled: Set[int] = set()
         self._current_id = 0
+
+        self._batch: Optional[List[Message]] = None
+        self._batch_written: Optional[Future] = None
+        self._flush_task: Optional[Task] = None
         super().__init__(parent.input, parent.output)
 
-    async def _call(self, funcname: str, buffers: List[bytes], params: Mapping[str, JSON]) -> Awaitable[Message]:
+    @property
+    def batching(self) -> bool:
+        capabilities = self.parent.capabilities
+        return capabilities is not None and capabilities.supports(BATCH)
+
+    async def _send(self, message: Message) -> None:
+        if not self.batching:
+            await self.write(message)
+            return
+
+        if self._batch is None:
+            self._batch = []
+            self._batch_written = get_running_loop().create_future()
+            # Runs after the calls that are already scheduled for this iteration.
+            self._flush_task = get_running_loop().create_task(self._flush())
+
+        self._batch.append(message)
+        await shield(self._batch_written)
+
+    def _unqueue(self, message: Message) -> bool:
+        """
+        Removes a message from the batch if the batch has not been flushed yet.
+
+        :return: True if the message will not be sent.
+        """
+        if self._batch is None:
+            return False
+
+        for index, queued in enumerate(self._batch):
+            if queued is message:
+                del self._batch[index]
+                return True
+        return False
+
+    async def _flush(self) -> None:
+        # Calls cancelled during this iteration only see their cancellation once their
+        # task runs again. Give them that chance to leave the batch before it is sent.
+        await sleep(0)
+
+        batch, self._batch = self._batch, None
+        written, self._batch_written = self._batch_written, None
+
+        try:
+            if not batch:
+                # Every call of the batch has been cancelled.
+                pass
+            elif len(batch) == 1:
+                await self.write(batch[0])
+            else:
+                await self.write(pack_batch("requests", batch))
+        except BaseException as e:
+            written.set_exception(e)
+            # Retrieved here in case every caller has been cancelled already.
+            written.exception()
+        else:
+            written.set_result(None)
+
+    async def _call(
+            self,
+            funcname: str,
+            buffers: List[bytes],
+            params: Mapping[str, JSON],
+            *,
+            timeout: Optional[float] = DEFAULT
+    ) -> Awaitable[Message]:
+        if timeout is DEFAULT:
+            timeout = self.timeout
+
+        loop = get_running_loop()
+        deadline = loop.time() + timeout if timeout is not None else None
+
         cid = self._current_id
         self._current_id += 1
 
-        future = get_running_loop().create_future()
+        future = loop.create_future()
         self._waiters[cid] = future
 
-        await self.write(Message({"method": funcname, "type": "request", "id": cid, "params": params}, buffers))
+        request = {"method": funcname, "type": "request", "id": cid, "params": params}
+        if deadline is not None:
+            # Clocks of both sides may differ, so the server is told the time that is left.
+            request["timeout"] = timeout
+        message = Message(request, buffers)
+
+        batched = self.batching
+        try:
+            if deadline is None:
+                await self._send(message)
+            else:
+                await wait_for(self._send(message), timeout)
+        except BaseException:
+            if batched and not self._unqueue(message):
+                # The batch is already on its way, so the server will see the request.
+                await self._cancel(cid)
+            else:
+                self._waiters.pop(cid, None)
+            raise
+        self.stats.requests += 1
+
+        try:
+            if deadline is None:
+                return (await future)
+            return (await wait_for(future, deadline - loop.time()))
+        except TimeoutError:
+            self.stats.expired += 1
+            await self._cancel(cid)
+            raise
+        except CancelledError:
+            await self._cancel(cid)
+            raise
+
+    async def _cancel(self, cid: int) -> None:
+        # Tell the server to stop working on the request, unless it already answered.
+        if self._waiters is None or self._waiters.pop(cid, None) is None:
+            return
 
-        return (await future)
+        self.stats.cancelled += 1
+        self._cancelled.add(cid)
+        try:
+            await self.write(Message({"type": "cancel", "id": cid}))
+        except ConnectionError:
+            self._cancelled.discard(cid)
 
     async def _delivered(self, raw: Optional[Message]):
         if raw is None:
@@ -74,12 +276,39 @@ class ReqRespClient(Connection):
             return
 
         msg, buffers = raw
+        if msg.get("type", None) == "batch":
+            for response in unpack_batch(msg.get("responses", []), buffers):
+                self._deliver_response(*response)
+            return
+
+        self._deliver_response(msg, buffers)
+
+    def response_discarded(self, message: Message) -> None:
+        """
+        Called when a response arrives for a call that has been cancelled or timed out.
+
+        Nobody waits for the message anymore, so resources it refers to
+        have to be freed here.
+
+        :param message: The response that has been discarded.
+        """
+        pass
+
+    def _deliver_response(self, msg: JSON, buffers: List[bytes]) -> None:
         if "id" not in msg:
             return
 
         id = msg["id"]
         future: Future[Message] = self._waiters.pop(id, None)
         if future is None:
+            # The server answers cancelled requests exactly once, either
+            # with the response it was already sending or by confirming the cancellation.
+            if id in self._cancelled:
+                self._cancelled.discard(id)
+                if msg.get("type", None) == "response":
+                    message = Message(msg.get("result", None), buffers)
+                    self.stats.wasted_bytes += blobs_size(message)
+                    self.response_discarded(message)
             return
 
         if "type" not in msg:
@@ -101,26 +330,204 @@ class ReqRespClient(Connection):
         await reader.acquire()
 
     async def _release(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
         await self.parent.release(force=False)
 
 
 class ReqRespServer(Connection):
-
-    def __init__(self, parent: Connection):
+    """
+    Dispatches incoming requests to the on_<method> handlers.
+
+    Every request runs in its own task. At most ``max_concurrency`` requests are in flight
+    at the same time; up to ``max_pending`` more wait for their turn. Once both limits are
+    reached, the reader stops pulling new messages until a request finishes, so a fast
+    client cannot queue up an unbounded amount of work. ``method_concurrency`` additionally
+    limits single methods. Responses are sent as soon as they are ready and are matched to
+    their requests by their id.
+
+    The client can cancel a request while it is waiting or running. Its task is cancelled,
+    no response is sent and the server confirms the cancellation with a "cancelled" message.
+    Requests whose timeout passed while they waited for their turn are not started at all.
+
+    Requests sent in a batch are handled like single requests. Their responses are
+    sent on their own as soon as each of them is ready.
+    """
+
+    #: Number of requests that may be handled at the same time.
+    MAX_CONCURRENCY: int = 1
+
+    #: Number of requests that may wait for their turn before the reader stops reading.
+    MAX_PENDING: int = 16
+
+    #: Optional limits for single methods. Maps the method name to the limit.
+    METHOD_CONCURRENCY: Mapping[str, int] = {}
+
+    def __init__(
+            self,
+            parent: Connection,
+            *,
+            max_concurrency: Optional[int] = None,
+            max_pending: Optional[int] = None,
+            method_concurrency: Optional[Mapping[str, int]] = None
+    ):
         self.parent = parent
+        self.max_concurrency = max_concurrency if max_concurrency is not None else self.MAX_CONCURRENCY
+        self.max_pending = max_pending if max_pending is not None else self.MAX_PENDING
+        self.method_concurrency = dict(self.METHOD_CONCURRENCY)
+        if method_concurrency is not None:
+            self.method_concurrency.update(method_concurrency)
+
+        self.stats = RequestStats()
+
+        self._slots: Optional[Semaphore] = None
+        self._admission: Optional[Semaphore] = None
+        self._method_slots: Dict[str, Semaphore] = {}
+        self._tasks: Set[Task] = set()
+        self._requests: Dict[Union[int, str], Tuple[Task, Responder]] = {}
         super().__init__(parent.input, parent.output)
 
     async def _acquire(self):
         await self.parent.acquire()
         register(self.parent, self)
 
-        task = ReaderTask(self.parent.input, self.handle_single_request)
+        self._slots = Semaphore(self.max_concurrency)
+        self._admission = Semaphore(self.max_concurrency + self.max_pending)
+        self._method_slots = {
+            method.lower(): Semaphore(limit)
+            for method, limit in self.method_concurrency.items()
+        }
+
+        task = ReaderTask(self.parent.input, self.dispatch_request)
         await task.acquire()
         register(self, task)
 
     async def _release(self):
+        await self.cancel_requests()
         await self.parent.release(force=False)
 
+    async def cancel_requests(self):
+        """
+        Cancels all requests that are currently being handled.
+        """
+        tasks, self._tasks = self._tasks, set()
+        self._requests.clear()
+        for task in tasks:
+            task.cancel()
+        await gather(*tasks, return_exceptions=True)
+
+    async def dispatch_request(self, raw: Optional[Message]):
+        if raw is None:
+            return
+
+        msg = raw.values if isinstance(raw.values, dict) else {}
+        id = msg.get("id", None)
+        if not isinstance(id, (int, str)):
+            id = None
+
+        # Cancellations are handled right away, so they can reach requests that still wait for their turn.
+        if msg.get("type", None) == "cancel" and id is not None:
+            await self.cancel_request(id)
+            return
+
+        if msg.get("type", None) == "batch":
+            requests = unpack_batch(msg.get("requests", []), raw.blobs)
+            for request in requests:
+                await self._admission.acquire()
+                # Each response is sent once it is ready, so slow requests do not hold back the others.
+                self._start_request(request, self._send_response)
+            return
+
+        # Stop reading while too many requests are in flight or waiting.
+        await self._admission.acquire()
+        self._start_request(raw, self._send_response)
+
+    def _start_request(self, raw: Message, respond: Responder) -> None:
+        """
+        Starts the task of a request. The caller must have acquired an admission slot.
+        """
+        loop = get_running_loop()
+        timeout = raw.values.get("timeout", None) if isinstance(raw.values, dict) else None
+        deadline = loop.time() + timeout if isinstance(timeout, (int, float)) else None
+
+        id = raw.values.get("id", None) if isinstance(raw.values, dict) else None
+        if not isinstance(id, (int, str)):
+            id = None
+
+        self.stats.requests += 1
+        task = loop.create_task(self._run_request(raw, deadline, respond))
+        self._tasks.add(task)
+        if id is not None:
+            self._requests[id] = (task, respond)
+        task.add_done_callback(lambda t: self._request_done(t, id))
+
+    async def cancel_request(self, id: Union[int, str]) -> None:
+        """
+        Cancels a request on behalf of the client.
+
+        :param id: The id of the request.
+        """
+        task, respond = self._requests.pop(id, (None, None))
+        if task is None or not task.cancel():
+            # The response has already been sent.
+            return
+
+        await gather(task, return_exceptions=True)
+        if task.cancelled():
+            self.stats.cancelled += 1
+            await respond(Message({'id': id, 'type': 'cancelled'}))
+
+    def _request_done(self, task: Task, id: Optional[Union[int, str]]):
+        self._admission.release()
+        self._tasks.discard(task)
+        if id in self._requests and self._requests[id][0] is task:
+            del self._requests[id]
+
+        # The connection might have died while writing the response.
+        # There is no one left to report this to.
+        if not task.cancelled():
+            task.exception()
+
+    async def _run_request(self, raw: Message, deadline: Optional[float], respond: Responder):
+        method = raw.values.get("method") if isinstance(raw.values, dict) else None
+        slots = self._method_slots.get(method.lower()) if isinstance(method, str) else None
+
+        if slots is None:
+            async with self._slots:
+                await self._run_before(raw, deadline, respond)
+            return
+
+        # Requests waiting for their method must not hold a global slot
+        # or they would starve the other methods.
+        async with slots:
+            async with self._slots:
+                await self._run_before(raw, deadline, respond)
+
+    async def _run_before(self, raw: Message, deadline: Optional[float], respond: Responder):
+        if deadline is not None and get_running_loop().time() >= deadline:
+            # The client stopped waiting for the response.
+            self.stats.expired += 1
+            await respond(Message({'id': raw.values.get("id"), 'type': 'error', 'error': 'Deadline exceeded.'}))
+            return
+
+        await self.handle_single_request(raw, respond)
+
+    async def _send_response(self, message: Message) -> None:
+        sent = False
+        try:
+            await self.write(message)
+            sent = True
+        except CancelledError:
+            self.stats.avoided_bytes += blobs_size(message)
+            raise
+        finally:
+            # A write that did not finish might still be referenced by the transport.
+            if sent:
+                self.response_sent(message)
+            else:
+                self.response_dropped(message)
+
     async def handle_request(self, id, msg: JSON, buffers: List[bytes]):
         try:
             if "method" not in msg:
@@ -144,18 +551,50 @@ class ReqRespServer(Connection):
         except ReqRespServerException:
             raise
 
+        except CancelledError:
+            # Before Python 3.8 CancelledError is an Exception.
+            raise
+
         except Exception as e:
             exc = ''.join(format_exception(type(e), e, e.__traceback__))
             raise ReqRespServerException("An error occured while executing the function:\n" + exc) from None
 
-    async def handle_single_request(self, raw: Optional[Message]):
+    def response_sent(self, message: Message) -> None:
+        """
+        Called after a response has been written to the connection.
+
+        From this point on the connection does not reference the blobs
+        of the message anymore so their buffers can be reused. This relies on
+        the contract of :meth:`MessageOutputStream.write`.
+
+        :param message: The message that has been sent.
+        """
+        pass
+
+    def response_dropped(self, message: Message) -> None:
+        """
+        Called when a response is not sent because its request was cancelled
+        or writing it failed.
+
+        The client never sees the message, so resources it refers to
+        have to be freed here. The connection might still reference the blobs
+        of a write that was interrupted, so their buffers must not be reused.
+
+        :param message: The response that has been dropped.
+        """
+        pass
+
+    async def handle_single_request(self, raw: Optional[Message], respond: Optional[Responder] = None):
         if raw is None:
             return
 
+        if respond is None:
+            respond = self._send_response
+
         msg, buffers = raw
 
         if "id" not in msg:
-            await self.write(Message({
+            await respond(Message({
                 'id': None,
                 'type': 'error',
                 'error': 'ID missing from request-response.'
@@ -171,10 +610,10 @@ class ReqRespServer(Connection):
 
             if type == "request":
                 result: Message = await self.handle_request(id, msg, buffers)
-                await self.write(result)
+                await respond(result)
 
             else:
                 raise ReqRespServerException('Type missing from frame.')
 
         except ReqRespServerException as e:
-            await self.write(Message({'id': id, 'type': 'error', 'error': str(e)}))
+            await respond(Message({'id': id, 'type': 'error', 'error': str(e)}))
@@ -16,73 +16,124 @@
 #
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
-import json
 import array
 import itertools
 import sys
 from abc import abstractmethod, ABC
 from asyncio import Queue
-from typing import NoReturn, Optional
+from typing import NoReturn, Optional, List, Sequence
 
 from yuuno2.networking.base import Message, MessageOutputStream, MessageInputStream
-from yuuno2.sans_io import protocol, read_exactly, emit, Consumer
+from yuuno2.networking.codecs import HeaderCodec, JSON_CODEC, decode_header
+from yuuno2.sans_io import protocol, read_exactly, read_into, emit, Consumer
+from yuuno2.typings import Buffer
+
+
+# The wire format uses 32 bit lengths. 'L' is 64 bit wide on most
+# LP64 platforms, so use the fixed 4-byte code instead.
+HEADER_TYPECODE = 'I'
+
+
+def _byte_length(part: Buffer) -> int:
+    if isinstance(part, memoryview):
+        return part.nbytes
+    return len(part)
+
+
+async def _read_blob(length: int, direct: bool) -> Buffer:
+    if not direct:
+        return await read_exactly(length)
+
+    view = memoryview(bytearray(length))
+    await read_into(view)
+    return view
 
 
 @protocol
-async def bytes_protocol():
+async def bytes_protocol(direct_blobs: bool = False):
+    """
+    Parses messages from a byte stream.
+
+    :param direct_blobs: Preallocate a buffer for each blob and copy the incoming data into it
+                         exactly once. The blobs of the message are then memoryviews of these buffers.
+    """
     try:
         while True:
             sz: bytes = await read_exactly(4)
             length = int.from_bytes(sz, 'big')
 
             hdr = await read_exactly(length*4)
-            ary = array.array('L')
+            ary = array.array(HEADER_TYPECODE)
             ary.frombytes(hdr)
             if sys.byteorder != "big":
                 ary.byteswap()
 
-            text, *buffers = [(await read_exactly(l)) for l in ary]
+            text = await read_exactly(ary[0])
+            buffers = [(await _read_blob(l, direct_blobs)) for l in ary[1:]]
 
-            text = text.decode("utf-8")
-            text = json.loads(text)
-
-            await emit(Message(text, buffers))
+            # The header codec is detected from the data,
+            # so the peer can switch codecs at any message.
+            await emit(Message(decode_header(text), buffers))
     except ConnectionResetError:
         pass
 
 
 class ByteOutputStream(MessageOutputStream, ABC):
+    header_codec: HeaderCodec = JSON_CODEC
 
     @staticmethod
-    def write_message(message: Message) -> bytes:
-        parts = [None]
-
+    def encode_message(message: Message, codec: HeaderCodec = JSON_CODEC) -> List[Buffer]:
+        """
+        Encodes the message without joining its parts.
+
+        :param message: The message to encode.
+        :param codec:   The codec for the header values.
+        :return: The length-header, the encoded values and the blobs of the message.
+        """
         text, buffers = message
-        parts.append(json.dumps(text, ensure_ascii=True, separators=(',', ':')).encode("utf-8"))
+        parts = [None, codec.encode(text)]
         parts.extend(buffers)
 
         hdr = array.array(
-            'L',
-            [len(parts)-1] + [len(part) for part in itertools.islice(parts, 1, None, None)]
+            HEADER_TYPECODE,
+            [len(parts)-1] + [_byte_length(part) for part in itertools.islice(parts, 1, None, None)]
         )
         if sys.byteorder != "big":
             hdr.byteswap()
         parts[0] = hdr.tobytes()
 
-        return b''.join(parts)
+        return parts
+
+    @staticmethod
+    def write_message(message: Message, codec: HeaderCodec = JSON_CODEC) -> bytes:
+        return b''.join(ByteOutputStream.encode_message(message, codec))
+
+    def set_header_codec(self, codec: HeaderCodec) -> None:
+        self.header_codec = codec
 
     @abstractmethod
     async def send(self, data: bytes) -> None:
         pass
 
+    async def send_parts(self, parts: Sequence[Buffer]) -> None:
+        """
+        Sends the parts of a message in order.
+
+        Streams that support vectored writes should override this method.
+        By default the parts are joined and passed to :meth:`send`.
+
+        :param parts: The buffers to write.
+        """
+        await self.send(b''.join(parts))
+
     async def write(self, message: Message) -> NoReturn:
-        await self.send(self.write_message(message))
+        await self.send_parts(self.encode_message(message, self.header_codec))
 
 
 class ByteInputStream(MessageInputStream, ABC):
 
-    def __init__(self, maxsize=50):
-        self.protocol: Consumer[Message] = bytes_protocol()
+    def __init__(self, maxsize=50, *, direct_blobs: bool = False):
+        self.protocol: Consumer[Message] = bytes_protocol(direct_blobs=direct_blobs)
         self.queue = Queue(maxsize=maxsize)
         self._queue_is_full = False
 
@@ -96,10 +147,14 @@ class ByteInputStream(MessageInputStream, ABC):
         pass
 
     def feed(self, data: bytes):
-        for message in self.protocol.feed(data):
-            if self.queue.full():
-                return
+        messages = self.protocol.feed(data)
+
+        # Keep the data buffered inside the protocol until the
+        # queue has room again. Parsing here would drop the message.
+        if self.queue.full():
+            return
 
+        for message in messages:
             self.queue.put_nowait(message)
             if self.queue.full():
                 self._queue_is_full = True
@@ -30,7 +30,7 @@ from yuuno2.typings import ConfigTypes
 class LazyClip(RemoteClip):
 
     def __init__(self, remote: 'RemoteScript', clip: str):
-        super().__init__(None)
+        super().__init__(None, compression=remote.compression, delta=remote.delta)
         self._remote = remote
         self._clip = clip
         self._channel_name = f"clip:{id(self)}"
@@ -77,6 +77,11 @@ class RemoteScriptClient(ReqRespClient):
 
 
 class RemoteScript(Script, MultiplexedClient):
+    #: The compression clips of this script request for rendered planes. See RemoteClip.
+    compression: Optional[str] = None
+
+    #: Whether clips of this script request rendered planes as deltas. See RemoteClip.
+    delta: bool = False
 
     def create_client(self, connection: Connection) -> ReqRespClient:
         return RemoteScriptClient(connection)
@@ -20,7 +20,9 @@ from abc import ABC, abstractmethod
 from typing import NoReturn, Type, Tuple, Callable, Dict, List
 
 from yuuno2.networking.base import Connection
-from yuuno2.networking.multiplex import Multiplexer
+from yuuno2.networking.capabilities import Capabilities, local_capabilities
+from yuuno2.networking.compression import AVAILABLE_COMPRESSION
+from yuuno2.networking.multiplex import Multiplexer, PRIORITY_CONTROL
 from yuuno2.networking.reqresp import ReqRespClient, ReqRespServer
 from yuuno2.resource_manager import Resource, register
 from yuuno2.typings import ConfigTypes
@@ -34,7 +36,7 @@ NoneType = type(None)
 IDENTITY_SEND: ConverterTypeSend = lambda x:    (x,    [])
 IDENTITY_RECV: ConverterTypeRecv = lambda d, b: d
 BYTES_SEND:    ConverterTypeSend = lambda x:    (None, [x])
-BYTES_RECV:    ConverterTypeRecv = lambda d, b: b[0]
+BYTES_RECV:    ConverterTypeRecv = lambda d, b: bytes(b[0])
 
 
 TYPE_MAP_SEND: Dict[Type[ConfigTypes], Tuple[str, ConverterTypeSend]] = {
@@ -54,13 +56,37 @@ TYPE_MAP_RECV: Dict[str, ConverterTypeRecv] = {
 
 
 class Multiplexed(Resource, ABC):
-    def __init__(self, connection: Connection):
+    # Clients start the handshake, servers only answer it.
+    # This way a server never waits for a peer that does not know the handshake.
+    INITIATE_HANDSHAKE = False
+    HANDSHAKE_TIMEOUT = 5
+
+    def __init__(self, connection: Connection, *, shared_memory: bool = False):
+        """
+        :param connection:    The connection to the peer.
+        :param shared_memory: Offer to exchange rendered planes using shared memory.
+                              Only enable this if the peer runs on the same machine.
+        """
         super().__init__()
         self.connection = connection
+        self.shared_memory = shared_memory
         self._multiplexer = None
         self._channel = None
         self._control = None
 
+    @property
+    def capabilities(self) -> Capabilities:
+        """
+        :return: The capabilities negotiated with the peer.
+        """
+        return self._multiplexer.capabilities
+
+    def local_capabilities(self) -> Capabilities:
+        """
+        :return: The capabilities offered to the peer.
+        """
+        return local_capabilities(shared_memory=self.shared_memory, compression=AVAILABLE_COMPRESSION)
+
     @abstractmethod
     def create_endpoint(self, connection: Connection) -> Resource:
         pass
@@ -69,11 +95,14 @@ class Multiplexed(Resource, ABC):
         await self.connection.acquire()
         register(self.connection, self)
 
-        self._multiplexer = Multiplexer(self.connection)
+        self._multiplexer = Multiplexer(self.connection, self.local_capabilities())
 
         await self._multiplexer.acquire()
         register(self, self._multiplexer)
-        self._channel = self._multiplexer.connect("control")
+        if self.INITIATE_HANDSHAKE:
+            await self._multiplexer.handshake(self.HANDSHAKE_TIMEOUT)
+
+        self._channel = self._multiplexer.connect("control", priority=PRIORITY_CONTROL)
         await self._channel.acquire()
 
         self._control = self.create_endpoint(self._channel)
@@ -85,9 +114,10 @@ class Multiplexed(Resource, ABC):
 
 
 class MultiplexedClient(Multiplexed):
+    INITIATE_HANDSHAKE = True
 
-    def __init__(self, connection: Connection):
-        super().__init__(connection)
+    def __init__(self, connection: Connection, *, shared_memory: bool = False):
+        super().__init__(connection, shared_memory=shared_memory)
         self._client = None
 
     def create_endpoint(self, connection: Connection) -> Resource:
@@ -101,8 +131,8 @@ class MultiplexedClient(Multiplexed):
 
 class MultiplexedServer(Multiplexed):
 
-    def __init__(self, connection: Connection):
-        super().__init__(connection)
+    def __init__(self, connection: Connection, *, shared_memory: bool = False):
+        super().__init__(connection, shared_memory=shared_memory)
         self._server = None
 
     def create_endpoint(self, connection: Connection) -> Resource:
@@ -60,7 +60,7 @@ class _RemoteScriptServer(ReqRespServer):
         return Message({"keys": list(keys)}, [])
 
     async def on_run(self, encoding: Optional[str] = None, _buffers: Sequence[bytes] = (b"",)):
-        code = _buffers[0]
+        code = bytes(_buffers[0])
         if encoding is not None:
             code = code.decode(encoding)
 
@@ -93,8 +93,8 @@ class _RemoteScriptServer(ReqRespServer):
 
 class RemoteScriptServer(MultiplexedServer):
 
-    def __init__(self, script: Script, connection: Connection):
-        super().__init__(connection)
+    def __init__(self, script: Script, connection: Connection, *, shared_memory: bool = False):
+        super().__init__(connection, shared_memory=shared_memory)
         self.script = script
 
     def create_server(self, connection: Connection) -> Resource:
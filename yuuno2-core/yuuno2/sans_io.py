@@ -102,6 +102,36 @@ class Buffer(object):
 
         return self._read(length)
 
+    def readinto(self, target: memoryview) -> int:
+        """
+        Copies buffered data directly into the target.
+
+        Unlike :meth:`read` the fragments are not joined first so every
+        byte is copied exactly once.
+
+        :param target: A writable byte-view to copy into.
+        :return: The number of bytes copied.
+        """
+        length = len(target)
+        copied = 0
+        while copied < length and self._buffer:
+            part = self._buffer[0]
+            available = len(part) - self._cursor
+            n = min(available, length - copied)
+
+            with memoryview(part) as view:
+                target[copied:copied+n] = view[self._cursor:self._cursor+n]
+            copied += n
+
+            if n == available:
+                self._buffer.popleft()
+                self._cursor = 0
+            else:
+                self._cursor += n
+
+        self._size -= copied
+        return copied
+
     def feed(self, data: Optional[bytes]) -> NoReturn:
         if self._closed:
             if data is None:
@@ -275,6 +305,11 @@ def read(consumer: Consumer, length: int = 0) -> bytes:
     return consumer.buffer.read(length)
 
 
+@_Action.operation
+def readinto(consumer: Consumer, target: memoryview) -> int:
+    return consumer.buffer.readinto(target)
+
+
 @_Action.operation
 def left(consumer: Consumer) -> int:
     return len(consumer.buffer)
@@ -304,3 +339,12 @@ async def read_exactly(length: int = 1) -> bytes:
     if data is None or len(data) < length:
         raise ConnectionResetError
     return data
+
+
+async def read_into(target: memoryview) -> None:
+    target = target.cast("B")
+    filled = 0
+    while filled < len(target):
+        filled += await readinto(target[filled:])
+        if filled < len(target) and not (await sleep()):
+            raise ConnectionResetError
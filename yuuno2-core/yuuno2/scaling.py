@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Yuuno - IPython + VapourSynth
+# Copyright (C) 2019 StuxCrystal (Roland Netzsch <stuxcrystal@encode.moe>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+A generic box filter for downscaled previews.
+
+Backends that cannot resize the frame themselves render it at full size
+and scale the planes down with :func:`box_scale_into`. The filter does not
+need NumPy: rows are summed up with :func:`itertools.accumulate` and
+:func:`map`, so most of the work happens outside of the interpreter loop.
+"""
+from array import array
+from itertools import accumulate
+from operator import add, sub, floordiv, truediv
+from typing import List, Tuple
+
+from yuuno2.format import RawFormat, Size, SampleType
+from yuuno2.typings import Buffer
+
+
+def _typecode(format: RawFormat) -> str:
+    bps = format.bytes_per_sample
+    if format.sample_type == SampleType.FLOAT:
+        if bps == 4:
+            return 'f'
+    elif bps == 1:
+        return 'B'
+    elif bps == 2:
+        return 'H'
+    elif bps == 4:
+        return 'I'
+    raise ValueError("The box filter does not support this format.")
+
+
+def _boxes(source: int, target: int) -> Tuple[List[int], List[int]]:
+    starts = [(i * source) // target for i in range(target)]
+    ends = starts[1:] + [source]
+    return starts, ends
+
+
+def scaled_size(format: RawFormat, size: Size, target: Size) -> Size:
+    """
+    Checks if a frame can be scaled down to the target size.
+
+    :param format: The format the frame is rendered in.
+    :param size:   The size of the frame.
+    :param target: The size of the scaled frame.
+    :exception ValueError: Thrown if the target size is larger than the frame or does not fit the subsampling.
+    :return: The target size.
+    """
+    target = Size(*target)
+    if not (0 < target.width <= size.width and 0 < target.height <= size.height):
+        raise ValueError("Frames can only be scaled down.")
+    if format.planar and (target.width % (1 << format.subsampling_w) or target.height % (1 << format.subsampling_h)):
+        raise ValueError("The target size does not fit the subsampling of the format.")
+    return target
+
+
+def box_scale_into(
+        source: Buffer, buffer: Buffer, offset: int,
+        format: RawFormat, plane: int, size: Size, target: Size
+) -> int:
+    """
+    Scales a rendered plane down by averaging the pixels each target pixel covers.
+
+    :param source: The plane rendered at full size.
+    :param buffer: The buffer to write the scaled plane into.
+    :param offset: Where in the buffer should the plane start.
+    :param format: The format the plane was rendered in.
+    :param plane:  The index of the plane.
+    :param size:   The size of the frame.
+    :param target: The size of the scaled frame.
+
+    :exception ValueError:  Thrown if the format is not supported.
+    :exception BufferError: Thrown if the buffer is too small at the given offset.
+
+    :return: The amount of bytes written to the buffer.
+    """
+    typecode = _typecode(format)
+    components = 1 if format.planar else format.num_fields
+    row_bytes = format.bytes_per_sample * components
+
+    sw, sh = format.get_plane_dimensions(plane, size)
+    tw, th = format.get_plane_dimensions(plane, target)
+    source_stride = format.get_plane_size(plane, size) // sh
+    target_stride = format.get_plane_size(plane, target) // th
+
+    length = target_stride * th
+    if len(buffer) - offset < length:
+        raise BufferError("The buffer is too small.")
+
+    x_starts, x_ends = _boxes(sw, tw)
+    y_starts, y_ends = _boxes(sh, th)
+    widths = [e - s for s, e in zip(x_starts, x_ends)]
+
+    source = memoryview(source).cast('B')
+    rows = []
+    for y in range(sh):
+        samples = array(typecode)
+        samples.frombytes(source[y * source_stride:y * source_stride + sw * row_bytes])
+        row = [0] * (tw * components)
+        for c in range(components):
+            prefix = [0, *accumulate(samples[c::components])]
+            row[c::components] = map(sub, map(prefix.__getitem__, x_ends), map(prefix.__getitem__, x_starts))
+        rows.append(row)
+
+    weights = [w for w in widths for _ in range(components)]
+    divide = truediv if format.sample_type == SampleType.FLOAT else floordiv
+    padding = bytes(target_stride - tw * row_bytes)
+
+    out = memoryview(buffer).cast('B')
+    for y, (ys, ye) in enumerate(zip(y_starts, y_ends)):
+        total = rows[ys]
+        for row in rows[ys + 1:ye]:
+            total = list(map(add, total, row))
+
+        count = ye - ys
+        scale = [w * count for w in weights]
+        if divide is floordiv:
+            total = map(add, total, [w // 2 for w in scale])
+
+        data = array(typecode, map(divide, total, scale)).tobytes() + padding
+        start = offset + y * target_stride
+        out[start:start + target_stride] = data
+
+    return length
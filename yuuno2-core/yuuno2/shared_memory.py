@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Yuuno - IPython + VapourSynth
+# Copyright (C) 2019 StuxCrystal (Roland Netzsch <stuxcrystal@encode.moe>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Shared memory for passing rendered planes between processes on the same machine.
+
+The process rendering the planes owns a :class:`SharedMemoryArena` and hands out
+slots from a ring buffer. The other process attaches to the arena by its name
+and only receives the offsets and lengths of the planes.
+"""
+import sys
+from collections import OrderedDict
+from typing import Optional, Callable, Any, MutableMapping, List, NoReturn, Iterable
+
+from yuuno2.resource_manager import Resource, register
+
+try:
+    from multiprocessing import shared_memory as _shared_memory
+except ImportError:
+    # Requires Python 3.8.
+    _shared_memory = None
+
+
+#: True if this interpreter can exchange planes using shared memory.
+SHARED_MEMORY_AVAILABLE: bool = _shared_memory is not None
+
+
+class RingAllocator(object):
+    """
+    Hands out regions of a fixed-size area in ring-buffer order.
+
+    Regions may be freed in any order, but their space is only reused
+    once all regions that were allocated before them have been freed.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._head = 0
+        # Maps the offset of every live region to [length, freed].
+        self._regions: MutableMapping[int, List] = OrderedDict()
+
+    @property
+    def used(self) -> int:
+        """
+        :return: The amount of bytes held by live regions.
+        """
+        return sum(length for length, _ in self._regions.values())
+
+    def allocate(self, length: int) -> Optional[int]:
+        """
+        Reserves a region.
+
+        :param length: The size of the region.
+        :return: The offset of the region or None if there is no room left.
+        """
+        if length <= 0 or length > self.size:
+            return None
+
+        if not self._regions:
+            offset = 0
+        else:
+            tail = next(iter(self._regions))
+            if self._head > tail:
+                if self._head + length <= self.size:
+                    offset = self._head
+                elif length <= tail:
+                    offset = 0
+                else:
+                    return None
+            elif self._head + length <= tail:
+                offset = self._head
+            else:
+                return None
+
+        self._regions[offset] = [length, False]
+        self._head = offset + length
+        return offset
+
+    def free(self, offset: int) -> None:
+        """
+        Gives a region back.
+
+        :param offset: The offset returned by :meth:`allocate`.
+        """
+        region = self._regions.get(offset, None)
+        if region is None:
+            return
+        region[1] = True
+
+        while self._regions:
+            tail = next(iter(self._regions))
+            if not self._regions[tail][1]:
+                break
+            del self._regions[tail]
+
+        if not self._regions:
+            self._head = 0
+
+    def clear(self) -> None:
+        self._regions.clear()
+        self._head = 0
+
+
+def _attach(name: str) -> '_shared_memory.SharedMemory':
+    if sys.version_info >= (3, 13):
+        return _shared_memory.SharedMemory(name, track=False)
+
+    shm = _shared_memory.SharedMemory(name)
+    if name not in _owned:
+        # Before Python 3.13 attaching registers the segment with the resource tracker,
+        # which would destroy it once this process exits. The owner takes care of it.
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+# Names of the segments created by this process.
+_owned = set()
+
+
+class SharedMemoryArena(Resource):
+    """
+    A shared memory segment that planes are rendered into.
+
+    The arena creating the segment allocates slots and removes the segment
+    when it is released. Arenas attached by name only read from it.
+    """
+
+    def __init__(self, size: int = 0, name: Optional[str] = None):
+        """
+        :param size: The size of the segment to create.
+        :param name: The name of an existing segment to attach to.
+        """
+        self.size = size
+        self.name = name
+        self.owner = name is None
+
+        self._shm: Optional['_shared_memory.SharedMemory'] = None
+        self._allocator: Optional[RingAllocator] = None
+        self.buffer: Optional[memoryview] = None
+
+    @property
+    def used(self) -> int:
+        """
+        :return: The amount of bytes held by slots.
+        """
+        if self._allocator is None:
+            return 0
+        return self._allocator.used
+
+    def allocate(self, length: int) -> Optional[int]:
+        """
+        Reserves a slot in the arena.
+
+        :param length: The size of the slot.
+        :return: The offset of the slot or None if the arena is full.
+        """
+        if not self.owner:
+            raise RuntimeError("Only the owner of the arena can allocate slots.")
+        return self._allocator.allocate(length)
+
+    def free(self, offset: int) -> None:
+        """
+        Releases a slot.
+
+        :param offset: The offset returned by :meth:`allocate`.
+        """
+        if self._allocator is not None:
+            self._allocator.free(offset)
+
+    def view(self, offset: int, length: int) -> memoryview:
+        """
+        :return: A view into the segment.
+        """
+        if offset < 0 or offset + length > self.size:
+            raise IndexError("View out of range.")
+        return self.buffer[offset:offset+length]
+
+    async def _acquire(self) -> NoReturn:
+        if not SHARED_MEMORY_AVAILABLE:
+            raise RuntimeError("Shared memory is not supported by this interpreter.")
+
+        if self.owner:
+            self._shm = _shared_memory.SharedMemory(create=True, size=self.size)
+            self.name = self._shm.name
+            _owned.add(self.name)
+            self._allocator = RingAllocator(self.size)
+        else:
+            self._shm = _attach(self.name)
+            self.size = self._shm.size
+
+        self.buffer = self._shm.buf
+
+    async def _release(self) -> NoReturn:
+        self.buffer = None
+        self._allocator = None
+
+        try:
+            self._shm.close()
+        except BufferError:
+            # Someone still holds a view. The mapping goes away with the last view.
+            pass
+
+        if self.owner:
+            self._shm.unlink()
+            _owned.discard(self.name)
+        self._shm = None
+
+
+class SharedMemorySlot(Resource):
+    """
+    A slot of an arena that has been handed to this process.
+
+    Once it is released, the owner of the arena is told that the slot can be reused.
+    Do not use the views of the slot afterwards.
+    """
+
+    def __init__(self, arena: SharedMemoryArena, offset: int, on_release: Callable[[int], Any]):
+        self.arena = arena
+        self.offset = offset
+        self.on_release = on_release
+        self._views: List[memoryview] = []
+
+    def view(self, offset: int, length: int) -> memoryview:
+        """
+        :param offset: The offset of the data inside the arena.
+        :param length: The length of the data.
+        :return: A view into the arena. It is invalidated when the slot is released.
+        """
+        view = self.arena.view(offset, length)
+        self._views.append(view)
+        return view
+
+    async def _acquire(self) -> NoReturn:
+        await self.arena.ensure_acquired()
+        register(self.arena, self)
+
+    async def _release(self) -> NoReturn:
+        release_views(self._views)
+        self._views = []
+        self.on_release(self.offset)
+        self.arena = None
+
+
+def release_views(views: Iterable[memoryview]) -> None:
+    """
+    Releases views into an arena so the arena can be unmapped.
+    """
+    for view in views:
+        try:
+            view.release()
+        except BufferError:
+            # Someone derived another view from it. It is released with that view.
+            pass
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Yuuno - IPython + VapourSynth
+# Copyright (C) 2019 StuxCrystal (Roland Netzsch <stuxcrystal@encode.moe>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from unittest import TestCase
+
+from yuuno2.buffer_pool import BufferPool
+
+
+class TestBufferPool(TestCase):
+
+    def test_rounds_to_granularity(self):
+        pool = BufferPool(granularity=16)
+        self.assertEqual(len(pool.acquire(1)), 16)
+        self.assertEqual(len(pool.acquire(16)), 16)
+        self.assertEqual(len(pool.acquire(17)), 32)
+
+    def test_reuse(self):
+        pool = BufferPool(granularity=16)
+        buf = pool.acquire(10)
+        self.assertEqual((pool.hits, pool.misses), (0, 1))
+
+        pool.release(buf)
+        self.assertEqual(pool.idle_bytes, 16)
+        self.assertIs(pool.acquire(12), buf)
+        self.assertEqual((pool.hits, pool.misses), (1, 1))
+        self.assertEqual(pool.idle_bytes, 0)
+
+        self.assertIsNot(pool.acquire(20), buf)
+        self.assertEqual((pool.hits, pool.misses), (1, 2))
+
+    def test_limit_per_bucket(self):
+        pool = BufferPool(granularity=16, max_per_bucket=1)
+        a, b = pool.acquire(16), pool.acquire(16)
+        pool.release(a)
+        pool.release(b)
+        self.assertEqual(pool.idle_bytes, 16)
+        self.assertEqual(pool.discarded, 1)
+
+    def test_limit_bytes(self):
+        pool = BufferPool(granularity=16, max_bytes=32)
+        a, b = pool.acquire(32), pool.acquire(16)
+        pool.release(a)
+        pool.release(b)
+        self.assertEqual(pool.idle_bytes, 32)
+        self.assertEqual(pool.discarded, 1)
+
+    def test_foreign_buffer(self):
+        pool = BufferPool(granularity=16)
+        pool.release(bytearray(3))
+        self.assertEqual(pool.idle_bytes, 0)
+        self.assertEqual(pool.discarded, 1)
+
+    def test_clear(self):
+        pool = BufferPool(granularity=16)
+        pool.release(pool.acquire(16))
+        pool.clear()
+        self.assertEqual(pool.idle_bytes, 0)
+        self.assertEqual(len(pool.acquire(16)), 16)
+        self.assertEqual(pool.hits, 0)
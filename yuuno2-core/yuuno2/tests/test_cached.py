@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Yuuno - IPython + VapourSynth
+# Copyright (C) 2019 StuxCrystal (Roland Netzsch <stuxcrystal@encode.moe>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from typing import NoReturn
+
+from aiounittest import AsyncTestCase
+
+from yuuno2.clip import Frame
+from yuuno2.clips.cached import CachedClip
+from yuuno2.format import RawFormat, Size, RGB24, GRAY8
+from yuuno2.tests.mocks import MockClip, MockFrame
+from yuuno2.typings import Buffer
+
+
+class RenderCountingFrame(MockFrame):
+
+    def __init__(self, clip: 'RenderCountingClip', index: int):
+        self.clip = clip
+        self.index = index
+
+    @property
+    def size(self) -> Size:
+        return Size(2, 2)
+
+    async def can_render(self, format: RawFormat) -> bool:
+        return format in (RGB24, GRAY8)
+
+    async def render_into(self, buffer: Buffer, plane: int, format: RawFormat, offset: int = 0) -> int:
+        self.clip.renders += 1
+        sz = format.get_plane_size(plane, self.size)
+        buffer[offset:offset+sz] = bytes([self.index * 10 + plane]) * sz
+        return sz
+
+    async def _acquire(self) -> NoReturn:
+        self.clip.acquires += 1
+
+
+class RenderCountingClip(MockClip):
+
+    def __init__(self):
+        self.renders = 0
+        self.acquires = 0
+
+    def __len__(self):
+        return 10
+
+    def __getitem__(self, item) -> Frame:
+        return RenderCountingFrame(self, item)
+
+
+class CachedClipTest(AsyncTestCase):
+
+    async def render(self, clip, index, plane, format=RGB24):
+        async with clip[index] as frame:
+            buffer = bytearray(6)
+            self.assertEqual(await frame.render_into(buffer, plane, format, 2), 4)
+            self.assertEqual(buffer[2:], bytes([index * 10 + plane]) * 4)
+            return frame
+
+    async def test_hit(self):
+        inner = RenderCountingClip()
+        async with CachedClip(inner) as clip:
+            await self.render(clip, 1, 2)
+            await self.render(clip, 1, 2)
+
+            self.assertEqual(inner.renders, 1)
+            self.assertEqual(inner.acquires, 1)
+            self.assertEqual((clip.hits, clip.misses), (1, 1))
+
+    async def test_key_includes_format_and_plane(self):
+        inner = RenderCountingClip()
+        async with CachedClip(inner) as clip:
+            await self.render(clip, 1, 0)
+            await self.render(clip, 1, 1)
+            await self.render(clip, 1, 0, GRAY8)
+            await self.render(clip, 2, 0)
+
+            self.assertEqual(inner.renders, 4)
+            self.assertEqual(clip.cached_bytes, 16)
+
+    async def test_frame_info_cached(self):
+        inner = RenderCountingClip()
+        async with CachedClip(inner) as clip:
+            await self.render(clip, 3, 0)
+            async with clip[3] as frame:
+                self.assertEqual(frame.size, Size(2, 2))
+                self.assertEqual(frame.native_format, RGB24)
+                self.assertTrue(await frame.can_render(RGB24))
+            self.assertEqual(inner.acquires, 1)
+
+    async def test_lru_byte_budget(self):
+        inner = RenderCountingClip()
+        async with CachedClip(inner, max_bytes=8) as clip:
+            await self.render(clip, 0, 0)
+            await self.render(clip, 1, 0)
+            await self.render(clip, 0, 0)
+            await self.render(clip, 2, 0)
+
+            self.assertEqual(clip.evictions, 1)
+            self.assertEqual(clip.cached_bytes, 8)
+
+            # Frame 1 was the least recently used one.
+            await self.render(clip, 0, 0)
+            self.assertEqual(inner.renders, 3)
+            await self.render(clip, 1, 0)
+            self.assertEqual(inner.renders, 4)
+
+    async def test_render_planes(self):
+        inner = RenderCountingClip()
+        async with CachedClip(inner) as clip:
+            await self.render(clip, 0, 1)
+            async with clip[0] as frame:
+                buffers = [bytearray(4) for _ in range(3)]
+                self.assertEqual(await frame.render_planes(RGB24, [0, 1, 2], buffers), [4, 4, 4])
+                self.assertEqual(buffers, [bytes([p]) * 4 for p in range(3)])
+            self.assertEqual(inner.renders, 3)
+
+    async def test_release_clears(self):
+        inner = RenderCountingClip()
+        clip = CachedClip(inner)
+        async with clip:
+            frame = await self.render(clip, 0, 0)
+        self.assertEqual(clip.cached_bytes, 0)
+        self.assertFalse(frame.acquired)
@@ -21,7 +21,7 @@ from typing import Mapping, Union
 from aiounittest import AsyncTestCase
 
 from yuuno2.typings import Buffer
-from yuuno2.format import RawFormat, RGB24, GRAY8, Size, RGBA32
+from yuuno2.format import RawFormat, RGB24, GRAY8, Size, Rect, RGBA32
 from yuuno2.tests.mocks import MockFrame, MockClip
 from yuuno2.clips.combined_alpha import AlphaFrame, AlphaClip
 
@@ -34,6 +34,7 @@ class CustomMockFrame(MockFrame):
         self.meta = meta
         self._last_plane = None
         self._last_format = None
+        self._last_rect = None
 
     @property
     def size(self) -> Size:
@@ -51,6 +52,10 @@ class CustomMockFrame(MockFrame):
         self._last_format = format
         return plane
 
+    async def render_cropped_into(self, buffer: Buffer, plane: int, format: RawFormat, rect: Rect, offset: int = 0) -> int:
+        self._last_rect = rect
+        return await self.render_into(buffer, plane, format, offset)
+
     async def get_metadata(self) -> Mapping[str, Union[int, str, bytes]]:
         return self.meta
 
@@ -122,6 +127,18 @@ class TestAlphaFrame(AsyncTestCase):
             self.assertIsNone(m._last_format)
             self.assertIsNone(m._last_plane)
 
+    async def test_render_cropped_into(self):
+        m = CustomMockFrame(Size(4, 4), RGB24, {'type': 'm', 'a': 0})
+        a = CustomMockFrame(Size(4, 4), GRAY8, {'type': 'a', 'b': 1})
+        rect = Rect(1, 1, 2, 2)
+        async with AlphaFrame(m, a) as f:
+            self.assertEqual(await f.render_cropped_into(bytearray(), 1, RGBA32, rect), 1)
+            self.assertEqual((m._last_format, m._last_plane, m._last_rect), (RGB24, 1, rect))
+            self.assertIsNone(a._last_rect)
+
+            self.assertEqual(await f.render_cropped_planes(RGBA32, [3], rect, [bytearray()]), [0])
+            self.assertEqual((a._last_format, a._last_plane, a._last_rect), (GRAY8, 0, rect))
+
     async def test_resources_owned(self):
         m = CustomMockFrame(Size(1, 1), RGB24, {'type': 'm', 'a': 0})
         a = CustomMockFrame(Size(1, 2), GRAY8, {'type': 'a', 'b': 1})
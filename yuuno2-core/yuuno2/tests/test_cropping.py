@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Yuuno - IPython + VapourSynth
+# Copyright (C) 2019 StuxCrystal (Roland Netzsch <stuxcrystal@encode.moe>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from unittest import TestCase
+
+from yuuno2.cropping import crop_into, cropped_rect
+from yuuno2.format import RawFormat, Size, Rect, GRAY8, SampleType, ColorFamily
+
+YUV420P8 = RawFormat(8, 3, ColorFamily.YUV, SampleType.INTEGER, subsampling_h=1, subsampling_w=1)
+BGRA32 = RawFormat(8, 4, ColorFamily.RGB, SampleType.INTEGER, packed=True, planar=False)
+
+
+def crop(source, format, plane, size, rect):
+    buffer = bytearray(format.get_plane_size(plane, rect))
+    written = crop_into(source, buffer, 0, format, plane, size, rect)
+    assert written == len(buffer)
+    return buffer
+
+
+class TestRectFormat(TestCase):
+
+    def test_plane_rect(self):
+        rect = Rect(2, 4, 6, 8)
+        self.assertEqual(YUV420P8.get_plane_rect(0, rect), rect)
+        self.assertEqual(YUV420P8.get_plane_rect(1, rect), Rect(1, 2, 3, 4))
+        self.assertEqual(BGRA32.get_plane_rect(0, rect), rect)
+
+    def test_plane_size(self):
+        rect = Rect(2, 4, 6, 8)
+        self.assertEqual(YUV420P8.get_plane_size(0, rect), 48)
+        self.assertEqual(YUV420P8.get_plane_size(1, rect), 12)
+        self.assertEqual(BGRA32.get_plane_size(0, rect), 192)
+
+
+class TestCroppedRect(TestCase):
+
+    def test_inside(self):
+        self.assertEqual(cropped_rect(GRAY8, Size(8, 8), (1, 2, 3, 4)), Rect(1, 2, 3, 4))
+        self.assertEqual(cropped_rect(GRAY8, Size(8, 8), (0, 0, 8, 8)), Rect(0, 0, 8, 8))
+
+    def test_outside(self):
+        for rect in [(-1, 0, 2, 2), (0, 0, 9, 8), (7, 0, 2, 2), (0, 0, 0, 2)]:
+            with self.subTest(rect=rect), self.assertRaises(ValueError):
+                cropped_rect(GRAY8, Size(8, 8), rect)
+
+    def test_subsampling(self):
+        with self.assertRaises(ValueError):
+            cropped_rect(YUV420P8, Size(8, 8), (1, 0, 2, 2))
+        self.assertEqual(cropped_rect(YUV420P8, Size(8, 8), (2, 2, 4, 2)), Rect(2, 2, 4, 2))
+
+
+class TestCrop(TestCase):
+
+    def test_plane(self):
+        source = bytes(range(16))
+        self.assertEqual(crop(source, GRAY8, 0, Size(4, 4), Rect(1, 1, 2, 2)), bytes([5, 6, 9, 10]))
+
+    def test_subsampled_plane(self):
+        chroma = bytes(range(16))
+        # The chroma plane of an 8x8 frame is 4x4.
+        self.assertEqual(crop(chroma, YUV420P8, 1, Size(8, 8), Rect(2, 2, 4, 4)), bytes([5, 6, 9, 10]))
+
+    def test_interleaved(self):
+        source = bytes(range(16))
+        self.assertEqual(crop(source, BGRA32, 0, Size(2, 2), Rect(1, 0, 1, 2)), bytes([4, 5, 6, 7, 12, 13, 14, 15]))
+
+    def test_padded_rows(self):
+        fmt = GRAY8.replace(packed=False)
+        # Rows of a 3 pixel wide unpacked plane are padded to 6 bytes, rows of a 2 pixel wide one to 4 bytes.
+        source = bytes([1, 2, 3, 0, 0, 0, 4, 5, 6, 0, 0, 0])
+        self.assertEqual(crop(source, fmt, 0, Size(3, 2), Rect(1, 0, 2, 2)), bytes([2, 3, 0, 0, 5, 6, 0, 0]))
+
+    def test_buffer_too_small(self):
+        with self.assertRaises(BufferError):
+            crop_into(bytes(16), bytearray(3), 0, GRAY8, 0, Size(4, 4), Rect(0, 0, 2, 2))
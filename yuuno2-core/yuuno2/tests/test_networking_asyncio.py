@@ -17,12 +17,13 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import socket
-from asyncio import get_running_loop, open_connection, wait_for
+from asyncio import get_running_loop, open_connection, wait_for, ensure_future
 
 from aiounittest import AsyncTestCase
 
 from yuuno2.networking.asyncio import YuunoProtocol, ConnectionInputStream, ConnectionOutputStream
 from yuuno2.networking.base import Message
+from yuuno2.networking.codecs import BINARY_CODEC
 from yuuno2.networking.serializer import ByteOutputStream
 
 
@@ -81,3 +82,61 @@ class TestAsyncioProtocol(AsyncTestCase):
         finally:
             rs_w.close()
             wt.close()
+
+    async def test_write_stream_large_blob(self):
+        rsock, wsock = socket.socketpair()
+        wt = FakeClosable()
+        rs_w = FakeClosable()
+
+        try:
+            rs_r, rs_w = await open_connection(sock=rsock)
+            wt, wp = await get_running_loop().create_connection(YuunoProtocol, sock=wsock)
+
+            wpos = ConnectionOutputStream(wp)
+            async with wpos:
+                blob = bytearray(range(256)) * 16384
+                msg = Message({"test": id(self)}, [memoryview(blob)])
+                msg_raw = ByteOutputStream.write_message(msg)
+
+                reader = ensure_future(rs_r.readexactly(len(msg_raw)))
+                await wait_for(wpos.write(msg), 5)
+
+                # Once write returns the transport must not reference the blob anymore.
+                self.assertEqual(wt.get_write_buffer_size(), 0)
+                blob[:] = bytes(len(blob))
+
+                self.assertEqual(await wait_for(reader, 5), msg_raw)
+
+            await wait_for(rs_r.read(1), 5)
+            self.assertTrue(rs_r.at_eof())
+
+        finally:
+            rs_w.close()
+            wt.close()
+
+    async def test_write_stream_header_codec(self):
+        rsock, wsock = socket.socketpair()
+        wt = FakeClosable()
+        rs_w = FakeClosable()
+
+        try:
+            rs_r, rs_w = await open_connection(sock=rsock)
+            wt, wp = await get_running_loop().create_connection(YuunoProtocol, sock=wsock)
+
+            wpos = ConnectionOutputStream(wp)
+            async with wpos:
+                wpos.set_header_codec(BINARY_CODEC)
+
+                msg = Message({"test": id(self)}, [b"blob"])
+                msg_raw = ByteOutputStream.write_message(msg, BINARY_CODEC)
+
+                await wait_for(wpos.write(msg), 5)
+                data = await wait_for(rs_r.readexactly(len(msg_raw)), 5)
+                self.assertEqual(data, msg_raw)
+
+            await wait_for(rs_r.read(1), 5)
+            self.assertTrue(rs_r.at_eof())
+
+        finally:
+            rs_w.close()
+            wt.close()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Yuuno - IPython + VapourSynth
+# Copyright (C) 2019 StuxCrystal (Roland Netzsch <stuxcrystal@encode.moe>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from unittest import TestCase, skipUnless
+
+from yuuno2.format import RGB24
+from yuuno2.networking.base import Message
+from yuuno2.networking.codecs import BinaryCodec, JSON_CODEC, BINARY_CODEC, decode_header, _msgpack
+from yuuno2.networking.serializer import ByteOutputStream, bytes_protocol
+
+
+VALUES = [
+    None, True, False, 0, 1, 127, 128, 255, 256, 65535, 65536, 2**32, 2**64-1,
+    -1, -32, -33, -128, -129, -32768, -32769, -2**31-1, -2**63,
+    0.5, -1e100, "", "a", "x" * 31, "x" * 32, "x" * 256, "x" * 65536, "ünïcödé",
+    [], [1, [2, [3]]], list(range(16)), list(range(70000)),
+    {}, {"a": 1}, {str(i): i for i in range(16)}, {str(i): i for i in range(70000)},
+]
+
+
+class TestBinaryCodec(TestCase):
+
+    def test_roundtrip(self):
+        codec = BinaryCodec(accelerated=False)
+        for value in VALUES:
+            with self.subTest(value=repr(value)[:40]):
+                self.assertEqual(codec.decode(codec.encode(value)), value)
+
+    def test_tuples_and_enums(self):
+        codec = BinaryCodec(accelerated=False)
+        self.assertEqual(codec.decode(codec.encode(RGB24.to_json())), list(RGB24.to_json()))
+
+    def test_unsupported(self):
+        codec = BinaryCodec(accelerated=False)
+        with self.assertRaises(TypeError):
+            codec.encode({"a": object()})
+        with self.assertRaises(TypeError):
+            codec.encode({1: 2})
+        with self.assertRaises(ValueError):
+            codec.encode(2**64)
+
+    @skipUnless(_msgpack is not None, "msgpack is not installed")
+    def test_compatible_with_msgpack(self):
+        pure = BinaryCodec(accelerated=False)
+        accelerated = BinaryCodec()
+        for value in VALUES:
+            with self.subTest(value=repr(value)[:40]):
+                self.assertEqual(pure.encode(value), accelerated.encode(value))
+                self.assertEqual(pure.decode(accelerated.encode(value)), value)
+
+    def test_detection(self):
+        value = {"id": 1, "params": {"frame": 2}}
+        self.assertEqual(decode_header(JSON_CODEC.encode(value)), value)
+        self.assertEqual(decode_header(BINARY_CODEC.encode(value)), value)
+
+
+class TestSerializerCodec(TestCase):
+
+    def test_mixed_codecs(self):
+        message = Message({"id": 1, "type": "request"}, [b"abc"])
+        data = ByteOutputStream.write_message(message, BINARY_CODEC) + ByteOutputStream.write_message(message)
+
+        parser = bytes_protocol()
+        self.assertEqual(list(parser.feed(data)), [message, message])
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Yuuno - IPython + VapourSynth
+# Copyright (C) 2019 StuxCrystal (Roland Netzsch <stuxcrystal@encode.moe>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import os
+from unittest import TestCase
+
+from yuuno2.networking.compression import COMPRESSORS, AVAILABLE_COMPRESSION, compress_blob
+
+
+class TestCompressors(TestCase):
+    DATA = bytes(range(256)) * 8192
+
+    def test_stdlib_available(self):
+        self.assertIn("zlib", AVAILABLE_COMPRESSION)
+        self.assertIn("lzma", AVAILABLE_COMPRESSION)
+
+    def test_roundtrip(self):
+        for name, compressor in COMPRESSORS.items():
+            with self.subTest(name):
+                compressed = compressor.compress(memoryview(self.DATA))
+                self.assertLess(len(compressed), len(self.DATA))
+
+                # Leave some room to see that nothing is written past the data.
+                out = bytearray(len(self.DATA) + 4)
+                self.assertEqual(compressor.decompress_into(compressed, memoryview(out)), len(self.DATA))
+                self.assertEqual(out[:len(self.DATA)], self.DATA)
+                self.assertEqual(out[len(self.DATA):], bytes(4))
+
+    def test_buffer_too_small(self):
+        for name, compressor in COMPRESSORS.items():
+            with self.subTest(name):
+                compressed = compressor.compress(self.DATA)
+                with self.assertRaises(BufferError):
+                    compressor.decompress_into(compressed, memoryview(bytearray(len(self.DATA) - 1)))
+
+    def test_threshold(self):
+        compressor = COMPRESSORS["zlib"]
+        self.assertIsNone(compress_blob(compressor, bytes(100), threshold=1024))
+        self.assertIsNotNone(compress_blob(compressor, bytes(2048), threshold=1024))
+
+    def test_incompressible(self):
+        self.assertIsNone(compress_blob(COMPRESSORS["zlib"], os.urandom(4096), threshold=0))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Yuuno - IPython + VapourSynth
+# Copyright (C) 2019 StuxCrystal (Roland Netzsch <stuxcrystal@encode.moe>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from unittest import TestCase
+
+from yuuno2.networking.delta import DeltaEncoder, DeltaDecoder, xor_bytes
+
+
+class TestXor(TestCase):
+
+    def test_xor(self):
+        self.assertEqual(xor_bytes(b"\x01\x02\x03", b"\x01\x00\xff"), b"\x00\x02\xfc")
+        self.assertEqual(xor_bytes(memoryview(b"\x00\x80"), bytearray(b"\x00\x80")), b"\x00\x00")
+
+    def test_size_mismatch(self):
+        with self.assertRaises(ValueError):
+            xor_bytes(b"\x00", b"\x00\x00")
+
+
+class TestDelta(TestCase):
+    FRAMES = [bytes([i]) * 4 + b"static" for i in range(5)]
+
+    def roundtrip(self, encoder, decoder, frame):
+        base, ref, blobs = encoder.encode("key", decoder.reference("key"), [frame])
+        return base, decoder.decode("key", base, ref, blobs)
+
+    def test_deltas_after_keyframe(self):
+        encoder = DeltaEncoder()
+        decoder = DeltaDecoder()
+
+        for index, frame in enumerate(self.FRAMES):
+            base, planes = self.roundtrip(encoder, decoder, frame)
+            self.assertEqual(base is None, index == 0)
+            self.assertEqual(planes, [frame])
+
+        self.assertEqual(encoder.keyframes, 1)
+        self.assertEqual(encoder.deltas, 4)
+
+    def test_delta_is_mostly_zero(self):
+        encoder = DeltaEncoder()
+        _, ref, _ = encoder.encode("key", None, [self.FRAMES[0]])
+        _, _, blobs = encoder.encode("key", ref, [self.FRAMES[1]])
+        self.assertEqual(blobs, [b"\x01" * 4 + bytes(6)])
+
+    def test_keyframe_interval(self):
+        encoder = DeltaEncoder(keyframe_interval=2)
+        decoder = DeltaDecoder()
+
+        bases = [self.roundtrip(encoder, decoder, frame)[0] for frame in self.FRAMES]
+        self.assertEqual([b is None for b in bases], [True, False, True, False, True])
+
+    def test_resync(self):
+        encoder = DeltaEncoder()
+        decoder = DeltaDecoder()
+        self.roundtrip(encoder, decoder, self.FRAMES[0])
+
+        # The decoder never received this frame.
+        encoder.encode("key", decoder.reference("key"), [self.FRAMES[1]])
+
+        # So the encoder does not know the reference of the decoder anymore.
+        base, planes = self.roundtrip(encoder, decoder, self.FRAMES[2])
+        self.assertIsNone(base)
+        self.assertEqual(planes, [self.FRAMES[2]])
+
+    def test_unknown_base(self):
+        encoder = DeltaEncoder()
+        _, ref, _ = encoder.encode("key", None, [self.FRAMES[0]])
+        base, ref, blobs = encoder.encode("key", ref, [self.FRAMES[1]])
+
+        decoder = DeltaDecoder()
+        self.assertIsNone(decoder.decode("key", base, ref, blobs))
+
+    def test_size_change_sends_keyframe(self):
+        encoder = DeltaEncoder()
+        _, ref, _ = encoder.encode("key", None, [b"\x00" * 4])
+        base, _, _ = encoder.encode("key", ref, [b"\x00" * 8])
+        self.assertIsNone(base)
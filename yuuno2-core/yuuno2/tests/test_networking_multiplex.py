@@ -16,13 +16,16 @@
 #
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
-from asyncio import wait_for
+from asyncio import wait_for, ensure_future, sleep, gather, TimeoutError, Event
+from typing import NoReturn
 
 from aiounittest import AsyncTestCase
 
-from yuuno2.networking.base import Message
-from yuuno2.networking.multiplex import Multiplexer
-from yuuno2.networking.pipe import pipe_bidi
+from yuuno2.networking.base import Message, Connection, MessageOutputStream
+from yuuno2.networking.capabilities import Capabilities, LEGACY, PROTOCOL_VERSION, FLOW_CONTROL, FRAGMENTS
+from yuuno2.networking.multiplex import Multiplexer, HANDSHAKE_TARGET, MESSAGE_COST, WriteScheduler
+from yuuno2.networking.multiplex import PRIORITY_CONTROL, PRIORITY_NORMAL
+from yuuno2.networking.pipe import pipe_bidi, pipe
 
 
 class TestMultiplexer(AsyncTestCase):
@@ -50,6 +53,17 @@ class TestMultiplexer(AsyncTestCase):
 
         self.assertIs(value, msg.values)
 
+    async def test_delivered_blobs_are_not_copied(self):
+        c_faked_networking, c_multiplexed = pipe_bidi()
+        muliplexer = Multiplexer(c_multiplexed)
+        async with c_faked_networking, muliplexer:
+            async with muliplexer.connect('existing') as f:
+                blob = memoryview(bytearray(b"received"))
+                await f.deliver(Message({}, [blob]))
+                msg: Message = await wait_for(f.read(), 5)
+
+        self.assertIs(blob, msg.blobs[0])
+
     async def test_multiplexer_illegal(self):
         c_faked_networking, c_multiplexed = pipe_bidi()
         muliplexer = Multiplexer(c_multiplexed)
@@ -133,3 +147,263 @@ class TestMultiplexer(AsyncTestCase):
 
                 await wait_for(m2_ch.read(), 5)
                 self.assertTrue(m2_ch.closed)
+
+
+class TestHandshake(AsyncTestCase):
+
+    async def test_handshake_negotiates(self):
+        c_client, c_server = pipe_bidi()
+        client = Multiplexer(c_client, Capabilities(
+            version=PROTOCOL_VERSION, header_codecs=("binary", "json"), header_codec="binary",
+            max_message_size=1024, compression=("zlib", "lz4"), features=frozenset({"a", "b"})
+        ))
+        server = Multiplexer(c_server, Capabilities(
+            version=PROTOCOL_VERSION, header_codecs=("json", "binary"), header_codec="json",
+            max_message_size=512, compression=("lz4",), features=frozenset({"b", "c"})
+        ))
+
+        async with server, client:
+            caps = await wait_for(client.handshake(), 5)
+
+            self.assertFalse(caps.legacy)
+            self.assertEqual(caps.header_codec, "binary")
+            self.assertEqual(caps.max_message_size, 512)
+            self.assertEqual(caps.compression, ("lz4",))
+            self.assertEqual(caps.features, frozenset({"b"}))
+            self.assertIs(c_client.capabilities, caps)
+
+            # Each side sends with the codec it prefers.
+            self.assertEqual(server.capabilities.header_codec, "json")
+            self.assertEqual(server.capabilities.features, frozenset({"b"}))
+            self.assertIs(c_server.capabilities, server.capabilities)
+
+    async def test_handshake_legacy_peer(self):
+        c_client, c_server = pipe_bidi()
+        client = Multiplexer(c_client, Capabilities(version=PROTOCOL_VERSION))
+        server = Multiplexer(c_server)
+
+        async with server, client:
+            caps = await wait_for(client.handshake(timeout=30), 5)
+
+        self.assertIs(caps, LEGACY)
+
+    async def test_handshake_timeout(self):
+        c_faked_networking, c_multiplexed = pipe_bidi()
+        multiplexer = Multiplexer(c_multiplexed, Capabilities(version=PROTOCOL_VERSION))
+
+        async with c_faked_networking, multiplexer:
+            caps = await wait_for(multiplexer.handshake(timeout=0.1), 5)
+            msg: Message = await wait_for(c_faked_networking.read(), 5)
+
+        self.assertIs(caps, LEGACY)
+        self.assertEqual(msg.values["target"], HANDSHAKE_TARGET)
+        self.assertEqual(msg.values["type"], "hello")
+        self.assertEqual(msg.values["payload"]["version"], PROTOCOL_VERSION)
+
+
+class TestFlowControl(AsyncTestCase):
+    CAPABILITIES = Capabilities(version=PROTOCOL_VERSION, features=frozenset({FLOW_CONTROL}))
+
+    async def test_slow_channel_blocks_only_itself(self):
+        window = 4 * MESSAGE_COST
+        c_client, c_server = pipe_bidi()
+        client = Multiplexer(c_client, self.CAPABILITIES, window=window)
+        server = Multiplexer(c_server, self.CAPABILITIES, window=window)
+
+        async with server, client:
+            await wait_for(client.handshake(), 5)
+
+            async with client.connect("slow") as slow_out, server.connect("slow") as slow_in, \
+                    client.connect("fast") as fast_out, server.connect("fast") as fast_in:
+                for _ in range(4):
+                    await wait_for(slow_out.write(Message({}, [])), 5)
+                self.assertEqual(slow_out.credit, 0)
+
+                # The window is used up, so the next write waits for the reader.
+                blocked = ensure_future(slow_out.write(Message({}, [])))
+                await sleep(0.1)
+                self.assertFalse(blocked.done())
+
+                # Other channels are not affected.
+                await wait_for(fast_out.write(Message({"v": 1}, [])), 5)
+                self.assertEqual((await wait_for(fast_in.read(), 5)).values, {"v": 1})
+
+                # Reading a quarter of the window grants new credit.
+                await wait_for(slow_in.read(), 5)
+                await wait_for(blocked, 5)
+
+    async def test_blobs_count_against_window(self):
+        window = 4 * MESSAGE_COST
+        c_client, c_server = pipe_bidi()
+        client = Multiplexer(c_client, self.CAPABILITIES, window=window)
+        server = Multiplexer(c_server, self.CAPABILITIES, window=window)
+
+        async with server, client:
+            await wait_for(client.handshake(), 5)
+
+            async with client.connect("c") as out, server.connect("c") as inp:
+                # A message larger than the window can still be sent on its own.
+                await wait_for(out.write(Message({}, [bytes(2 * window)])), 5)
+                self.assertLess(out.credit, 0)
+
+                with self.assertRaises(TimeoutError):
+                    await wait_for(out.write(Message({}, [])), 0.1)
+
+    async def test_without_negotiation(self):
+        window = 4 * MESSAGE_COST
+        c_client, c_server = pipe_bidi()
+        client = Multiplexer(c_client, window=window)
+        server = Multiplexer(c_server, window=window)
+
+        async with server, client:
+            async with client.connect("c") as out, server.connect("c"):
+                for _ in range(8):
+                    await wait_for(out.write(Message({}, [])), 5)
+
+
+class HandOverOutputStream(MessageOutputStream):
+    """
+    Hands messages over right away and then waits, like a transport draining its buffer.
+    """
+
+    def __init__(self):
+        self.written = []
+        self.drained = Event()
+
+    async def write(self, message: Message) -> NoReturn:
+        self.written.append(message)
+        await self.drained.wait()
+
+    async def close(self) -> NoReturn:
+        pass
+
+    async def _acquire(self) -> NoReturn:
+        pass
+
+    async def _release(self) -> NoReturn:
+        pass
+
+
+class TestFragments(AsyncTestCase):
+    CAPABILITIES = Capabilities(version=PROTOCOL_VERSION, features=frozenset({FRAGMENTS}))
+
+    async def test_reassembled_transparently(self):
+        c_client, c_server = pipe_bidi()
+        client = Multiplexer(c_client, self.CAPABILITIES, fragment_size=16)
+        server = Multiplexer(c_server, self.CAPABILITIES, fragment_size=16)
+
+        async with server, client:
+            await wait_for(client.handshake(), 5)
+
+            async with client.connect("c") as out, server.connect("c") as inp:
+                blobs = [bytes(range(40)), b"", b"0123456789"]
+                await wait_for(out.write(Message({"v": 1}, blobs)), 5)
+                msg = await wait_for(inp.read(), 5)
+
+        self.assertEqual(msg.values, {"v": 1})
+        self.assertEqual([bytes(blob) for blob in msg.blobs], blobs)
+
+    async def test_fragments_interleave(self):
+        c_faked_networking, c_multiplexed = pipe_bidi()
+        multiplexer = Multiplexer(c_multiplexed, fragment_size=16)
+
+        async with c_faked_networking, multiplexer:
+            multiplexer.capabilities = self.CAPABILITIES
+            bulk = ensure_future(multiplexer.write(Message({"target": "bulk", "payload": {}}, [bytes(64)])))
+            await sleep(0)
+            await wait_for(multiplexer.write(Message({"target": "small", "payload": {}}, [bytes(4)])), 5)
+            await wait_for(bulk, 5)
+
+            targets = []
+            for _ in range(5):
+                msg = await wait_for(c_faked_networking.read(), 5)
+                targets.append((msg.values["target"], msg.values.get("type", "message")))
+
+        self.assertEqual(targets[0], ("bulk", "fragment"))
+        self.assertIn(("small", "message"), targets[1:-1])
+        self.assertEqual(targets[-1], ("bulk", "fragment"))
+
+    async def test_cancelled_write_aborts(self):
+        c_faked_networking, c_multiplexed = pipe_bidi(max_messages=1)
+        multiplexer = Multiplexer(c_multiplexed, fragment_size=16)
+
+        async with c_faked_networking, multiplexer:
+            multiplexer.capabilities = self.CAPABILITIES
+            write = ensure_future(multiplexer.write(Message({"target": "c", "payload": {}}, [bytes(64)])))
+            await sleep(0.1)
+            write.cancel()
+
+            first = await wait_for(c_faked_networking.read(), 5)
+            abort = await wait_for(c_faked_networking.read(), 5)
+            await gather(write, return_exceptions=True)
+
+        self.assertIn("message", first.values)
+        self.assertEqual(abort.values["id"], first.values["id"])
+        self.assertTrue(abort.values["abort"])
+
+    async def test_cancelled_first_fragment_aborts(self):
+        output = HandOverOutputStream()
+        multiplexer = Multiplexer(Connection(pipe()[0], output), fragment_size=16)
+
+        async with multiplexer:
+            multiplexer.capabilities = self.CAPABILITIES
+            write = ensure_future(multiplexer.write(Message({"target": "c", "payload": {}}, [bytes(64)])))
+            while not output.written:
+                await sleep(0)
+
+            # The first fragment reached the transport, but its write did not finish.
+            write.cancel()
+            output.drained.set()
+            await gather(write, return_exceptions=True)
+
+        first, abort = output.written
+        self.assertIn("message", first.values)
+        self.assertEqual(abort.values["id"], first.values["id"])
+        self.assertTrue(abort.values["abort"])
+
+    async def test_not_fragmented_without_negotiation(self):
+        c_faked_networking, c_multiplexed = pipe_bidi()
+        multiplexer = Multiplexer(c_multiplexed, fragment_size=16)
+
+        async with c_faked_networking, multiplexer:
+            await wait_for(multiplexer.write(Message({"target": "c", "payload": {}}, [bytes(64)])), 5)
+            msg = await wait_for(c_faked_networking.read(), 5)
+
+        self.assertNotIn("type", msg.values)
+        self.assertEqual(len(msg.blobs[0]), 64)
+
+
+class TestWriteScheduler(AsyncTestCase):
+
+    async def test_priority_goes_first(self):
+        scheduler = WriteScheduler()
+        order = []
+
+        async def writer(name, priority):
+            await scheduler.acquire(priority)
+            order.append(name)
+            scheduler.release()
+
+        await scheduler.acquire()
+        normal = ensure_future(writer("normal", PRIORITY_NORMAL))
+        control = ensure_future(writer("control", PRIORITY_CONTROL))
+        await sleep(0)
+        scheduler.release()
+        await wait_for(normal, 5)
+        await wait_for(control, 5)
+
+        self.assertEqual(order, ["control", "normal"])
+
+    async def test_cancelled_waiter_passes_turn(self):
+        scheduler = WriteScheduler()
+        await scheduler.acquire()
+
+        cancelled = ensure_future(scheduler.acquire())
+        await sleep(0)
+        cancelled.cancel()
+        await sleep(0)
+        scheduler.release()
+
+        await wait_for(scheduler.acquire(), 5)
+        scheduler.release()
+        self.assertEqual(scheduler.waiting, 0)
@@ -17,7 +17,7 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import time
-from asyncio import get_running_loop, wait_for
+from asyncio import get_running_loop, wait_for, ensure_future
 from asyncio import sleep, TimeoutError
 
 from aiounittest import AsyncTestCase
@@ -81,4 +81,57 @@ class TestPipeNetworking(AsyncTestCase):
             task = get_running_loop().create_task(_concurrent())
             await sleep(1.2)
             await pc.close()
-            await task
\ No newline at end of file
+            await task
+    async def test_message_limit(self):
+        pc = Connection(*pipe(max_messages=2))
+        async with pc:
+            await wait_for(pc.write(Message({"i": 0}, [])), 1)
+            await wait_for(pc.write(Message({"i": 1}, [])), 1)
+
+            blocked = ensure_future(pc.write(Message({"i": 2}, [])))
+            await sleep(0.1)
+            self.assertFalse(blocked.done())
+
+            self.assertEqual((await wait_for(pc.read(), 1)).values, {"i": 0})
+            await wait_for(blocked, 1)
+            self.assertEqual(pc.input.pipe.peak_messages, 2)
+            self.assertEqual(pc.input.pipe.pauses, 1)
+
+    async def test_byte_watermarks(self):
+        pc = Connection(*pipe(max_bytes=100, low_water=40))
+        async with pc:
+            data = pc.input.pipe
+            for _ in range(2):
+                await wait_for(pc.write(Message({}, [bytes(50)])), 1)
+            self.assertEqual(data.queued_bytes, 100)
+
+            blocked = ensure_future(pc.write(Message({}, [memoryview(bytes(50))])))
+            await sleep(0.1)
+            self.assertFalse(blocked.done())
+
+            # 50 bytes left is above the low watermark.
+            await wait_for(pc.read(), 1)
+            await sleep(0.1)
+            self.assertFalse(blocked.done())
+
+            await wait_for(pc.read(), 1)
+            await wait_for(blocked, 1)
+            self.assertEqual(data.queued_bytes, 50)
+            self.assertEqual(data.peak_bytes, 100)
+
+    async def test_oversized_message(self):
+        pc = Connection(*pipe(max_bytes=10))
+        async with pc:
+            # A single message may exceed the limit if nothing else is queued.
+            await wait_for(pc.write(Message({}, [bytes(100)])), 1)
+            with self.assertRaises(TimeoutError):
+                await wait_for(pc.write(Message({}, [bytes(1)])), 0.1)
+
+    async def test_close_releases_writers(self):
+        pc = Connection(*pipe(max_messages=1))
+        async with pc:
+            await wait_for(pc.write(Message({}, [])), 1)
+            blocked = ensure_future(pc.write(Message({}, [])))
+            await sleep(0.1)
+            await pc.close()
+            await wait_for(blocked, 1)
@@ -16,12 +16,17 @@
 #
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
-from asyncio import wait_for
+from asyncio import wait_for, gather
 
 from aiounittest import AsyncTestCase
 
-from yuuno2.clips.remote import ClipServer, RemoteClip
+from yuuno2.format import RawFormat, Size, Rect
+from yuuno2.typings import Buffer
+
+from yuuno2.clips.remote import ClipServer, RemoteClip, CompressedPlane
 from yuuno2.format import GRAY8, RGB24
+from yuuno2.networking.capabilities import Capabilities, DELTA, SCALED, CROP, THUMBNAILS
+from yuuno2.networking.delta import DeltaDecoder
 from yuuno2.networking.pipe import pipe_bidi
 from yuuno2.tests.mocks import MockClip, MockFrame
 from yuuno2.tests.utils import timeout_context
@@ -36,6 +41,96 @@ class SingleFrameMockClip(MockClip):
         return self.frame
 
 
+class PlaneMockFrame(MockFrame):
+
+    @property
+    def size(self) -> Size:
+        return Size(4, 2)
+
+    async def render_into(self, buffer: Buffer, plane: int, format: RawFormat, offset: int = 0) -> int:
+        sz = format.get_plane_size(plane, self.size)
+        buffer[offset:offset+sz] = bytes([plane+1]) * sz
+        return sz
+
+
+class LargePlaneMockFrame(PlaneMockFrame):
+
+    @property
+    def size(self) -> Size:
+        return Size(512, 256)
+
+
+class GradientMockFrame(PlaneMockFrame):
+
+    def __init__(self, frame: int = 0):
+        self.frame = frame
+
+    @property
+    def size(self) -> Size:
+        return Size(8, 4)
+
+    async def render_into(self, buffer: Buffer, plane: int, format: RawFormat, offset: int = 0) -> int:
+        w, h = self.size
+        buffer[offset:offset+w*h] = bytes(self.frame + plane*64 + y*8 + x for y in range(h) for x in range(w))
+        return w*h
+
+
+class GradientMockClip(MockClip):
+
+    def __len__(self):
+        return 10
+
+    def __getitem__(self, item):
+        return GradientMockFrame(item)
+
+
+class SteppingMockFrame(PlaneMockFrame):
+
+    def __init__(self, frame: int):
+        self.frame = frame
+
+    async def render_into(self, buffer: Buffer, plane: int, format: RawFormat, offset: int = 0) -> int:
+        sz = await super().render_into(buffer, plane, format, offset)
+        # Only the first byte changes between frames.
+        buffer[offset] = self.frame
+        return sz
+
+
+class SteppingMockClip(MockClip):
+
+    def __len__(self):
+        return 10
+
+    def __getitem__(self, item):
+        return SteppingMockFrame(item)
+
+
+class LosingDeltaDecoder(DeltaDecoder):
+
+    def __init__(self, decoder: DeltaDecoder):
+        super().__init__()
+        self._references = dict(decoder._references)
+        self.lost = False
+
+    def decode(self, key, base, ref, blobs):
+        # Pretend the reference was replaced once.
+        if base is not None and not self.lost:
+            self.lost = True
+            return None
+        return super().decode(key, base, ref, blobs)
+
+
+class CountingClipServer(ClipServer):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.render_calls = []
+
+    async def on_render(self, frame: int, format=None, planes=None):
+        self.render_calls.append(planes)
+        return await super().on_render(frame, format, planes)
+
+
 class RemoteClipTest(AsyncTestCase):
 
     async def test_clip_metadata_transmit(self):
@@ -138,3 +233,349 @@ class RemoteClipTest(AsyncTestCase):
                     data = bytearray(remote_frame.native_format.get_plane_size(0, remote_frame.size))
                     self.assertEqual(await remote_frame.render_into(data, 0, remote_frame.native_format, 0), 0)
 
+    async def test_clip_frame_render_reuses_buffers(self):
+        c_client, c_server = pipe_bidi()
+        mock_frame = PlaneMockFrame()
+        mock_clip = SingleFrameMockClip(mock_frame)
+        async with mock_clip, mock_frame:
+            server = ClipServer(mock_clip, c_server)
+            client = RemoteClip(c_client)
+
+            async with timeout_context(server, 10), timeout_context(client, 10):
+                for plane in (0, 1, 2, 0):
+                    async with client[0] as remote_frame:
+                        data = bytearray(RGB24.get_plane_size(plane, remote_frame.size))
+                        self.assertEqual(await wait_for(remote_frame.render_into(data, plane, RGB24, 0), 5), 8)
+                        self.assertEqual(data, bytes([plane+1]) * 8)
+
+                # Each frame fetches all three planes in one request.
+                self.assertEqual(server.buffer_pool.misses, 3)
+                self.assertEqual(server.buffer_pool.hits, 9)
+
+    async def test_dropped_response_buffers_are_not_reused(self):
+        c_client, c_server = pipe_bidi()
+        mock_frame = PlaneMockFrame()
+        mock_clip = SingleFrameMockClip(mock_frame)
+        async with mock_clip, mock_frame, c_client:
+            server = ClipServer(mock_clip, c_server)
+
+            async with timeout_context(server, 10):
+                dropped = await server.on_render(0, RGB24.to_json(), [0, 1, 2])
+                # The write was interrupted, so the transport might still read these buffers.
+                server.response_dropped(dropped)
+                self.assertEqual(server.buffer_pool.idle_bytes, 0)
+                self.assertEqual(server._leased, {})
+
+                sent = await server.on_render(0, RGB24.to_json(), [0, 1, 2])
+                server.response_sent(sent)
+                self.assertGreater(server.buffer_pool.idle_bytes, 0)
+                self.assertEqual(server._leased, {})
+
+    async def test_clip_frame_render_planes(self):
+        c_client, c_server = pipe_bidi()
+        mock_frame = PlaneMockFrame()
+        mock_clip = SingleFrameMockClip(mock_frame)
+        async with mock_clip, mock_frame:
+            server = CountingClipServer(mock_clip, c_server)
+            client = RemoteClip(c_client)
+
+            async with timeout_context(server, 10), timeout_context(client, 10):
+                async with client[0] as remote_frame:
+                    buffers = [bytearray(8) for _ in range(3)]
+                    sizes = await wait_for(remote_frame.render_planes(RGB24, [0, 1, 2], buffers), 5)
+                    self.assertEqual(sizes, [8, 8, 8])
+                    self.assertEqual(buffers, [bytes([p+1]) * 8 for p in range(3)])
+
+                    # Served from the plane cache.
+                    data = bytearray(10)
+                    self.assertEqual(await wait_for(remote_frame.render_into(data, 2, RGB24, 2), 5), 8)
+                    self.assertEqual(data, b"\0\0" + bytes([3]) * 8)
+                    self.assertTrue(await remote_frame.can_render(RGB24))
+
+                self.assertEqual(server.render_calls, [[0, 1, 2]])
+
+    async def test_clip_frame_render_into_fetches_all_planes(self):
+        c_client, c_server = pipe_bidi()
+        mock_frame = PlaneMockFrame()
+        mock_clip = SingleFrameMockClip(mock_frame)
+        async with mock_clip, mock_frame:
+            server = CountingClipServer(mock_clip, c_server)
+            client = RemoteClip(c_client)
+
+            async with timeout_context(server, 10), timeout_context(client, 10):
+                async with client[0] as remote_frame:
+                    remote_frame.PLANE_CACHE_TTL = 0
+                    buffers = [bytearray(8) for _ in range(3)]
+                    await wait_for(gather(*(
+                        remote_frame.render_into(buf, p, RGB24) for p, buf in enumerate(buffers)
+                    )), 5)
+                    self.assertEqual(buffers, [bytes([p+1]) * 8 for p in range(3)])
+
+                    # Expired.
+                    await wait_for(remote_frame.render_into(buffers[0], 0, RGB24), 5)
+
+                    with self.assertRaises(IndexError):
+                        await remote_frame.render_into(buffers[0], 3, RGB24)
+
+                self.assertEqual(server.render_calls, [[0, 1, 2], [0, 1, 2]])
+
+    async def test_clip_frame_render_compressed(self):
+        c_client, c_server = pipe_bidi()
+        c_client.capabilities = Capabilities(compression=("zlib",))
+        mock_frame = LargePlaneMockFrame()
+        mock_clip = SingleFrameMockClip(mock_frame)
+        async with mock_clip, mock_frame:
+            server = ClipServer(mock_clip, c_server)
+            client = RemoteClip(c_client, compression="auto")
+            self.assertEqual(client.compression, "zlib")
+
+            async with timeout_context(server, 10), timeout_context(client, 10):
+                async with client[0] as remote_frame:
+                    size = RGB24.get_plane_size(0, remote_frame.size)
+                    buffers = [bytearray(size) for _ in range(3)]
+                    sizes = await wait_for(remote_frame.render_planes(RGB24, [0, 1, 2], buffers), 5)
+                    self.assertEqual(sizes, [size] * 3)
+                    self.assertEqual(buffers, [bytes([p+1]) * size for p in range(3)])
+
+                    planes = remote_frame._plane_cache[RGB24, None, None][2].result()
+                    self.assertTrue(all(isinstance(p, CompressedPlane) for p in planes.values()))
+
+                    with self.assertRaises(BufferError):
+                        await wait_for(remote_frame.render_into(bytearray(size - 1), 0, RGB24), 5)
+
+                # The buffers were returned right after compressing.
+                self.assertEqual(server.buffer_pool.misses, 3)
+
+    async def test_clip_frame_render_small_planes_uncompressed(self):
+        c_client, c_server = pipe_bidi()
+        c_client.capabilities = Capabilities(compression=("zlib",))
+        mock_frame = PlaneMockFrame()
+        mock_clip = SingleFrameMockClip(mock_frame)
+        async with mock_clip, mock_frame:
+            server = ClipServer(mock_clip, c_server)
+            client = RemoteClip(c_client, compression="zlib")
+
+            async with timeout_context(server, 10), timeout_context(client, 10):
+                async with client[0] as remote_frame:
+                    data = bytearray(8)
+                    self.assertEqual(await wait_for(remote_frame.render_into(data, 1, RGB24), 5), 8)
+                    self.assertEqual(data, bytes([2]) * 8)
+
+                    planes = remote_frame._plane_cache[RGB24, None, None][2].result()
+                    self.assertFalse(any(isinstance(p, CompressedPlane) for p in planes.values()))
+
+    async def render_frames(self, client, frames):
+        rendered = []
+        for frame in frames:
+            async with client[frame] as remote_frame:
+                data = bytearray(8)
+                await wait_for(remote_frame.render_into(data, 1, RGB24), 5)
+                rendered.append(bytes(data))
+        return rendered
+
+    async def test_clip_frame_render_delta(self):
+        c_client, c_server = pipe_bidi()
+        c_client.capabilities = Capabilities(features=frozenset({DELTA}))
+        mock_clip = SteppingMockClip()
+        async with mock_clip:
+            server = ClipServer(mock_clip, c_server, keyframe_interval=3)
+            client = RemoteClip(c_client, delta=True)
+
+            async with timeout_context(server, 10), timeout_context(client, 10):
+                rendered = await self.render_frames(client, range(5))
+                self.assertEqual(rendered, [bytes([f]) + bytes([2]) * 7 for f in range(5)])
+                self.assertEqual(server._deltas.keyframes, 2)
+                self.assertEqual(server._deltas.deltas, 3)
+
+                # The client lost its reference, so the server has to send a keyframe.
+                client.deltas.clear()
+                rendered = await self.render_frames(client, [7])
+                self.assertEqual(rendered, [bytes([7]) + bytes([2]) * 7])
+                self.assertEqual(server._deltas.keyframes, 3)
+
+    async def test_clip_frame_render_delta_resync(self):
+        c_client, c_server = pipe_bidi()
+        c_client.capabilities = Capabilities(features=frozenset({DELTA}))
+        mock_clip = SteppingMockClip()
+        async with mock_clip:
+            server = ClipServer(mock_clip, c_server)
+            client = RemoteClip(c_client, delta=True)
+
+            async with timeout_context(server, 10), timeout_context(client, 10):
+                await self.render_frames(client, [0])
+
+                # Another response replaced the reference while the delta was on its way.
+                client.deltas = LosingDeltaDecoder(client.deltas)
+                rendered = await self.render_frames(client, [1])
+                self.assertEqual(rendered, [bytes([1]) + bytes([2]) * 7])
+
+                # So it was requested again as a keyframe.
+                self.assertEqual(server._deltas.keyframes, 2)
+                self.assertEqual(server._deltas.deltas, 1)
+
+    async def test_clip_frame_render_delta_without_support(self):
+        c_client, c_server = pipe_bidi()
+        mock_clip = SteppingMockClip()
+        async with mock_clip:
+            server = ClipServer(mock_clip, c_server)
+            client = RemoteClip(c_client, delta=True)
+            self.assertFalse(client.delta)
+
+            async with timeout_context(server, 10), timeout_context(client, 10):
+                await self.render_frames(client, [0, 1])
+                self.assertEqual(server._deltas.keyframes + server._deltas.deltas, 0)
+
+    def scaled_planes(self, frame=0):
+        # Each pixel averages a 2x2 block of the gradient.
+        return [bytes(frame + p*64 + 16*y + 2*x + 5 for y in range(2) for x in range(4)) for p in range(3)]
+
+    async def test_clip_frame_render_scaled(self):
+        c_client, c_server = pipe_bidi()
+        c_client.capabilities = Capabilities(features=frozenset({SCALED}))
+        mock_frame = GradientMockFrame()
+        mock_clip = SingleFrameMockClip(mock_frame)
+        async with mock_clip, mock_frame:
+            server = ClipServer(mock_clip, c_server)
+            client = RemoteClip(c_client)
+            self.assertTrue(client.scaled)
+
+            async with timeout_context(server, 10), timeout_context(client, 10):
+                async with client[0] as remote_frame:
+                    buffers = [bytearray(8) for _ in range(3)]
+                    sizes = await wait_for(remote_frame.render_scaled_planes(RGB24, [0, 1, 2], Size(4, 2), buffers), 5)
+                    self.assertEqual(sizes, [8] * 3)
+                    self.assertEqual(buffers, self.scaled_planes())
+
+                    # Only the scaled planes were sent.
+                    planes = remote_frame._plane_cache[RGB24, Size(4, 2), None][2].result()
+                    self.assertEqual([len(planes[p]) for p in range(3)], [8] * 3)
+
+                    data = bytearray(8)
+                    self.assertEqual(await wait_for(remote_frame.render_scaled_into(data, 2, RGB24, Size(4, 2)), 5), 8)
+                    self.assertEqual(data, self.scaled_planes()[2])
+
+                    with self.assertRaises(ValueError):
+                        await wait_for(remote_frame.render_scaled_into(data, 0, RGB24, Size(16, 8)), 5)
+
+    async def test_clip_frame_render_scaled_without_support(self):
+        c_client, c_server = pipe_bidi()
+        mock_frame = GradientMockFrame()
+        mock_clip = SingleFrameMockClip(mock_frame)
+        async with mock_clip, mock_frame:
+            server = ClipServer(mock_clip, c_server)
+            client = RemoteClip(c_client)
+            self.assertFalse(client.scaled)
+
+            async with timeout_context(server, 10), timeout_context(client, 10):
+                async with client[0] as remote_frame:
+                    buffers = [bytearray(8) for _ in range(3)]
+                    await wait_for(remote_frame.render_scaled_planes(RGB24, [0, 1, 2], Size(4, 2), buffers), 5)
+                    self.assertEqual(buffers, self.scaled_planes())
+
+                    # The full planes were fetched and scaled locally.
+                    self.assertNotIn((RGB24, Size(4, 2), None), remote_frame._plane_cache)
+                    self.assertIn((RGB24, None, None), remote_frame._plane_cache)
+
+    def cropped_planes(self):
+        return [bytes(p*64 + y*8 + x for y in range(1, 3) for x in range(2, 5)) for p in range(3)]
+
+    async def test_clip_frame_render_cropped(self):
+        c_client, c_server = pipe_bidi()
+        c_client.capabilities = Capabilities(features=frozenset({CROP}))
+        mock_frame = GradientMockFrame()
+        mock_clip = SingleFrameMockClip(mock_frame)
+        rect = Rect(2, 1, 3, 2)
+        async with mock_clip, mock_frame:
+            server = ClipServer(mock_clip, c_server)
+            client = RemoteClip(c_client)
+            self.assertTrue(client.cropped)
+
+            async with timeout_context(server, 10), timeout_context(client, 10):
+                async with client[0] as remote_frame:
+                    buffers = [bytearray(6) for _ in range(3)]
+                    sizes = await wait_for(remote_frame.render_cropped_planes(RGB24, [0, 1, 2], rect, buffers), 5)
+                    self.assertEqual(sizes, [6] * 3)
+                    self.assertEqual(buffers, self.cropped_planes())
+
+                    # Only the visible area was sent.
+                    planes = remote_frame._plane_cache[RGB24, None, rect][2].result()
+                    self.assertEqual([len(planes[p]) for p in range(3)], [6] * 3)
+
+                    data = bytearray(6)
+                    self.assertEqual(await wait_for(remote_frame.render_cropped_into(data, 1, RGB24, rect), 5), 6)
+                    self.assertEqual(data, self.cropped_planes()[1])
+
+                    with self.assertRaises(ValueError):
+                        await wait_for(remote_frame.render_cropped_into(data, 0, RGB24, Rect(6, 0, 4, 4)), 5)
+
+    async def test_clip_frame_render_cropped_without_support(self):
+        c_client, c_server = pipe_bidi()
+        mock_frame = GradientMockFrame()
+        mock_clip = SingleFrameMockClip(mock_frame)
+        async with mock_clip, mock_frame:
+            server = ClipServer(mock_clip, c_server)
+            client = RemoteClip(c_client)
+            self.assertFalse(client.cropped)
+
+            async with timeout_context(server, 10), timeout_context(client, 10):
+                async with client[0] as remote_frame:
+                    buffers = [bytearray(6) for _ in range(3)]
+                    await wait_for(remote_frame.render_cropped_planes(RGB24, [0, 1, 2], Rect(2, 1, 3, 2), buffers), 5)
+                    self.assertEqual(buffers, self.cropped_planes())
+                    self.assertIn((RGB24, None, None), remote_frame._plane_cache)
+
+    async def test_clip_render_thumbnails(self):
+        c_client, c_server = pipe_bidi()
+        c_client.capabilities = Capabilities(features=frozenset({THUMBNAILS}))
+        mock_clip = GradientMockClip()
+        async with mock_clip:
+            server = CountingClipServer(mock_clip, c_server)
+            client = RemoteClip(c_client)
+            self.assertTrue(client.thumbnails)
+
+            async with timeout_context(server, 10), timeout_context(client, 10):
+                thumbnails = await wait_for(client.render_thumbnails([0, 3, 9], Size(4, 2), RGB24), 5)
+                self.assertEqual(
+                    [[bytes(p) for p in planes] for planes in thumbnails],
+                    [self.scaled_planes(f) for f in (0, 3, 9)]
+                )
+
+                # All thumbnails came with a single request.
+                self.assertEqual(server.render_calls, [])
+
+                with self.assertRaises(IndexError):
+                    await wait_for(client.render_thumbnails([10], Size(4, 2), RGB24), 5)
+
+    async def test_clip_render_thumbnails_compressed(self):
+        c_client, c_server = pipe_bidi()
+        c_client.capabilities = Capabilities(compression=("zlib",), features=frozenset({THUMBNAILS}))
+        mock_frame = LargePlaneMockFrame()
+        mock_clip = SingleFrameMockClip(mock_frame)
+        async with mock_clip, mock_frame:
+            server = ClipServer(mock_clip, c_server)
+            server.COMPRESSION_THRESHOLD = 0
+            client = RemoteClip(c_client, compression="zlib")
+
+            async with timeout_context(server, 10), timeout_context(client, 10):
+                thumbnails = await wait_for(client.render_thumbnails([0, 0], Size(256, 128), RGB24), 5)
+                self.assertEqual(len(thumbnails), 2)
+                for planes in thumbnails:
+                    self.assertEqual(planes, [bytes([p+1]) * 256 * 128 for p in range(3)])
+                    # The planes were decompressed into fresh buffers.
+                    self.assertTrue(all(isinstance(p, bytearray) for p in planes))
+
+    async def test_clip_render_thumbnails_without_support(self):
+        c_client, c_server = pipe_bidi()
+        mock_clip = GradientMockClip()
+        async with mock_clip:
+            server = CountingClipServer(mock_clip, c_server)
+            client = RemoteClip(c_client)
+            self.assertFalse(client.thumbnails)
+
+            async with timeout_context(server, 10), timeout_context(client, 10):
+                thumbnails = await wait_for(client.render_thumbnails([0, 3, 9], Size(4, 2), RGB24), 5)
+                self.assertEqual(
+                    [[bytes(p) for p in planes] for planes in thumbnails],
+                    [self.scaled_planes(f) for f in (0, 3, 9)]
+                )
+                self.assertEqual(len(server.render_calls), 3)
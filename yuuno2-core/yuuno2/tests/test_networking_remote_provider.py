@@ -121,3 +121,5 @@ class TestRemoteScriptProvider(AsyncTestCase):
             rsc = await rspc.get()
             async with timeout_context(rsc, 10):
                 self.assertEqual(await wait_for(rsc.get_config("id"), 10), id(self))
+                self.assertFalse(rsc.capabilities.legacy)
+            self.assertFalse(rspc.capabilities.legacy)
@@ -16,11 +16,12 @@
 #
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
-from asyncio import wait_for
+from asyncio import wait_for, Event, sleep, gather, get_running_loop, CancelledError, TimeoutError
 
 from aiounittest import AsyncTestCase
 
 from yuuno2.networking.base import Message
+from yuuno2.networking.capabilities import Capabilities, PROTOCOL_VERSION, BATCH
 from yuuno2.networking.pipe import pipe_bidi
 from yuuno2.networking.reqresp import ReqRespServer, ReqRespClient, function, CallFailed
 
@@ -36,11 +37,33 @@ class MockReqRespServer(ReqRespServer):
     async def on_error(self) -> Message:
         raise RuntimeError("Generic Error.")
 
+    async def on_cancelled(self) -> Message:
+        raise CancelledError()
+
 
 class MockReqRespClient(ReqRespClient):
     echo = function()
     error = function()
     non_existent = function()
+    block = function()
+
+
+class BlockingReqRespServer(MockReqRespServer):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.unblock = Event()
+        self.running = 0
+        self.max_running = 0
+
+    async def on_block(self) -> Message:
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await self.unblock.wait()
+        finally:
+            self.running -= 1
+        return Message({}, [])
 
 class ReqRespServerTest(AsyncTestCase):
     async def test_invalid_packet__no_id(self):
@@ -144,3 +167,359 @@ class ReqRespClientTest(AsyncTestCase):
         async with srv, cli:
             with self.assertRaises(CallFailed):
                 await wait_for(cli.non_existent(), 5)
+
+
+class ReqRespConcurrencyTest(AsyncTestCase):
+
+    async def test_slow_request_does_not_block(self):
+        c1, c2 = pipe_bidi()
+        srv = BlockingReqRespServer(c1, max_concurrency=2)
+        cli = MockReqRespClient(c2)
+
+        async with srv, cli:
+            blocked = get_running_loop().create_task(cli.block())
+            result: Message = await wait_for(cli.echo(test=1), 5)
+            self.assertEqual(Message({"test": 1}, []), result)
+            self.assertFalse(blocked.done())
+
+            srv.unblock.set()
+            await wait_for(blocked, 5)
+
+    async def test_max_concurrency(self):
+        c1, c2 = pipe_bidi()
+        srv = BlockingReqRespServer(c1, max_concurrency=3)
+        cli = MockReqRespClient(c2)
+
+        async with srv, cli:
+            calls = gather(*(cli.block() for _ in range(6)))
+            for _ in range(10):
+                await sleep(0)
+            self.assertEqual(3, srv.running)
+
+            srv.unblock.set()
+            await wait_for(calls, 5)
+            self.assertEqual(3, srv.max_running)
+
+    async def test_method_concurrency(self):
+        c1, c2 = pipe_bidi()
+        srv = BlockingReqRespServer(c1, max_concurrency=4, method_concurrency={"block": 1})
+        cli = MockReqRespClient(c2)
+
+        async with srv, cli:
+            calls = gather(*(cli.block() for _ in range(3)))
+            result: Message = await wait_for(cli.echo(), 5)
+            self.assertEqual(Message({}, []), result)
+            self.assertEqual(1, srv.running)
+
+            srv.unblock.set()
+            await wait_for(calls, 5)
+            self.assertEqual(1, srv.max_running)
+
+    async def test_method_concurrency_does_not_starve(self):
+        c1, c2 = pipe_bidi()
+        srv = BlockingReqRespServer(c1, max_concurrency=2, method_concurrency={"block": 1})
+        cli = MockReqRespClient(c2)
+
+        async with srv, cli:
+            calls = gather(*(cli.block() for _ in range(3)))
+            for _ in range(10):
+                await sleep(0)
+
+            # The waiting calls leave the second slot to other methods.
+            result: Message = await wait_for(cli.echo(), 5)
+            self.assertEqual(Message({}, []), result)
+            self.assertEqual(1, srv.running)
+
+            srv.unblock.set()
+            await wait_for(calls, 5)
+
+    async def test_reader_stops_at_pending_limit(self):
+        c1, c2 = pipe_bidi()
+        srv = BlockingReqRespServer(c1, max_concurrency=1, max_pending=2)
+
+        async with srv, c2:
+            for id in range(5):
+                await c2.write(Message({'id': id, 'type': 'request', 'method': 'block', 'params': {}}))
+            for _ in range(10):
+                await sleep(0)
+
+            # One request runs and two wait. The reader holds the fourth request
+            # until a slot frees up and leaves the last one in the pipe.
+            self.assertEqual(1, srv.running)
+            self.assertEqual(3, len(srv._tasks))
+            self.assertEqual(1, c1.input.pipe.queue.qsize())
+
+            srv.unblock.set()
+            responses = [await wait_for(c2.read(), 5) for _ in range(5)]
+            self.assertEqual(list(range(5)), sorted(r.values['id'] for r in responses))
+            self.assertEqual(1, srv.max_running)
+
+    async def test_release_cancels_requests(self):
+        c1, c2 = pipe_bidi()
+        srv = BlockingReqRespServer(c1, max_concurrency=2)
+        cli = MockReqRespClient(c2)
+
+        async with cli:
+            async with srv:
+                call = get_running_loop().create_task(cli.block())
+                for _ in range(10):
+                    await sleep(0)
+                self.assertEqual(1, srv.running)
+            self.assertEqual(0, srv.running)
+
+            call.cancel()
+            await gather(call, return_exceptions=True)
+
+
+async def until(condition):
+    while not condition():
+        await sleep(0)
+
+
+class ReqRespCancelTest(AsyncTestCase):
+
+    async def test_cancel_running_request(self):
+        c1, c2 = pipe_bidi()
+        srv = BlockingReqRespServer(c1, max_concurrency=2)
+        cli = MockReqRespClient(c2)
+
+        async with srv, cli:
+            call = get_running_loop().create_task(cli.block())
+            for _ in range(10):
+                await sleep(0)
+            self.assertEqual(1, srv.running)
+
+            call.cancel()
+            with self.assertRaises(CancelledError):
+                await wait_for(call, 5)
+
+            # The server confirms the cancellation.
+            await wait_for(until(lambda: not cli._cancelled), 5)
+            self.assertEqual(0, srv.running)
+            self.assertEqual(1, srv.stats.cancelled)
+            self.assertEqual(1, cli.stats.cancelled)
+
+            # The connection is still usable.
+            result: Message = await wait_for(cli.echo(test=1), 5)
+            self.assertEqual(Message({"test": 1}, []), result)
+
+    async def test_cancellation_is_not_an_error(self):
+        c1, _ = pipe_bidi()
+        srv = MockReqRespServer(c1)
+
+        with self.assertRaises(CancelledError):
+            await srv.handle_request(1, {"method": "cancelled"}, [])
+
+    async def test_cancel_waiting_request(self):
+        c1, c2 = pipe_bidi()
+        srv = BlockingReqRespServer(c1, max_concurrency=1)
+        cli = MockReqRespClient(c2)
+
+        async with srv, cli:
+            running = get_running_loop().create_task(cli.block())
+            waiting = get_running_loop().create_task(cli.block())
+            for _ in range(10):
+                await sleep(0)
+
+            # The reader still sees the cancellation while all slots are used.
+            waiting.cancel()
+            await gather(waiting, return_exceptions=True)
+            await wait_for(until(lambda: srv.stats.cancelled == 1), 5)
+
+            srv.unblock.set()
+            await wait_for(running, 5)
+            self.assertEqual(1, srv.max_running)
+
+    async def test_cancel_after_response(self):
+        c1, c2 = pipe_bidi()
+        srv = MockReqRespServer(c1)
+        cli = MockReqRespClient(c2)
+
+        async with srv, cli:
+            await wait_for(cli.echo(), 5)
+            await cli._cancel(0)
+            self.assertEqual(0, cli.stats.cancelled)
+
+            # A response that was already on its way is counted as waste.
+            cli._cancelled.add(10)
+            await cli._delivered(Message({"id": 10, "type": "response", "result": {}}, [b"1234"]))
+            self.assertEqual(4, cli.stats.wasted_bytes)
+            self.assertEqual(set(), cli._cancelled)
+
+
+class ReqRespTimeoutTest(AsyncTestCase):
+
+    async def test_call_timeout(self):
+        c1, c2 = pipe_bidi()
+        srv = BlockingReqRespServer(c1, max_concurrency=2)
+        cli = MockReqRespClient(c2)
+
+        async with srv, cli:
+            with self.assertRaises(TimeoutError):
+                await wait_for(cli.block(_timeout=0.1), 5)
+
+            # The waiter is gone and the server stopped working on the request.
+            self.assertEqual({}, cli._waiters)
+            await wait_for(until(lambda: not cli._cancelled), 5)
+            self.assertEqual(0, srv.running)
+            self.assertEqual(1, cli.stats.expired)
+
+            result: Message = await wait_for(cli.echo(test=1, _timeout=5), 5)
+            self.assertEqual(Message({"test": 1}, []), result)
+
+    async def test_default_timeout(self):
+        c1, c2 = pipe_bidi()
+        srv = BlockingReqRespServer(c1, max_concurrency=2)
+        cli = MockReqRespClient(c2, timeout=0.1)
+
+        async with srv, cli:
+            with self.assertRaises(TimeoutError):
+                await wait_for(cli.block(), 5)
+
+            # The default can be overridden per call.
+            call = get_running_loop().create_task(cli.block(_timeout=None))
+            await sleep(0.2)
+            self.assertFalse(call.done())
+            srv.unblock.set()
+            await wait_for(call, 5)
+
+    async def test_server_drops_expired_requests(self):
+        c1, c2 = pipe_bidi()
+        srv = MockReqRespServer(c1)
+
+        async with srv, c2:
+            await c2.write(Message({"id": 1, "type": "request", "method": "echo", "params": {}, "timeout": 0}))
+            response: Message = await wait_for(c2.read(), 5)
+
+        self.assertEqual("error", response.values["type"])
+        self.assertEqual(1, response.values["id"])
+        self.assertEqual(1, srv.stats.expired)
+
+
+class ReqRespBatchTest(AsyncTestCase):
+    CAPABILITIES = Capabilities(version=PROTOCOL_VERSION, features=frozenset({BATCH}))
+
+    async def test_calls_are_coalesced(self):
+        c1, c2 = pipe_bidi()
+        c2.capabilities = self.CAPABILITIES
+        cli = MockReqRespClient(c2)
+
+        async with c1, cli:
+            calls = gather(cli.echo(a=1), cli.echo(a=2, _buffers=[b"12", b"34"]), cli.echo(a=3))
+            batch: Message = await wait_for(c1.read(), 5)
+            self.assertEqual("batch", batch.values["type"])
+            self.assertEqual([1, 2, 3], [r["params"]["a"] for r in batch.values["requests"]])
+            self.assertEqual([b"12", b"34"], [bytes(b) for b in batch.blobs])
+
+            ids = [r["id"] for r in batch.values["requests"]]
+            await c1.write(Message({"type": "batch", "responses": [
+                {"id": ids[2], "type": "response", "result": {"a": 3}, "blobs": 0},
+                {"id": ids[1], "type": "response", "result": {"a": 2}, "blobs": 1},
+                {"id": ids[0], "type": "error", "error": "Failed.", "blobs": 0},
+            ]}, [b"5678"]))
+
+            with self.assertRaises(CallFailed):
+                await wait_for(calls, 5)
+
+            # A single call is sent as usual.
+            call = get_running_loop().create_task(cli.echo(a=4))
+            single: Message = await wait_for(c1.read(), 5)
+            self.assertEqual("request", single.values["type"])
+            call.cancel()
+            await gather(call, return_exceptions=True)
+
+    async def test_server_answers_batches(self):
+        c1, c2 = pipe_bidi()
+        c2.capabilities = self.CAPABILITIES
+        srv = MockReqRespServer(c1, max_concurrency=4)
+        cli = MockReqRespClient(c2)
+
+        async with srv, cli:
+            results = await wait_for(gather(
+                cli.echo(a=1),
+                cli.echo(a=2, _buffers=[b"12"]),
+                cli.error(),
+                return_exceptions=True
+            ), 5)
+
+        self.assertEqual(Message({"a": 1}, []), results[0])
+        self.assertEqual({"a": 2}, results[1].values)
+        self.assertEqual([b"12"], [bytes(b) for b in results[1].blobs])
+        self.assertIsInstance(results[2], CallFailed)
+        self.assertEqual(3, srv.stats.requests)
+
+    async def test_slow_request_does_not_hold_back_batch(self):
+        c1, c2 = pipe_bidi()
+        c2.capabilities = self.CAPABILITIES
+        srv = BlockingReqRespServer(c1, max_concurrency=4)
+        cli = MockReqRespClient(c2)
+
+        async with srv, cli:
+            blocked = get_running_loop().create_task(cli.block())
+            result: Message = await wait_for(cli.echo(a=1), 5)
+            self.assertEqual(Message({"a": 1}, []), result)
+            self.assertFalse(blocked.done())
+
+            srv.unblock.set()
+            await wait_for(blocked, 5)
+
+    async def test_cancel_batched_request(self):
+        c1, c2 = pipe_bidi()
+        c2.capabilities = self.CAPABILITIES
+        srv = BlockingReqRespServer(c1, max_concurrency=4)
+        cli = MockReqRespClient(c2)
+
+        async with srv, cli:
+            blocked = get_running_loop().create_task(cli.block())
+            echo = get_running_loop().create_task(cli.echo(a=1))
+            await wait_for(until(lambda: srv.running == 1), 5)
+            result: Message = await wait_for(echo, 5)
+            self.assertEqual(Message({"a": 1}, []), result)
+
+            # The server confirms the cancellation of the blocked request on its own.
+            blocked.cancel()
+            await gather(blocked, return_exceptions=True)
+            await wait_for(until(lambda: not cli._cancelled), 5)
+            self.assertEqual(1, srv.stats.cancelled)
+
+    async def test_cancel_before_flush(self):
+        c1, c2 = pipe_bidi()
+        c2.capabilities = self.CAPABILITIES
+        cli = MockReqRespClient(c2)
+
+        async with c1, cli:
+            cancelled = get_running_loop().create_task(cli.echo(a=1))
+            kept = get_running_loop().create_task(cli.echo(a=2))
+            # Let both calls join the batch, then cancel one before the batch is flushed.
+            await sleep(0)
+            cancelled.cancel()
+
+            # Only the remaining call is sent.
+            request: Message = await wait_for(c1.read(), 5)
+            self.assertEqual("request", request.values["type"])
+            self.assertEqual({"a": 2}, request.values["params"])
+
+            await c1.write(Message({"id": request.values["id"], "type": "response", "result": {}}))
+            await wait_for(kept, 5)
+
+            with self.assertRaises(CancelledError):
+                await cancelled
+            self.assertEqual(set(), cli._cancelled)
+            self.assertEqual({}, cli._waiters)
+            self.assertTrue(c1.input.pipe.queue.empty())
+
+    async def test_cancel_all_before_flush(self):
+        c1, c2 = pipe_bidi()
+        c2.capabilities = self.CAPABILITIES
+        cli = MockReqRespClient(c2)
+
+        async with c1, cli:
+            call = get_running_loop().create_task(cli.echo(a=1))
+            await sleep(0)
+            call.cancel()
+            await gather(call, return_exceptions=True)
+            await sleep(0)
+
+            # Nothing was sent.
+            self.assertTrue(c1.input.pipe.queue.empty())
+            self.assertEqual({}, cli._waiters)
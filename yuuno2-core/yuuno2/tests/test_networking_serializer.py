@@ -47,6 +47,17 @@ class TestProtocolParser(TestCase):
             [Message({"test": 1}, [b"ab", b"cd"])]
         )
 
+    def test_read_direct_blobs(self):
+        parser = bytes_protocol(direct_blobs=True)
+        data = b'\x00\x00\x00\x03\x00\x00\x00\x02\x00\x00\x00\x03\x00\x00\x00\x02{}abcde'
+
+        messages = []
+        for i in range(len(data)):
+            messages.extend(parser.feed(data[i:i+1]))
+
+        self.assertEqual(messages, [Message({}, [b"abc", b"de"])])
+        self.assertTrue(all(isinstance(blob, memoryview) for blob in messages[0].blobs))
+
 
 class TestProtocolWriter(TestCase):
 
@@ -75,3 +86,12 @@ class TestProtocolWriter(TestCase):
             ByteOutputStream.write_message(Message({"test": 1}, [b"ab", b"cd"])),
             b'\x00\x00\x00\x03\x00\x00\x00\x0a\x00\x00\x00\x02\x00\x00\x00\x02{"test":1}abcd'
         )
+
+    def test_encode_message_parts(self):
+        blob = memoryview(b"abcd")[1:3]
+        parts = ByteOutputStream.encode_message(Message({"test": 1}, [b"ab", blob]))
+        self.assertEqual(len(parts), 4)
+        self.assertEqual(parts[0], b'\x00\x00\x00\x03\x00\x00\x00\x0a\x00\x00\x00\x02\x00\x00\x00\x02')
+        self.assertEqual(parts[1], b'{"test":1}')
+        self.assertIs(parts[3], blob)
+        self.assertEqual(b''.join(parts), b'\x00\x00\x00\x03\x00\x00\x00\x0a\x00\x00\x00\x02\x00\x00\x00\x02{"test":1}abbc')
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Yuuno - IPython + VapourSynth
+# Copyright (C) 2019 StuxCrystal (Roland Netzsch <stuxcrystal@encode.moe>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from asyncio import sleep, wait_for
+from typing import NoReturn
+
+from aiounittest import AsyncTestCase
+
+from yuuno2.clip import Frame
+from yuuno2.clips.prefetch import PrefetchingClip
+from yuuno2.clips.remote import ClipServer, RemoteClip
+from yuuno2.format import RawFormat, Size, RGB24
+from yuuno2.networking.pipe import pipe_bidi
+from yuuno2.tests.mocks import MockClip, MockFrame
+from yuuno2.tests.utils import timeout_context
+from yuuno2.typings import Buffer
+
+
+class CountingFrame(MockFrame):
+
+    def __init__(self, clip: 'CountingClip', index: int):
+        self.clip = clip
+        self.index = index
+
+    @property
+    def size(self) -> Size:
+        return Size(2, 2)
+
+    async def render_into(self, buffer: Buffer, plane: int, format: RawFormat, offset: int = 0) -> int:
+        self.clip.rendered.append(self.index)
+        sz = format.get_plane_size(plane, self.size)
+        buffer[offset:offset+sz] = bytes([self.index]) * sz
+        return sz
+
+    async def _acquire(self) -> NoReturn:
+        self.clip.live.add(self.index)
+
+    async def _release(self) -> NoReturn:
+        self.clip.live.discard(self.index)
+
+
+class CountingClip(MockClip):
+
+    def __init__(self, length: int = 20):
+        self.length = length
+        self.live = set()
+        self.rendered = []
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, item) -> Frame:
+        return CountingFrame(self, item)
+
+
+async def settle():
+    for _ in range(20):
+        await sleep(0)
+
+
+class PrefetchingClipTest(AsyncTestCase):
+
+    async def render(self, clip, index):
+        async with clip[index] as frame:
+            buffer = bytearray(4)
+            await frame.render_into(buffer, 1, RGB24)
+            self.assertEqual(buffer, bytes([index]) * 4)
+
+    async def test_sequential(self):
+        inner = CountingClip()
+        async with PrefetchingClip(inner, window=3) as clip:
+            for i in range(6):
+                await self.render(clip, i)
+                await settle()
+
+            # The step is known after the third frame.
+            self.assertEqual(clip.misses, 3)
+            self.assertEqual(clip.hits, 3)
+            self.assertEqual(inner.live, {6, 7, 8})
+
+        self.assertEqual(inner.live, set())
+
+    async def test_strided(self):
+        inner = CountingClip()
+        async with PrefetchingClip(inner, window=2) as clip:
+            for i in (10, 8, 6, 4, 2):
+                await self.render(clip, i)
+                await settle()
+
+            self.assertEqual(clip.hits, 2)
+            self.assertEqual(inner.live, {0})
+
+    async def test_pattern_change_cancels(self):
+        inner = CountingClip()
+        async with PrefetchingClip(inner, window=3) as clip:
+            for i in (0, 1, 2, 3):
+                await self.render(clip, i)
+            await settle()
+            self.assertEqual(inner.live, {4, 5, 6})
+
+            await self.render(clip, 15)
+            await settle()
+            self.assertEqual(inner.live, set())
+            self.assertEqual(clip.cancelled, 3)
+            self.assertEqual(clip.hit_rate, 1 / 5)
+
+    async def test_prefetched_frames_are_rendered(self):
+        inner = CountingClip()
+        async with PrefetchingClip(inner, window=1) as clip:
+            for i in (0, 1, 2):
+                await self.render(clip, i)
+            await settle()
+
+            rendered = len(inner.rendered)
+            await self.render(clip, 3)
+            self.assertEqual(len(inner.rendered), rendered)
+
+    async def test_remote_clip(self):
+        c_client, c_server = pipe_bidi()
+        inner = CountingClip()
+        async with inner:
+            server = ClipServer(inner, c_server)
+            remote = RemoteClip(c_client)
+            async with timeout_context(server, 10), timeout_context(remote, 10):
+                async with PrefetchingClip(remote, window=2) as clip:
+                    for i in range(5):
+                        await wait_for(self.render(clip, i), 5)
+                        await settle()
+                    self.assertEqual(clip.hits, 2)
@@ -60,6 +60,22 @@ class TestBuffer(TestCase):
         # Partial inter-block
         self.assertEqual(buf.read(10), b'567890ABCD')
 
+    def test_readinto_partial_blocks(self):
+        buf = Buffer()
+
+        buf.feed(b'abcdef')
+        buf.feed(b'123')
+
+        target = bytearray(4)
+        self.assertEqual(buf.readinto(memoryview(target)), 4)
+        self.assertEqual(target, b'abcd')
+        self.assertEqual(len(buf), 5)
+
+        target = bytearray(10)
+        self.assertEqual(buf.readinto(memoryview(target)), 5)
+        self.assertEqual(target[:5], b'ef123')
+        self.assertEqual(len(buf), 0)
+
     def test_size_partial_blocks(self):
         buf = Buffer()
 
@@ -252,3 +268,17 @@ class ConsumerTest(TestCase):
         self.assertEqual(list(consumer.feed(b"12345")), [])
         self.assertEqual(list(consumer.feed(b"1234")), [])
         self.assertEqual(list(consumer.feed(b"12")), [b"1234512341"])
+
+    def test_consumer_read_into(self):
+        target = bytearray(10)
+
+        @protocol
+        async def _parser():
+            await read_into(memoryview(target))
+            await emit(await read_exactly(2))
+
+        consumer = _parser()
+        self.assertEqual(list(consumer.feed(b"12345")), [])
+        self.assertEqual(list(consumer.feed(b"1234")), [])
+        self.assertEqual(list(consumer.feed(b"12ab")), [b"2a"])
+        self.assertEqual(target, b"1234512341")
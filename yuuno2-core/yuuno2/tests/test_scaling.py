@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Yuuno - IPython + VapourSynth
+# Copyright (C) 2019 StuxCrystal (Roland Netzsch <stuxcrystal@encode.moe>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from array import array
+from unittest import TestCase
+
+from yuuno2.format import RawFormat, Size, GRAY8, SampleType, ColorFamily
+from yuuno2.scaling import box_scale_into, scaled_size
+
+GRAY16 = GRAY8.replace(bits_per_sample=16)
+GRAYS = GRAY8.replace(bits_per_sample=32, sample_type=SampleType.FLOAT)
+YUV420P8 = RawFormat(8, 3, ColorFamily.YUV, SampleType.INTEGER, subsampling_h=1, subsampling_w=1)
+BGRA32 = RawFormat(8, 4, ColorFamily.RGB, SampleType.INTEGER, packed=True, planar=False)
+
+
+def scale(source, format, plane, size, target):
+    buffer = bytearray(format.get_plane_size(plane, target))
+    written = box_scale_into(source, buffer, 0, format, plane, size, target)
+    assert written == len(buffer)
+    return buffer
+
+
+class TestScaledSize(TestCase):
+
+    def test_downscale(self):
+        self.assertEqual(scaled_size(GRAY8, Size(8, 8), (2, 4)), Size(2, 4))
+
+    def test_upscale_rejected(self):
+        with self.assertRaises(ValueError):
+            scaled_size(GRAY8, Size(8, 8), Size(16, 8))
+        with self.assertRaises(ValueError):
+            scaled_size(GRAY8, Size(8, 8), Size(0, 8))
+
+    def test_subsampling(self):
+        with self.assertRaises(ValueError):
+            scaled_size(YUV420P8, Size(8, 8), Size(3, 4))
+        self.assertEqual(scaled_size(YUV420P8, Size(8, 8), Size(4, 2)), Size(4, 2))
+
+
+class TestBoxScale(TestCase):
+
+    def test_integer_factor(self):
+        source = bytes([
+            0, 2, 10, 20,
+            4, 6, 30, 40,
+        ])
+        self.assertEqual(scale(source, GRAY8, 0, Size(4, 2), Size(2, 1)), bytes([3, 25]))
+
+    def test_rounding(self):
+        self.assertEqual(scale(bytes([1, 2]), GRAY8, 0, Size(2, 1), Size(1, 1)), bytes([2]))
+
+    def test_uneven_factor(self):
+        source = bytes([0, 3, 6, 9, 12])
+        # The boxes cover [0, 1), [1, 3) and [3, 5).
+        self.assertEqual(scale(source, GRAY8, 0, Size(5, 1), Size(3, 1)), bytes([0, 5, 11]))
+
+    def test_identity(self):
+        source = bytes(range(12))
+        self.assertEqual(scale(source, GRAY8, 0, Size(4, 3), Size(4, 3)), source)
+
+    def test_16bit(self):
+        source = array('H', [1000, 3000, 65535, 65535]).tobytes()
+        result = array('H', scale(source, GRAY16, 0, Size(2, 2), Size(1, 1)))
+        self.assertEqual(list(result), [33768])
+
+    def test_float(self):
+        source = array('f', [0.0, 1.0, 0.5, 0.5]).tobytes()
+        result = array('f', scale(source, GRAYS, 0, Size(4, 1), Size(2, 1)))
+        self.assertEqual(list(result), [0.5, 0.5])
+
+    def test_subsampled_plane(self):
+        source = bytes([10, 20, 30, 40, 50, 60, 70, 80])
+        # The chroma plane of a 4x4 frame is 2x2.
+        chroma = bytes([10, 20, 30, 50])
+        self.assertEqual(scale(chroma, YUV420P8, 1, Size(4, 4), Size(2, 2)), bytes([28]))
+        self.assertEqual(scale(source, YUV420P8, 0, Size(4, 2), Size(2, 2)), bytes([15, 35, 55, 75]))
+
+    def test_interleaved(self):
+        source = bytes([
+            0, 10, 20, 255,
+            2, 30, 40, 255,
+        ])
+        self.assertEqual(scale(source, BGRA32, 0, Size(2, 1), Size(1, 1)), bytes([1, 20, 30, 255]))
+
+    def test_padded_rows(self):
+        fmt = GRAY8.replace(packed=False)
+        # Rows of a 3 pixel wide unpacked plane are padded to 6 bytes.
+        source = bytes([10, 20, 30, 0, 0, 0, 40, 50, 60, 0, 0, 0])
+        self.assertEqual(scale(source, fmt, 0, Size(3, 2), Size(3, 1)), bytes([25, 35, 45, 0, 0, 0]))
+
+    def test_buffer_too_small(self):
+        with self.assertRaises(BufferError):
+            box_scale_into(bytes(4), bytearray(1), 0, GRAY8, 0, Size(2, 2), Size(2, 1))
+
+    def test_unsupported_format(self):
+        half = GRAY8.replace(bits_per_sample=16, sample_type=SampleType.FLOAT)
+        with self.assertRaises(ValueError):
+            box_scale_into(bytes(4), bytearray(4), 0, half, 0, Size(2, 1), Size(1, 1))
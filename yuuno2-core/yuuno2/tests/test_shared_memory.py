@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Yuuno - IPython + VapourSynth
+# Copyright (C) 2019 StuxCrystal (Roland Netzsch <stuxcrystal@encode.moe>)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from asyncio import wait_for
+from unittest import TestCase, skipUnless
+
+from aiounittest import AsyncTestCase
+
+from yuuno2.clips.remote import ClipServer, RemoteClip
+from yuuno2.format import RGB24, Size, Rect
+from yuuno2.networking.capabilities import Capabilities, SCALED, CROP
+from yuuno2.networking.pipe import pipe_bidi
+from yuuno2.shared_memory import RingAllocator, SharedMemoryArena, SHARED_MEMORY_AVAILABLE
+from yuuno2.tests.test_networking_remote_clip import PlaneMockFrame, GradientMockFrame, SingleFrameMockClip
+from yuuno2.tests.utils import timeout_context
+
+
+class RingAllocatorTest(TestCase):
+
+    def test_allocate_in_order(self):
+        ring = RingAllocator(10)
+        self.assertEqual(ring.allocate(4), 0)
+        self.assertEqual(ring.allocate(4), 4)
+        self.assertIsNone(ring.allocate(4))
+        self.assertEqual(ring.used, 8)
+
+    def test_wraps_around(self):
+        ring = RingAllocator(10)
+        a = ring.allocate(4)
+        ring.allocate(4)
+        ring.free(a)
+        self.assertEqual(ring.allocate(4), 0)
+        self.assertIsNone(ring.allocate(1))
+
+    def test_out_of_order_free(self):
+        ring = RingAllocator(10)
+        a, b = ring.allocate(5), ring.allocate(5)
+
+        # The space of b is only reused once a has been freed as well.
+        ring.free(b)
+        self.assertIsNone(ring.allocate(5))
+        ring.free(a)
+        self.assertEqual(ring.used, 0)
+        self.assertEqual(ring.allocate(10), 0)
+
+    def test_rejects_invalid_sizes(self):
+        ring = RingAllocator(10)
+        self.assertIsNone(ring.allocate(0))
+        self.assertIsNone(ring.allocate(11))
+
+
+@skipUnless(SHARED_MEMORY_AVAILABLE, "shared memory requires Python 3.8")
+class SharedMemoryArenaTest(AsyncTestCase):
+
+    async def test_attach(self):
+        async with SharedMemoryArena(16) as owner:
+            offset = owner.allocate(4)
+            owner.view(offset, 4)[:] = b"abcd"
+
+            async with SharedMemoryArena(name=owner.name) as attached:
+                self.assertEqual(bytes(attached.view(offset, 4)), b"abcd")
+                with self.assertRaises(RuntimeError):
+                    attached.allocate(4)
+
+
+@skipUnless(SHARED_MEMORY_AVAILABLE, "shared memory requires Python 3.8")
+class SharedMemoryTransportTest(AsyncTestCase):
+
+    async def test_render_through_shared_memory(self):
+        c_client, c_server = pipe_bidi()
+        c_client.capabilities = c_server.capabilities = Capabilities(shared_memory=True)
+
+        mock_frame = PlaneMockFrame()
+        mock_clip = SingleFrameMockClip(mock_frame)
+        async with mock_clip, mock_frame:
+            server = ClipServer(mock_clip, c_server, shared_memory_size=1024)
+            client = RemoteClip(c_client)
+
+            async with timeout_context(server, 10), timeout_context(client, 10):
+                async with client[0] as frame:
+                    buffers = [bytearray(8) for _ in range(3)]
+                    await wait_for(frame.render_planes(RGB24, [0, 1, 2], buffers), 5)
+                    self.assertEqual(buffers, [bytearray([1] * 8), bytearray([2] * 8), bytearray([3] * 8)])
+                    self.assertEqual(server._arena.used, 24)
+
+                # The slot is handed back with the next request.
+                self.assertEqual(client.take_released_slots(), [0])
+
+    async def test_slot_release_on_next_request(self):
+        c_client, c_server = pipe_bidi()
+        c_client.capabilities = c_server.capabilities = Capabilities(shared_memory=True)
+
+        mock_frame = PlaneMockFrame()
+        mock_clip = SingleFrameMockClip(mock_frame)
+        async with mock_clip, mock_frame:
+            # Room for a single frame.
+            server = ClipServer(mock_clip, c_server, shared_memory_size=24)
+            client = RemoteClip(c_client)
+
+            async with timeout_context(server, 10), timeout_context(client, 10):
+                for _ in range(3):
+                    async with client[0] as frame:
+                        buffer = bytearray(8)
+                        await wait_for(frame.render_into(buffer, 1, RGB24), 5)
+                        self.assertEqual(buffer, bytearray([2] * 8))
+                        self.assertEqual(server._arena.used, 24)
+
+    async def test_fallback_when_full(self):
+        c_client, c_server = pipe_bidi()
+        c_client.capabilities = c_server.capabilities = Capabilities(shared_memory=True)
+
+        mock_frame = PlaneMockFrame()
+        mock_clip = SingleFrameMockClip(mock_frame)
+        async with mock_clip, mock_frame:
+            server = ClipServer(mock_clip, c_server, shared_memory_size=8)
+            client = RemoteClip(c_client)
+
+            async with timeout_context(server, 10), timeout_context(client, 10):
+                async with client[0] as frame:
+                    buffer = bytearray(8)
+                    await wait_for(frame.render_into(buffer, 2, RGB24), 5)
+                    self.assertEqual(buffer, bytearray([3] * 8))
+                    self.assertEqual(server._arena.used, 0)
+
+    async def test_render_scaled_through_shared_memory(self):
+        c_client, c_server = pipe_bidi()
+        c_client.capabilities = c_server.capabilities = Capabilities(
+            shared_memory=True, features=frozenset({SCALED})
+        )
+
+        mock_frame = GradientMockFrame()
+        mock_clip = SingleFrameMockClip(mock_frame)
+        async with mock_clip, mock_frame:
+            server = ClipServer(mock_clip, c_server, shared_memory_size=1024)
+            client = RemoteClip(c_client)
+
+            async with timeout_context(server, 10), timeout_context(client, 10):
+                async with client[0] as frame:
+                    buffers = [bytearray(8) for _ in range(3)]
+                    await wait_for(frame.render_scaled_planes(RGB24, [0, 1, 2], Size(4, 2), buffers), 5)
+                    self.assertEqual(buffers, [
+                        bytes(p*64 + 16*y + 2*x + 5 for y in range(2) for x in range(4)) for p in range(3)
+                    ])
+
+                    # Only the scaled planes were written into the arena.
+                    self.assertEqual(server._arena.used, 24)
+
+                    buffer = bytearray(8)
+                    await wait_for(frame.render_scaled_into(buffer, 1, RGB24, Size(4, 2)), 5)
+                    self.assertEqual(buffer, buffers[1])
+
+    async def test_render_cropped_through_shared_memory(self):
+        c_client, c_server = pipe_bidi()
+        c_client.capabilities = c_server.capabilities = Capabilities(
+            shared_memory=True, features=frozenset({CROP})
+        )
+
+        mock_frame = GradientMockFrame()
+        mock_clip = SingleFrameMockClip(mock_frame)
+        rect = Rect(2, 1, 3, 2)
+        async with mock_clip, mock_frame:
+            server = ClipServer(mock_clip, c_server, shared_memory_size=1024)
+            client = RemoteClip(c_client)
+
+            async with timeout_context(server, 10), timeout_context(client, 10):
+                async with client[0] as frame:
+                    buffers = [bytearray(6) for _ in range(3)]
+                    await wait_for(frame.render_cropped_planes(RGB24, [0, 1, 2], rect, buffers), 5)
+                    self.assertEqual(buffers, [
+                        bytes(p*64 + y*8 + x for y in range(1, 3) for x in range(2, 5)) for p in range(3)
+                    ])
+
+                    # Only the visible area was written into the arena.
+                    self.assertEqual(server._arena.used, 18)
+
+                    buffer = bytearray(6)
+                    await wait_for(frame.render_cropped_into(buffer, 2, RGB24, rect), 5)
+                    self.assertEqual(buffer, buffers[2])
+
+    async def test_slot_release_of_discarded_render(self):
+        c_client, c_server = pipe_bidi()
+        c_client.capabilities = c_server.capabilities = Capabilities(shared_memory=True)
+
+        mock_frame = PlaneMockFrame()
+        mock_clip = SingleFrameMockClip(mock_frame)
+        async with mock_clip, mock_frame:
+            server = ClipServer(mock_clip, c_server, shared_memory_size=1024)
+            client = RemoteClip(c_client)
+
+            async with timeout_context(server, 10), timeout_context(client, 10):
+                # A render that was already answered when the client cancelled it.
+                client._client._cancelled.add(42)
+                client._client._deliver_response({
+                    "id": 42,
+                    "type": "response",
+                    "result": {"size": [4, 2], "shm": {"name": "arena", "slot": 24, "planes": [[0, 8]]}}
+                }, [])
+
+                self.assertEqual(client.take_released_slots(), [24])
@@ -17,15 +17,17 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import weakref
-from asyncio import ensure_future, wrap_future, gather
-from typing import NoReturn, Mapping, Union, Optional, Awaitable
+from asyncio import ensure_future, wrap_future, gather, shield, Future
+from typing import NoReturn, Mapping, Union, Optional, Awaitable, Dict, Tuple, Callable, MutableMapping, Sequence, List
 
 import vapoursynth as vs
 from vapoursynth import VideoFrame, VideoNode, Format, core
 
 from yuuno2.clips.combined_alpha import AlphaClip
-from yuuno2.format import RawFormat, SampleType, ColorFamily, Size
+from yuuno2.format import RawFormat, SampleType, ColorFamily, Size, Rect
+from yuuno2.cropping import cropped_rect
 from yuuno2.resource_manager import register
+from yuuno2.scaling import scaled_size
 from yuuno2.typings import Buffer, ConfigTypes
 from yuuno2.clip import Frame, Clip
 from yuuno2.script import Script
@@ -41,9 +43,27 @@ DEFAULT_CONFIGURATION = {
 
 
 async def get_configuration(script: Script) -> ConfigMapping:
+    if script in _config_cache:
+        return _config_cache[script]
+
     config = [[k, ensure_future(script.get_config("yuuno2.vs." + k, d))] for k, d in DEFAULT_CONFIGURATION.items()]
     await gather(*(d for k, d in config))
-    return {k: (d.result()) for k, d in config}
+    result = {k: (d.result()) for k, d in config}
+    _config_cache[script] = result
+    return result
+
+
+def invalidate_configuration(script: Script) -> NoReturn:
+    """
+    Drops the cached configuration of the script.
+
+    Call this when a "yuuno2.vs."-key of the script changes.
+    """
+    _config_cache.pop(script, None)
+
+
+def _config_key(config: ConfigMapping) -> Tuple:
+    return tuple(sorted(config.items()))
 
 
 def get_frame_async(node: VideoNode, frame: int) -> Awaitable[VideoFrame]:
@@ -95,13 +115,15 @@ FORMAT_COMPATYUY2 = RawFormat(
 
 
 class VapourSynthFrame(Frame):
-    def __init__(self, script: Script, clip: 'VapourSynthClip', frameno: int):
+    def __init__(self, script: Script, clip: '_VapourSynthClip', frameno: int):
         register(clip, self)
         self.script = script
+        self.source = clip
         self.clip = clip.clip
         self.frameno = frameno
         self._raw_node: Optional[VideoNode] = None
         self._raw_frame: Optional[VideoFrame] = None
+        self._converted: Dict[Tuple[RawFormat, Optional[Size], Optional[Rect]], Future] = {}
 
     @property
     def size(self) -> Size:
@@ -166,53 +188,201 @@ class VapourSynthFrame(Frame):
         if not (0 <= plane < format.num_planes):
             raise IndexError(f"Plane index out of range (0 <= {plane} <= {format.num_planes}")
 
-        config = dict(await get_configuration(self.script))
-        with self.script.inside():
-            _converted = self._convert(format, config)
-            _fut = get_frame_async(_converted, 0)
-        frame: VideoFrame = await _fut
+        frame: VideoFrame = await self._get_converted_frame(format)
         return extract_plane(buffer, offset, frame, plane)
 
-    def _convert(self, format: RawFormat, config) -> VideoNode:
-        if format == self.native_format:
-            return self._raw_node
+    async def render_scaled_into(self, buffer: Buffer, plane: int, format: RawFormat, size: Size, offset: int = 0) -> int:
+        if not (await self.can_render(format)):
+            raise ValueError("Unsupported format.")
+
+        if not (0 <= plane < format.num_planes):
+            raise IndexError(f"Plane index out of range (0 <= {plane} <= {format.num_planes}")
+
+        frame: VideoFrame = await self._get_converted_frame(format, self._scaled_size(format, size))
+        return extract_plane(buffer, offset, frame, plane)
+
+    async def render_scaled_planes(
+            self,
+            format: RawFormat,
+            planes: Sequence[int],
+            size: Size,
+            buffers: Sequence[Buffer]
+    ) -> List[int]:
+        if len(planes) != len(buffers):
+            raise ValueError("Each plane needs exactly one buffer.")
+
+        if not (await self.can_render(format)):
+            raise ValueError("Unsupported format.")
+
+        for plane in planes:
+            if not (0 <= plane < format.num_planes):
+                raise IndexError(f"Plane index out of range (0 <= {plane} <= {format.num_planes}")
+
+        # Resize once and extract all planes from the same frame.
+        frame: VideoFrame = await self._get_converted_frame(format, self._scaled_size(format, size))
+        return [extract_plane(buffer, 0, frame, plane) for plane, buffer in zip(planes, buffers)]
+
+    async def render_cropped_into(self, buffer: Buffer, plane: int, format: RawFormat, rect: Rect, offset: int = 0) -> int:
+        if not (await self.can_render(format)):
+            raise ValueError("Unsupported format.")
+
+        if not (0 <= plane < format.num_planes):
+            raise IndexError(f"Plane index out of range (0 <= {plane} <= {format.num_planes}")
+
+        frame: VideoFrame = await self._get_converted_frame(format, rect=self._cropped_rect(format, rect))
+        return extract_plane(buffer, offset, frame, plane)
+
+    async def render_cropped_planes(
+            self,
+            format: RawFormat,
+            planes: Sequence[int],
+            rect: Rect,
+            buffers: Sequence[Buffer]
+    ) -> List[int]:
+        if len(planes) != len(buffers):
+            raise ValueError("Each plane needs exactly one buffer.")
+
+        if not (await self.can_render(format)):
+            raise ValueError("Unsupported format.")
+
+        for plane in planes:
+            if not (0 <= plane < format.num_planes):
+                raise IndexError(f"Plane index out of range (0 <= {plane} <= {format.num_planes}")
+
+        frame: VideoFrame = await self._get_converted_frame(format, rect=self._cropped_rect(format, rect))
+        return [extract_plane(buffer, 0, frame, plane) for plane, buffer in zip(planes, buffers)]
+
+    def _scaled_size(self, format: RawFormat, size: Size) -> Optional[Size]:
+        if size == self.size:
+            return None
+        return scaled_size(format, self.size, size)
+
+    def _cropped_rect(self, format: RawFormat, rect: Rect) -> Optional[Rect]:
+        if rect == (0, 0, *self.size):
+            return None
+        return cropped_rect(format, self.size, rect)
+
+    async def _get_converted_frame(
+            self,
+            format: RawFormat,
+            size: Optional[Size] = None,
+            rect: Optional[Rect] = None
+    ) -> VideoFrame:
+        """
+        Returns the frame converted to the given format.
+
+        The conversion happens once per format, size and crop. All planes
+        are extracted from the same converted frame. Only the most recent crop
+        is kept, as panning requests a new one for every render.
+        """
+        if format == self.native_format and size is None and rect is None:
+            return self._raw_frame
+
+        key = (format, size, rect)
+        if key not in self._converted:
+            if rect is not None:
+                for other in [k for k in self._converted if k[2] is not None]:
+                    # Renders still waiting for it hold their own reference.
+                    del self._converted[other]
+
+            fut = ensure_future(self._render_converted(format, size, rect))
+            self._converted[key] = fut
+
+            def _drop_failed(f: Future):
+                if (f.cancelled() or f.exception() is not None) and self._converted.get(key) is f:
+                    del self._converted[key]
+            fut.add_done_callback(_drop_failed)
+
+        return await shield(self._converted[key])
+
+    async def _render_converted(
+            self,
+            format: RawFormat,
+            size: Optional[Size] = None,
+            rect: Optional[Rect] = None
+    ) -> VideoFrame:
+        config = dict(await get_configuration(self.script))
+        with self.script.inside():
+            node = self.source.get_converted_node(
+                self._raw_frame.format, format, config,
+                lambda: self._convert(self.clip, format, dict(config), size, rect),
+                size, rect
+            )
+            _fut = get_frame_async(node, self.frameno)
+        return await _fut
+
+    def _convert(
+            self,
+            node: VideoNode,
+            format: RawFormat,
+            config,
+            size: Optional[Size] = None,
+            rect: Optional[Rect] = None
+    ) -> VideoNode:
+        if rect is not None:
+            # Crop first so only the visible area is converted, unless the
+            # rectangle does not fit the subsampling of the source.
+            if self._fits_subsampling(rect):
+                return self._convert(self._crop(node, rect), format, config, size)
+            return self._crop(self._convert(node, format, config, size), rect)
+
+        if format == self.native_format and size is None:
+            return node
 
         namespace, filter = config['resizer'].split(".")
         config['resizer'] = getattr(getattr(core, namespace), filter)
 
-        if not format.planar:
-            return self._convert_compat(format, config)
+        # The first resizer call also scales the frame to the requested size.
+        if size is not None:
+            config['size'] = {'width': size.width, 'height': size.height}
+        else:
+            config['size'] = {}
+
+        if format == self.native_format:
+            return config['resizer'](node, **config['size'])
+        elif not format.planar:
+            return self._convert_compat(node, format, config)
         elif format.family == ColorFamily.RGB:
-            return self._convert_rgb(format, config)
+            return self._convert_rgb(node, format, config)
         elif format.family == ColorFamily.YUV:
-            return self._convert_grey(format, config)
+            return self._convert_grey(node, format, config)
         else:
-            return self._convert_grey(format, config)
+            return self._convert_grey(node, format, config)
+
+    def _fits_subsampling(self, rect: Rect) -> bool:
+        source = self._raw_frame.format
+        mw = (1 << source.subsampling_w) - 1
+        mh = (1 << source.subsampling_h) - 1
+        return not ((rect.x | rect.width) & mw or (rect.y | rect.height) & mh)
 
-    def _convert_compat(self, format: RawFormat, config) -> VideoNode:
+    @staticmethod
+    def _crop(node: VideoNode, rect: Rect) -> VideoNode:
+        return core.std.CropAbs(node, width=rect.width, height=rect.height, left=rect.x, top=rect.y)
+
+    def _convert_compat(self, node: VideoNode, format: RawFormat, config) -> VideoNode:
         if format == FORMAT_COMPATBGR32:
-            clip = self._convert_rgb(format, config)
+            clip = self._convert_rgb(node, format, config)
             return config['resizer'](clip, format=vs.COMPATBGR32)
         else:
-            clip = self._convert_yuv(format, config)
+            clip = self._convert_yuv(node, format, config)
             return config['resizer'](clip, format=vs.COMPATYUY2)
 
-    def _convert_rgb(self, format: RawFormat, config) -> VideoNode:
+    def _convert_rgb(self, node: VideoNode, format: RawFormat, config) -> VideoNode:
         target = core.get_format(vs.RGB24).replace(
             bits_per_sample=format.bits_per_sample,
             sample_type=(vs.INTEGER if format.sample_type == SampleType.INTEGER else vs.FLOAT)
         )
 
-        params = {'format': target}
+        params = {'format': target, **config['size']}
         if self._raw_frame.format.color_family == vs.YUV:
             params.update(
                 matrix_in_s  = config['default_yuv_matrix'],
                 prefer_props = config['override_yuv_matrix']
             )
 
-        return config['resizer'](self._raw_node, **params)
+        return config['resizer'](node, **params)
 
-    def _convert_yuv(self, format: RawFormat, config) -> VideoNode:
+    def _convert_yuv(self, node: VideoNode, format: RawFormat, config) -> VideoNode:
         target = core.get_format(vs.YUV444P8).replace(
             bits_per_sample = format.bits_per_sample,
             subsampling_w   = format.subsampling_w,
@@ -221,6 +391,7 @@ class VapourSynthFrame(Frame):
         )
         params = {
             'format': target,
+            **config['size']
         }
         if self._raw_frame.format.color_family not in (vs.YUV, vs.YCOCG):
             params.update(
@@ -228,33 +399,40 @@ class VapourSynthFrame(Frame):
             )
 
         return config['resizer'](
-            self._raw_node,
+            node,
             **params
         )
 
-    def _convert_grey(self, format: RawFormat, config):
+    def _convert_grey(self, node: VideoNode, format: RawFormat, config):
         target = core.get_format(vs.GRAY8).replace(
             bits_per_sample=format.bits_per_sample,
             sample_type=(vs.INTEGER if format.sample_type == SampleType.INTEGER else vs.FLOAT)
         )
         return config['resizer'](
-            self._raw_node,
+            node,
             format=target,
             matrix_in_s=config['default_yuv_matrix'],
-            prefer_props=config['override_yuv_matrix']
+            prefer_props=config['override_yuv_matrix'],
+            **config['size']
         )
 
     async def get_metadata(self) -> Mapping[str, Union[int, str, bytes]]:
         return self._raw_frame.props
 
     async def _acquire(self) -> NoReturn:
+        # Request the frame from the clip itself instead of a one-frame slice
+        # so VapourSynth's frame cache and prefetching apply.
         with self.script.inside():
-            self._raw_node = self.clip[self.frameno]
-            _fut = get_frame_async(self._raw_node, 0)
+            self._raw_node = self.clip
+            _fut = get_frame_async(self._raw_node, self.frameno)
 
         self._raw_frame = await _fut
 
     async def _release(self) -> NoReturn:
+        converted, self._converted = self._converted, {}
+        for fut in converted.values():
+            fut.cancel()
+
         self._raw_node = None
         self._raw_frame = None
 
@@ -266,6 +444,45 @@ class _VapourSynthClip(Clip):
         self.script = script
         self.clip = clip
 
+        self._nodes: MutableMapping[Tuple, VideoNode] = {}
+        self._nodes_config: Optional[Tuple] = None
+
+    def get_converted_node(
+            self,
+            source: Format,
+            format: RawFormat,
+            config: ConfigMapping,
+            convert: Callable[[], VideoNode],
+            size: Optional[Size] = None,
+            rect: Optional[Rect] = None
+    ) -> VideoNode:
+        """
+        Returns the clip converted to the given format and size.
+
+        The converted nodes are shared by all frames of the clip. They are
+        dropped as soon as the configuration changes. Cropped nodes are not
+        kept, as every position of a zoomed-in view needs its own node.
+
+        :param source:  The format of the frame that is being converted.
+        :param format:  The target format.
+        :param config:  The configuration used for the conversion.
+        :param convert: Builds the node if it is not cached.
+        :param size:    The size the frame is scaled to or None to keep its size.
+        :param rect:    The rectangle cropped out of the frame or None to keep the whole frame.
+        """
+        if rect is not None:
+            return convert()
+
+        config_key = _config_key(config)
+        if config_key != self._nodes_config:
+            self._nodes.clear()
+            self._nodes_config = config_key
+
+        key = (source.id, format, size)
+        if key not in self._nodes:
+            self._nodes[key] = convert()
+        return self._nodes[key]
+
     def __len__(self):
         return len(self.clip)
 
@@ -279,6 +496,7 @@ class _VapourSynthClip(Clip):
         pass
 
     async def _release(self) -> NoReturn:
+        self._nodes.clear()
         self.clip = None
 
 
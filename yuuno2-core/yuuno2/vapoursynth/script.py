@@ -26,7 +26,7 @@ from yuuno2.clip import Clip
 from yuuno2.providers.single import SingleScriptProvider
 from yuuno2.script import Script, NOT_GIVEN
 from yuuno2.typings import ConfigTypes
-from yuuno2.vapoursynth.clip import VapourSynthClip
+from yuuno2.vapoursynth.clip import VapourSynthClip, invalidate_configuration
 
 
 class VapourSynthScript(Script):
@@ -45,6 +45,8 @@ class VapourSynthScript(Script):
     async def set_config(self, key: str, value: ConfigTypes) -> NoReturn:
         await self.ensure_acquired()
         self.config[key] = value
+        if key.startswith('yuuno2.vs.'):
+            invalidate_configuration(self)
         if key.startswith('vs.core.'):
             key = key[len('vs.core.'):]
             with self.inside():
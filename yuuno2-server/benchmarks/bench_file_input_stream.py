@@ -0,0 +1,56 @@
+"""
+Measures the throughput of FileInputStream over an OS pipe.
+
+Usage: python benchmarks/bench_file_input_stream.py [frame-size] [frames]
+"""
+import os
+import sys
+import time
+import asyncio
+from threading import Thread
+
+from yuuno2.networking.base import Message
+from yuuno2.networking.serializer import ByteOutputStream
+from yuuno2server.streams import FileInputStream
+
+
+def _writer(w, frame: bytes, count: int):
+    data = ByteOutputStream.write_message(Message({"frame": 0}, [frame]))
+    with w:
+        for _ in range(count):
+            w.write(data)
+        w.flush()
+
+
+async def measure(chunk_size: int, frame_size: int, count: int) -> float:
+    r, w = os.pipe()
+    r, w = os.fdopen(r, "rb"), os.fdopen(w, "wb")
+
+    writer = Thread(target=_writer, args=(w, bytes(frame_size), count))
+    with r:
+        fis = FileInputStream(r, chunk_size=chunk_size)
+        async with fis:
+            start = time.perf_counter()
+            writer.start()
+            for _ in range(count):
+                await fis.read()
+            end = time.perf_counter()
+    writer.join()
+
+    return (frame_size * count) / (end - start)
+
+
+async def main(frame_size: int, count: int):
+    # Reading byte by byte is so slow that the frame gets capped.
+    small = min(frame_size, 256 * 1024)
+    print(f"chunk_size=1:      {await measure(1, small, 1) / 2**20:10.2f} MiB/s  ({small} bytes, 1 frame)")
+
+    for chunk_size in (4096, FileInputStream.CHUNK_SIZE, 1024 * 1024):
+        tp = await measure(chunk_size, frame_size, count)
+        print(f"chunk_size={chunk_size:<7} {tp / 2**20:10.2f} MiB/s  ({frame_size} bytes, {count} frames)")
+
+
+if __name__ == "__main__":
+    frame_size = int(sys.argv[1]) if len(sys.argv) > 1 else 1920 * 1080 * 3
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    asyncio.run(main(frame_size, count))
@@ -0,0 +1,96 @@
+"""
+Compares the throughput of rendering frames in a subprocess
+with and without the shared memory transport.
+
+Usage: python benchmarks/bench_subprocess_transport.py [width] [height] [frames]
+"""
+import os
+import sys
+import time
+import asyncio
+
+from yuuno2.format import RGB24, Size
+from yuuno2.providers.single import SingleScriptProvider
+from yuuno2.tests.mocks import MockScript, MockClip, MockFrame
+from yuuno2server.subprocesses import SubprocessScript
+
+
+WIDTH = int(os.environ.get("BENCH_WIDTH", 1920))
+HEIGHT = int(os.environ.get("BENCH_HEIGHT", 1080))
+FRAMES = int(os.environ.get("BENCH_FRAMES", 100))
+
+
+class BenchFrame(MockFrame):
+    plane = None
+
+    @property
+    def size(self):
+        return Size(WIDTH, HEIGHT)
+
+    @property
+    def native_format(self):
+        return RGB24
+
+    async def can_render(self, format):
+        return format == RGB24
+
+    async def render_into(self, buffer, plane, format, offset=0):
+        if BenchFrame.plane is None:
+            BenchFrame.plane = bytes(format.get_plane_size(0, self.size))
+        buffer[offset:offset+len(self.plane)] = self.plane
+        return len(self.plane)
+
+
+class BenchClip(MockClip):
+
+    def __len__(self):
+        return FRAMES
+
+    def __getitem__(self, item):
+        return BenchFrame()
+
+
+class BenchScript(MockScript):
+
+    async def retrieve_clips(self):
+        return {"bench": BenchClip()}
+
+
+PROVIDER = lambda: SingleScriptProvider(BenchScript())
+
+
+async def measure(shared_memory: bool) -> float:
+    script = SubprocessScript("bench_subprocess_transport:PROVIDER", shared_memory=shared_memory)
+    async with script:
+        clips = await script.retrieve_clips()
+        async with clips["bench"] as clip:
+            size = Size(WIDTH, HEIGHT)
+            buffers = [bytearray(RGB24.get_plane_size(p, size)) for p in range(RGB24.num_planes)]
+
+            start = time.perf_counter()
+            for frameno in range(len(clip)):
+                async with clip[frameno] as frame:
+                    await frame.render_planes(RGB24, range(RGB24.num_planes), buffers)
+            end = time.perf_counter()
+
+    return sum(map(len, buffers)) * FRAMES / (end - start)
+
+
+async def main():
+    for shared_memory in (False, True):
+        tp = await measure(shared_memory)
+        print(f"shared_memory={shared_memory!s:<5} {tp / 2**20:10.2f} MiB/s  ({WIDTH}x{HEIGHT} RGB24, {FRAMES} frames)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        os.environ["BENCH_WIDTH"], os.environ["BENCH_HEIGHT"], os.environ["BENCH_FRAMES"] = sys.argv[1:4]
+
+    # The runner imports the provider from this file.
+    here = os.path.dirname(os.path.abspath(__file__))
+    os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [here, os.environ.get("PYTHONPATH")]))
+
+    WIDTH = int(os.environ.get("BENCH_WIDTH", 1920))
+    HEIGHT = int(os.environ.get("BENCH_HEIGHT", 1080))
+    FRAMES = int(os.environ.get("BENCH_FRAMES", 100))
+    asyncio.run(main())
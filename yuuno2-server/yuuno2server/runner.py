@@ -99,7 +99,7 @@ if __name__ == "__main__":
     import click
     import importlib
 
-    async def _run_with_provider(provider: ScriptProvider):
+    async def _run_with_provider(provider: ScriptProvider, shared_memory: bool):
         async with provider:
             script = LocalScript(await provider.get())
             async with script:
@@ -108,7 +108,7 @@ if __name__ == "__main__":
 
                 connection = Connection(ingress, egress)
                 async with connection:
-                    rss = RemoteScriptServer(script, connection)
+                    rss = RemoteScriptServer(script, connection, shared_memory=shared_memory)
                     async with rss:
                         print("Server is running...", file=sys.stderr)
                         while not ingress.is_closed():
@@ -117,7 +117,8 @@ if __name__ == "__main__":
     @click.command()
     @click.option("--provider", help="Which script-provider should provide the script?", prompt=False)
     @click.option("--event-loop", default="default", help="The AsyncIO Event-Loop to be used.")
-    def main(provider, event_loop):
+    @click.option("--shared-memory", is_flag=True, help="Offer to pass rendered frames using shared memory.")
+    def main(provider, event_loop, shared_memory):
         print("Initializing subprocess...", file=sys.stderr)
         module, variable = provider.split(":")
         mod = importlib.import_module(module)
@@ -126,7 +127,7 @@ if __name__ == "__main__":
         print("Spinning up event-loop", file=sys.stderr)
         install_event_loop(event_loop)
         loop = asyncio.get_event_loop()
-        aiorun.run(_run_with_provider(sp), loop=loop)
+        aiorun.run(_run_with_provider(sp, shared_memory), loop=loop)
 
         print("Exiting...", file=sys.stderr)
 
@@ -0,0 +1,154 @@
+import asyncio
+import os
+import sys
+from asyncio import AbstractServer, Task, get_running_loop, gather
+from typing import Optional, NoReturn, Set
+
+from yuuno2.networking.asyncio import YuunoProtocol, protocol_connection
+from yuuno2.providers.remote.server import RemoteScriptProviderServer
+from yuuno2.resource_manager import Resource, register
+from yuuno2.script import ScriptProvider
+
+
+class _ServerProtocol(YuunoProtocol):
+
+    def __init__(self, server: 'SocketServer'):
+        super().__init__()
+        self.server = server
+
+    def connection_made(self, transport) -> None:
+        super().connection_made(transport)
+        self.server._connection_made(self)
+
+
+class SocketServer(Resource):
+    """
+    Serves a script provider on a unix domain socket or a TCP socket.
+
+    Every client gets its own RemoteScriptProviderServer. All of them share
+    the provider, so several clients can use the same running process.
+    """
+
+    def __init__(
+            self,
+            provider: ScriptProvider,
+            *,
+            path: Optional[str] = None,
+            host: Optional[str] = None,
+            port: Optional[int] = None,
+            backlog: int = 100,
+            max_connections: Optional[int] = None
+    ):
+        """
+        :param provider:        The provider to serve.
+        :param path:            Listen on the unix domain socket with this path.
+        :param host:            Listen on a TCP socket bound to this host.
+        :param port:            The port of the TCP socket. Use 0 to pick a free port.
+        :param backlog:         How many connections the operating system queues before they are accepted.
+        :param max_connections: How many clients are served at the same time.
+                                Connections beyond this limit are closed immediately.
+        """
+        if (path is None) == (port is None):
+            raise ValueError("Pass either a path or a port.")
+
+        self.provider = provider
+        self.path = path
+        self.host = host
+        self.port = port
+        self.backlog = backlog
+        self.max_connections = max_connections
+
+        self.rejected = 0
+
+        self._server: Optional[AbstractServer] = None
+        self._clients: Set[Task] = set()
+
+    @property
+    def connections(self) -> int:
+        """
+        :return: The number of clients that are currently served.
+        """
+        return len(self._clients)
+
+    def _connection_made(self, protocol: YuunoProtocol) -> None:
+        if self.max_connections is not None and len(self._clients) >= self.max_connections:
+            self.rejected += 1
+            protocol.transport.close()
+            return
+
+        task = get_running_loop().create_task(self._serve(protocol))
+        self._clients.add(task)
+        task.add_done_callback(self._clients.discard)
+
+    async def _serve(self, protocol: YuunoProtocol) -> None:
+        connection = protocol_connection(protocol)
+        try:
+            async with connection:
+                server = RemoteScriptProviderServer(self.provider, connection)
+                async with server:
+                    await protocol._closed.wait()
+        finally:
+            protocol.transport.close()
+
+    async def _acquire(self) -> NoReturn:
+        # Keep the provider alive between connections.
+        await self.provider.acquire()
+        register(self.provider, self)
+
+        loop = get_running_loop()
+        factory = lambda: _ServerProtocol(self)
+        if self.path is not None:
+            self._server = await loop.create_unix_server(factory, self.path, backlog=self.backlog)
+        else:
+            self._server = await loop.create_server(factory, self.host, self.port, backlog=self.backlog)
+            self.port = self._server.sockets[0].getsockname()[1]
+
+    async def _release(self) -> NoReturn:
+        self._server.close()
+        await self._server.wait_closed()
+
+        clients, self._clients = self._clients, set()
+        for task in clients:
+            task.cancel()
+        await gather(*clients, return_exceptions=True)
+
+        if self.path is not None and os.path.exists(self.path):
+            os.unlink(self.path)
+
+        await self.provider.release(force=False)
+
+
+if __name__ == "__main__":
+    import aiorun
+    import click
+    import importlib
+
+    from yuuno2server.loops import install_event_loop
+
+    async def _serve_forever(server: SocketServer):
+        async with server:
+            where = server.path if server.path is not None else f"{server.host}:{server.port}"
+            print(f"Listening on {where}...", file=sys.stderr)
+            await asyncio.Event().wait()
+
+    @click.command()
+    @click.option("--provider", help="Which script-provider should provide the script?", required=True)
+    @click.option("--event-loop", default="default", help="The AsyncIO Event-Loop to be used.")
+    @click.option("--unix", "path", default=None, help="Listen on a unix domain socket at this path.")
+    @click.option("--host", default="127.0.0.1", help="The host to bind the TCP socket to.")
+    @click.option("--port", default=None, type=int, help="Listen on this TCP port.")
+    @click.option("--backlog", default=100, help="How many pending connections are queued.")
+    @click.option("--max-connections", default=None, type=int, help="How many clients are served at once.")
+    def main(provider, event_loop, path, host, port, backlog, max_connections):
+        module, variable = provider.split(":")
+        mod = importlib.import_module(module)
+        sp = getattr(mod, variable)()
+
+        install_event_loop(event_loop)
+        loop = asyncio.get_event_loop()
+        server = SocketServer(
+            sp, path=path, host=host, port=port, backlog=backlog, max_connections=max_connections
+        )
+        aiorun.run(_serve_forever(server), loop=loop)
+
+    main()
@@ -1,13 +1,15 @@
 import asyncio
 import concurrent
+import os
 import sys
 from threading import Thread, Event, Lock
 from asyncio import get_running_loop, sleep, AbstractEventLoop, Event as AEvent
 from concurrent.futures import ThreadPoolExecutor
-from typing import NoReturn, Optional
+from typing import NoReturn, Optional, Sequence
 
 from yuuno2.asyncutils import dynamic_timeout
 from yuuno2.networking.base import Message
+from yuuno2.typings import Buffer
 
 if sys.platform.startswith("win"):
     import ctypes
@@ -21,6 +23,10 @@ from yuuno2.networking.serializer import ByteInputStream, ByteOutputStream
 
 io_pool = ThreadPoolExecutor(max_workers=10)
 
+# The maximal number of buffers passed to a single writev-call.
+# (This is the limit on Linux and macOS.)
+IOV_MAX = 1024
+
 
 class FileOutputStream(ByteOutputStream):
 
@@ -37,6 +43,34 @@ class FileOutputStream(ByteOutputStream):
             self.fobj.write(data)
             self.fobj.flush()
 
+    def _send_parts(self, parts: Sequence[Buffer]) -> None:
+        with self.io_lock:
+            if self.fobj.closed:
+                return
+
+            try:
+                fd = self.fobj.fileno()
+            except (AttributeError, OSError):
+                fd = None
+
+            if fd is None or not hasattr(os, "writev"):
+                for part in parts:
+                    self.fobj.write(part)
+                self.fobj.flush()
+                return
+
+            # Make sure nothing is left in the buffer of the file object
+            # as we bypass it.
+            self.fobj.flush()
+
+            views = [memoryview(part).cast("B") for part in parts]
+            while views:
+                written = os.writev(fd, views[:IOV_MAX])
+                while views and written >= len(views[0]):
+                    written -= len(views.pop(0))
+                if written:
+                    views[0] = views[0][written:]
+
     def _close(self):
         with self.io_lock:
             self.fobj.close()
@@ -44,6 +78,9 @@ class FileOutputStream(ByteOutputStream):
     async def send(self, data: bytes) -> None:
         await get_running_loop().run_in_executor(io_pool, self._send, data)
 
+    async def send_parts(self, parts: Sequence[Buffer]) -> None:
+        await get_running_loop().run_in_executor(io_pool, self._send_parts, parts)
+
     async def close(self) -> NoReturn:
         await get_running_loop().run_in_executor(io_pool, self._close)
 
@@ -55,9 +92,20 @@ class FileOutputStream(ByteOutputStream):
 
 
 class FileInputStream(ByteInputStream):
+    """
+    Reads messages from a binary file object in a background thread.
 
-    def __init__(self, fobj):
+    The reader feeds the parser with whatever is currently available on the
+    file, up to ``chunk_size`` bytes per read. A chunk size of one restores
+    the old byte-by-byte behaviour. With ``direct_blobs`` the blobs of the
+    messages are memoryviews of buffers that are filled exactly once.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, fobj, chunk_size: Optional[int] = None, maxsize: int = 50, *, direct_blobs: bool = False):
         self.fobj = fobj
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
         self.reader = Thread(target=self._readloop, args=(get_running_loop(),))
         self._closed = AEvent()
         self._queue_open = Event()
@@ -65,7 +113,7 @@ class FileInputStream(ByteInputStream):
 
         self._cancel_current_io_op = None
 
-        super().__init__()
+        super().__init__(maxsize=maxsize, direct_blobs=direct_blobs)
 
     def queue_active(self):
         self._queue_open.set()
@@ -100,7 +148,7 @@ class FileInputStream(ByteInputStream):
             self._cancel_current_io_op = _cancel_token
 
             try:
-                return self.fobj.read(1)
+                return self._read_available()
             except Exception as e:
                 if not (_cancel_token[1] or self._closed.is_set()):
                     raise e
@@ -121,13 +169,19 @@ class FileInputStream(ByteInputStream):
             _cancel_atom = [Event()]
             self._cancel_current_io_op = _cancel_atom
             while not _cancel_atom[0].is_set():
-                r, _, _ = select.select([self.fobj], [], [], timeout=0)
-                if not r:
-                    _cancel_atom[0].wait(.1)
-                    continue
+                try:
+                    r, _, _ = select.select([self.fobj], [], [], .1)
+                    if not r:
+                        continue
 
-                self._cancel_current_io_op = None
-                return self.fobj.read(1)
+                    self._cancel_current_io_op = None
+                    return self._read_available()
+
+                except (OSError, ValueError):
+                    # The file has been closed while we were waiting.
+                    if _cancel_atom[0].is_set() or self.fobj.closed:
+                        return None
+                    raise
 
         def _cancel_read(self):
             if self._cancel_current_io_op is None:
@@ -135,6 +189,13 @@ class FileInputStream(ByteInputStream):
 
             self._cancel_current_io_op[0].set()
 
+    def _read_available(self) -> bytes:
+        # read1 performs at most one system call and returns what is
+        # available right now instead of waiting for the full chunk.
+        if hasattr(self.fobj, "read1"):
+            return self.fobj.read1(self.chunk_size)
+        return self.fobj.read(self.chunk_size)
+
     def _readloop(self, loop: AbstractEventLoop):
         while not (self.fobj.closed or self._closed.is_set()):
             # Backpressure protocol.
@@ -10,7 +10,7 @@ from yuuno2.networking.base import Connection
 from yuuno2.providers.remote.client import RemoteScript
 from yuuno2.resource_manager import register
 from yuuno2.script import Script, NOT_GIVEN
-from yuuno2.typings import ConfigTypes
+from yuuno2.typings import ConfigTypes, Buffer
 
 
 class SubprocessConnection(SubprocessProtocol, YuunoBaseProtocol):
@@ -19,6 +19,9 @@ class SubprocessConnection(SubprocessProtocol, YuunoBaseProtocol):
     """
     transport: SubprocessTransport
 
+    # Rendered frames arrive through this connection.
+    DIRECT_BLOBS = True
+
     def __init__(self):
         self._finishing = False
         super().__init__()
@@ -31,6 +34,9 @@ class SubprocessConnection(SubprocessProtocol, YuunoBaseProtocol):
         When the connection is closed, connection_lost() is called.
         """
         self.transport = transport
+
+        # See YuunoProtocol.connection_made
+        transport.get_pipe_transport(0).set_write_buffer_limits(0)
         self.continue_writing()
 
     def connection_lost(self, exc):
@@ -120,16 +126,35 @@ class SubprocessConnection(SubprocessProtocol, YuunoBaseProtocol):
     def write_message_data(self, data: bytes):
         self.transport.get_pipe_transport(0).write(data)
 
+    def write_message_parts(self, parts: Sequence[Buffer]):
+        self.transport.get_pipe_transport(0).writelines(parts)
 
-class SubprocessScript(Script):
 
-    def __init__(self, provider: str, event_loop: str = "default", *, loop: AbstractEventLoop=None):
+class SubprocessScript(Script):
+    #: Seconds to wait for the child to exit after its stdin has been closed.
+    EXIT_TIMEOUT = 5
+
+    def __init__(
+            self,
+            provider: str,
+            event_loop: str = "default",
+            *,
+            loop: AbstractEventLoop=None,
+            shared_memory: bool = False
+    ):
+        """
+        :param provider:      The script provider in the form "module:variable".
+        :param event_loop:    The event loop the subprocess should use.
+        :param shared_memory: Let the subprocess pass rendered planes using shared memory
+                              instead of sending them through its stdout.
+        """
         if loop is None:
             loop = get_running_loop()
         self.loop = loop
 
         self.provider = provider
         self.event_loop = event_loop
+        self.shared_memory = shared_memory
         self._script: Optional[RemoteScript] = None
 
     def activate(self) -> NoReturn:
@@ -159,10 +184,12 @@ class SubprocessScript(Script):
         return await self._script.retrieve_clips()
 
     async def _acquire(self) -> NoReturn:
-        self._transport, self._connection = await self.create_subprocess(self.provider, self.event_loop, loop=self.loop)
+        self._transport, self._connection = await self.create_subprocess(
+            self.provider, self.event_loop, loop=self.loop, shared_memory=self.shared_memory
+        )
         await self._connection.acquire()
         register(self._connection, self)
-        self._script = RemoteScript(self._connection)
+        self._script = RemoteScript(self._connection, shared_memory=self.shared_memory)
 
         await self._script.acquire()
         register(self._script, self)
@@ -174,15 +201,23 @@ class SubprocessScript(Script):
 
         await self._script.release(force=True)
         await self._connection.release(force=True)
+
+        # Give the child a moment to exit on its own before it is killed.
+        for _ in range(self.EXIT_TIMEOUT * 10):
+            if self._transport.get_returncode() is not None:
+                break
+            await asyncio.sleep(0.1)
         self._transport.close()
 
     @staticmethod
-    async def create_subprocess(provider: str, event_loop: str="default", *, loop=None):
+    async def create_subprocess(provider: str, event_loop: str="default", *, loop=None, shared_memory: bool = False):
         if loop is None:
             loop = get_running_loop()
 
         path = os.path.join(os.path.dirname(__file__), "runner.py")
         call = [sys.executable, path, "--provider", provider, "--event-loop", event_loop]
+        if shared_memory:
+            call.append("--shared-memory")
 
         yuuno_protocol: SubprocessConnection
 
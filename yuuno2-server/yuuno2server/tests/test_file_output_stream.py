@@ -26,6 +26,25 @@ class TestFileOutputStream(AsyncTestCase):
                 await wait_for(fos.send(b"abc"), 5)
                 self.assertEqual(r.read(3), b"abc")
 
+    async def test_pipe_send_parts(self):
+        r, w = pipe()
+        with r, w:
+            fos = FileOutputStream(w)
+            async with fos:
+                blob = bytearray(b"def")
+                await wait_for(fos.send_parts([b"abc", memoryview(blob)[1:], b""]), 5)
+                self.assertEqual(r.read(5), b"abcef")
+
+    async def test_pipe_write_message(self):
+        r, w = pipe()
+        with r, w:
+            fos = FileOutputStream(w)
+            async with fos:
+                msg = Message({"test": id(self)}, [b"abc", memoryview(b"def")])
+                raw = ByteOutputStream.write_message(msg)
+                await wait_for(fos.write(msg), 5)
+                self.assertEqual(r.read(len(raw)), raw)
+
     async def test_pipe_close(self):
         r, w = pipe()
         with r, w:
@@ -55,3 +74,25 @@ class TestFileInputStream(AsyncTestCase):
             async with timeout_context(fis, 5):
                 Timer(1, lambda: w.close()).start()
                 self.assertEqual(await wait_for(fis.read(), 5), None)
+
+    async def test_pipe_read_chunked(self):
+        r, w = pipe()
+        with r, w:
+            fis = FileInputStream(r, chunk_size=7)
+            async with timeout_context(fis, 5):
+                msgs = [Message({"test": i}, [bytes(range(256)) * 4]) for i in range(3)]
+                w.write(b"".join(ByteOutputStream.write_message(msg) for msg in msgs))
+                w.flush()
+                for msg in msgs:
+                    self.assertEqual(await wait_for(fis.read(), 5), msg)
+
+    async def test_pipe_read_backpressure(self):
+        r, w = pipe()
+        with r, w:
+            fis = FileInputStream(r, maxsize=1)
+            async with timeout_context(fis, 5):
+                msgs = [Message({"test": i}, []) for i in range(5)]
+                w.write(b"".join(ByteOutputStream.write_message(msg) for msg in msgs))
+                w.flush()
+                for msg in msgs:
+                    self.assertEqual(await wait_for(fis.read(), 5), msg)
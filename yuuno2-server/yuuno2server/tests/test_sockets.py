@@ -0,0 +1,67 @@
+import os
+import tempfile
+from asyncio import wait_for, open_unix_connection, sleep
+
+from aiounittest import AsyncTestCase
+
+from yuuno2.networking.asyncio import connect_unix, connect_tcp
+from yuuno2.providers.remote.client import RemoteScriptProvider
+from yuuno2.tests.mocks import MockScriptProvider
+from yuuno2.tests.utils import timeout_context
+
+from yuuno2server.sockets import SocketServer
+
+
+class TestSocketServer(AsyncTestCase):
+
+    async def _check_client(self, connection, value):
+        provider = RemoteScriptProvider(connection)
+        async with timeout_context(provider, 10):
+            script = await provider.get(client=value)
+            async with timeout_context(script, 10):
+                self.assertEqual(await wait_for(script.get_config("client"), 5), value)
+
+    async def test_unix_socket(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "yuuno.sock")
+            server = SocketServer(MockScriptProvider(), path=path)
+            async with server:
+                # Several clients at the same time.
+                c1 = await wait_for(connect_unix(path), 5)
+                c2 = await wait_for(connect_unix(path), 5)
+                await self._check_client(c1, 1)
+                await self._check_client(c2, 2)
+
+            self.assertFalse(os.path.exists(path))
+
+    async def test_tcp_socket(self):
+        server = SocketServer(MockScriptProvider(), host="127.0.0.1", port=0)
+        async with server:
+            self.assertNotEqual(server.port, 0)
+            await self._check_client(await wait_for(connect_tcp("127.0.0.1", server.port), 5), 1)
+
+    async def test_max_connections(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "yuuno.sock")
+            server = SocketServer(MockScriptProvider(), path=path, max_connections=1)
+            async with server:
+                r1, w1 = await open_unix_connection(path)
+                r2, w2 = await open_unix_connection(path)
+                try:
+                    # The second connection is closed right away.
+                    self.assertEqual(await wait_for(r2.read(), 5), b"")
+                    self.assertEqual(server.rejected, 1)
+                    self.assertEqual(server.connections, 1)
+                finally:
+                    w1.close()
+                    w2.close()
+
+                for _ in range(50):
+                    if server.connections == 0:
+                        break
+                    await sleep(0.1)
+                self.assertEqual(server.connections, 0)
+
+    def test_needs_address(self):
+        with self.assertRaises(ValueError):
+            SocketServer(MockScriptProvider())
@@ -1,18 +1,35 @@
 import asyncio
 import os
 import sys
-from asyncio import ProactorEventLoop, wait_for
+from asyncio import wait_for
 
 from aiounittest import AsyncTestCase
 
+from yuuno2.format import RGB24
 from yuuno2.providers.remote.client import RemoteScript
 from yuuno2.providers.single import SingleScriptProvider
-from yuuno2.tests.mocks import MockScript
+from yuuno2.tests.mocks import MockScript, MockClip
+from yuuno2.tests.test_networking_remote_clip import PlaneMockFrame
 from yuuno2server.subprocesses import SubprocessScript
 
 MOCK_PROVIDER = lambda: SingleScriptProvider(MockScript({"test": f"{os.getppid()}"}))
 
 
+class PlaneMockClip(MockClip):
+
+    def __getitem__(self, item):
+        return PlaneMockFrame()
+
+
+class FrameMockScript(MockScript):
+
+    async def retrieve_clips(self):
+        return {"test": PlaneMockClip()}
+
+
+FRAME_PROVIDER = lambda: SingleScriptProvider(FrameMockScript())
+
+
 if os.name == 'posix':
     def pid_exists(pid):
         """Check whether pid exists in the current process table."""
@@ -43,6 +60,7 @@ class TestSubprocessScript(AsyncTestCase):
 
     if sys.platform.startswith("win"):
         def get_event_loop(self):
+            from asyncio import ProactorEventLoop
             return ProactorEventLoop()
 
     async def test_make_subprocess(self):
@@ -66,7 +84,27 @@ class TestSubprocessScript(AsyncTestCase):
     async def test_subprocess_script(self):
         subprocess = SubprocessScript("yuuno2server.tests.test_subprocess:MOCK_PROVIDER")
         async with subprocess:
-            pid = await wait_for(subprocess.get_config("test"), 5)
-            self.assertEqual(str(os.getpid()), pid)
+            ppid = await wait_for(subprocess.get_config("test"), 5)
+            self.assertEqual(str(os.getpid()), ppid)
+            pid = await wait_for(subprocess.get_config("subprocess.pid"), 5)
 
         self.assertFalse(pid_exists(pid))
+
+    async def test_subprocess_shared_memory(self):
+        for shared_memory in (False, True):
+            with self.subTest(shared_memory=shared_memory):
+                subprocess = SubprocessScript(
+                    "yuuno2server.tests.test_subprocess:FRAME_PROVIDER", shared_memory=shared_memory
+                )
+                async with subprocess:
+                    clips = await wait_for(subprocess.retrieve_clips(), 5)
+                    async with clips["test"] as clip:
+                        self.assertEqual(clip.shared_memory, shared_memory)
+                        for _ in range(3):
+                            async with clip[0] as frame:
+                                buffers = [bytearray(8) for _ in range(3)]
+                                await wait_for(frame.render_planes(RGB24, [0, 1, 2], buffers), 5)
+                                self.assertEqual(
+                                    buffers,
+                                    [bytearray([1] * 8), bytearray([2] * 8), bytearray([3] * 8)]
+                                )